@@ -1,168 +1,136 @@
+import argparse
 import pandas as pd
 import numpy as np
 import os
 import joblib
 import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, Dropout
-from sklearn.preprocessing import MinMaxScaler
 from tensorflow.keras.models import load_model
-from sklearn.metrics import mean_squared_error
-import matplotlib.pyplot as plt
-from sklearn.model_selection import train_test_split
 import random
+from crime_data import load_split, PREDICTIONS_DIR, SCRIPTS_DIR
+from artefact_cache import ArtefactCache, artefact_key
+from ann_training import ANN_PARAMS, BUDGET_MINUTES, CHECKPOINT_DIR, CHECKPOINT_EVERY, PATIENCE, build_ann, prepare_training_data, train_budgeted
+from evaluation import print_metrics
+from plot_renderer import DIAGNOSTIC_PLOTS_DIR, curve_figure, diagnostic_figures, render_figures
+from run_log import start_run
+
+# Timing and peak memory of every stage, written to the run log when the script exits
+run = start_run()
+
+# Choosing between the fixed 1000 epochs and the budgeted, resumable training mode
+parser = argparse.ArgumentParser(description='ANN crime prediction model')
+parser.add_argument('--budgeted', action='store_true', help='Stop on a validation plateau or a wall-clock budget and checkpoint for resuming')
+parser.add_argument('--budget-minutes', type=float, default=BUDGET_MINUTES)
+parser.add_argument('--patience', type=int, default=PATIENCE, help='Epochs without a better validation loss before stopping')
+parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY, help='Epochs between checkpoints')
+parser.add_argument('--restart', action='store_true', help='Ignore an interrupted run\'s checkpoint and start afresh')
+args = parser.parse_args()
 
 # Set random seeds for reproducibility
-random.seed(74)
-np.random.seed(74)
-tf.random.set_seed(74)
+SEED = 74
+random.seed(SEED)
+np.random.seed(SEED)
+tf.random.set_seed(SEED)
 
 # Ensure TensorFlow uses deterministic operations
 os.environ['TF_DETERMINISTIC_OPS'] = '1'
 
-# Load the data
-data = pd.read_csv('C:\\Users\\luigi\\Desktop\\Third Year\\Thesis\\Artefact\\Data\\train_set.csv', header=0)
-data.columns = ['Area', 'Year', 'Month', 'Crime_Category', 'Total_Crimes']
+run.begin('load')
+# Load the data without the 'Year' column
+data = load_split('train', drop_year=True, columns=['Area', 'Month', 'Crime_Category', 'Total_Crimes'])
 
-# Drop the 'Year' column 
-data.drop('Year', axis=1, inplace=True)
+# Load the test set, which is preprocessed similar to the training set
+test_data = load_split('test', drop_year=True, columns=['Area', 'Month', 'Crime_Category', 'Total_Crimes'])
 
-# Preprocess the data using MinMaxScaler
-scaler = MinMaxScaler(feature_range=(0, 1))
-scaled_data = scaler.fit_transform(data[['Month', 'Area', 'Crime_Category', 'Total_Crimes']])
-scaled_df = pd.DataFrame(scaled_data, columns=['Month', 'Area', 'Crime_Category', 'Total_Crimes'])
-
-# Sorting data in a stable manner to prevent any randomness due to equivalent sorting keys
-scaled_df.sort_values(by=['Month', 'Crime_Category', 'Area'], inplace=True, kind='mergesort')
-
-# Save the scaler to a file for later use
-directory = r'C:\Users\luigi\Desktop\Third Year\Thesis\Artefact\Scripts\ANN'
-if not os.path.exists(directory):
-    os.makedirs(directory)
+directory = os.path.join(SCRIPTS_DIR, 'ANN')
 scaler_path = os.path.join(directory, 'scaler.gz')
-joblib.dump(scaler, scaler_path)
-
-# Prepare the input and output for the ANN
-X = scaled_df[['Month', 'Area', 'Crime_Category']]
-y = scaled_df['Total_Crimes']
-
-# Split data into training and validation sets
-X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=1)
-
-# Define and compile the ANN model
-model = Sequential()
-model.add(Dense(118, activation='relu', input_shape=(X_train.shape[1],)))
-model.add(Dropout(0.04))
-model.add(Dense(86, activation='relu'))
-model.add(Dropout(0.03))
-model.add(Dense(54, activation='relu'))
-model.add(Dropout(0.5))
-model.add(Dense(1))
-optimizer = tf.keras.optimizers.Adam(learning_rate=0.0002)
-model.compile(loss='mae', optimizer=optimizer)
-
-# Fit the model 
-history = model.fit(X_train, y_train, epochs=1000, batch_size=29, validation_data=(X_val, y_val), verbose=1)
-
-# Save the trained model to a file
 model_path = os.path.join(directory, 'ann_model.h5')
-model.save(model_path)
-
-# Load the test set and preprocess it similar to the training set
-test_data = pd.read_csv('C:\\Users\\luigi\\Desktop\\Third Year\\Thesis\\Artefact\\Data\\test_set.csv', header=0)
-test_data.columns = ['Area', 'Year', 'Month', 'Crime_Category', 'Total_Crimes']
-test_data.drop('Year', axis=1, inplace=True)
-test_data = test_data.apply(pd.to_numeric, errors='coerce')
-test_data.dropna(inplace=True)
-
-# Load the scaler and transform the test data
-scaler = joblib.load(scaler_path)
-test_scaled = scaler.transform(test_data[['Month', 'Area', 'Crime_Category', 'Total_Crimes']])
-test_X = pd.DataFrame(test_scaled, columns=['Month', 'Area', 'Crime_Category', 'Total_Crimes'])[['Month', 'Area', 'Crime_Category']]
-
-# Load the trained model and make predictions on the test set
-model = load_model(model_path)
-test_predictions = model.predict(test_X)
 
-# Inverse transform the predicted values to the original scale
-dummy_features = np.zeros((test_predictions.shape[0], test_scaled.shape[1] - 1))
-full_test_predictions = np.concatenate([dummy_features, test_predictions], axis=1)
-final_predictions = scaler.inverse_transform(full_test_predictions)[:, -1]
+run.begin('cache_lookup')
+# Reusing the model, scaler and predictions of an earlier run with the same data, preprocessing and hyperparameters
+cache = ArtefactCache()
+preprocessing = ['MinMaxScaler(0, 1)', 'sort Month, Crime_Category, Area', 'train_test_split(0.2, random_state=1)']
+training = {'budget_minutes': args.budget_minutes, 'patience': args.patience} if args.budgeted else 'fixed epochs'
+key = artefact_key('ann', data, test_data, preprocessing, ANN_PARAMS, SEED, training)
+entry = cache.lookup(key)
+
+if entry is None:
+    run.begin('scale')
+    # Preprocess the data using MinMaxScaler, sort it in a stable manner and split it into training and validation sets
+    scaler, X_train, X_val, y_train, y_val = prepare_training_data(data)
+
+    # Save the scaler to a file for later use
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    joblib.dump(scaler, scaler_path)
+
+    run.begin('fit')
+    if args.budgeted:
+        # Streaming input pipeline, stopping on a validation plateau or the wall-clock budget, checkpointing
+        # to Scripts/ANN/checkpoints and resuming an interrupted run with the same key
+        model, state = train_budgeted(ANN_PARAMS, X_train, y_train, X_val, y_val, CHECKPOINT_DIR, run_key=key,
+                                      budget_seconds=args.budget_minutes * 60, patience=args.patience,
+                                      checkpoint_every=args.checkpoint_every, resume=not args.restart, seed=SEED)
+        history = state['history']
+        print(f"Stopped after {state['epoch']} epochs ({state['stopped']}), best validation loss {state['best_val_loss']:.5f} at epoch {state['best_epoch']}")
+    else:
+        # Define and compile the ANN model
+        model = build_ann(ANN_PARAMS, X_train.shape[1])
+
+        # Fit the model 
+        history = model.fit(X_train, y_train, epochs=ANN_PARAMS['epochs'], batch_size=ANN_PARAMS['batch_size'],
+                            validation_data=(X_val, y_val), verbose=1)
+        history = {name: [float(value) for value in values] for name, values in history.history.items()}
+
+    run.begin('save_model')
+    # Save the trained model to a file
+    model.save(model_path)
+
+    run.begin('scale')
+    # Load the scaler and transform the test data
+    scaler = joblib.load(scaler_path)
+    test_scaled = scaler.transform(test_data[['Month', 'Area', 'Crime_Category', 'Total_Crimes']])
+    test_X = pd.DataFrame(test_scaled, columns=['Month', 'Area', 'Crime_Category', 'Total_Crimes'])[['Month', 'Area', 'Crime_Category']]
+
+    run.begin('predict')
+    # Load the trained model and make predictions on the test set
+    model = load_model(model_path)
+    test_predictions = model.predict(test_X)
+
+    run.begin('inverse_transform')
+    # Inverse transform the predicted values to the original scale
+    dummy_features = np.zeros((test_predictions.shape[0], test_scaled.shape[1] - 1))
+    full_test_predictions = np.concatenate([dummy_features, test_predictions], axis=1)
+    final_predictions = scaler.inverse_transform(full_test_predictions)[:, -1]
+
+    run.begin('cache_store')
+    cache.store(key, files={'ann_model.h5': model_path, 'scaler.gz': scaler_path},
+                arrays={'predictions_test': final_predictions},
+                meta={'model': 'ann', 'params': ANN_PARAMS, 'history': history})
+else:
+    # Putting the cached model and scaler back where the other scripts load them from
+    print(f"Reusing the ANN trained in an earlier run ({entry})")
+    cache.restore(entry, {'ann_model.h5': model_path, 'scaler.gz': scaler_path})
+    final_predictions = cache.load_array(entry, 'predictions_test')
+    history = cache.meta(entry)['history']
 
 # Add the predicted values to the test data
 test_data['Predicted_Crimes'] = final_predictions
 print(test_data[['Total_Crimes', 'Predicted_Crimes']])
 
+run.begin('write')
 # Save the predictions as a CSV
-test_data.to_csv('C:\\Users\\luigi\\Desktop\\Third Year\\Thesis\\Artefact\\Data\\Model Predictions\\ANN_predictions.csv', index=False)
-
-# Calculate Mean Squared Error (MSE)
-mse = mean_squared_error(test_data['Total_Crimes'], test_data['Predicted_Crimes'])
-
-# Calculate Root Mean Squared Error (RMSE)
-rmse = np.sqrt(mse)
-
-# Calculate Mean Absolute Error (MAE)
-mae = np.mean(np.abs(test_data['Total_Crimes'] - test_data['Predicted_Crimes']))
-
-# Calculate R-squared (R2)
-ss_res = np.sum((test_data['Total_Crimes'] - test_data['Predicted_Crimes'])**2)
-ss_tot = np.sum((test_data['Total_Crimes'] - np.mean(test_data['Total_Crimes']))**2)
-r2 = 1 - (ss_res / ss_tot)
-
-# Calculate Pearson correlation coefficient (R)
-corr_coef = np.corrcoef(test_data['Total_Crimes'], test_data['Predicted_Crimes'])[0, 1]
-
-# Print error metrics
-print("Mean Squared Error (MSE):", mse)
-print("Root Mean Squared Error (RMSE):", rmse)
-print("Mean Absolute Error (MAE):", mae)
-print("R-squared (R2):", r2)
-print("Pearson correlation coefficient (R):", corr_coef)
-
-# Plotting training and validation loss
-plt.figure(figsize=(10, 5))
-plt.plot(history.history['loss'], color='blue', label='Training Loss')
-plt.plot(history.history['val_loss'], color='green', label='Validation Loss')
-plt.xlabel('Epoch')
-plt.ylabel('Loss')
-plt.title('Training and Validation Loss')
-plt.legend()
-plt.show()
-
-# Plotting the actual vs predicted crimes
-plt.figure(figsize=(10, 6))
-plt.scatter(test_data['Total_Crimes'], test_data['Predicted_Crimes'], alpha=0.5, label='Actual vs Predicted Values')
-
-# Generate a diagonal line (y=x) for perfect predictions
-max_val = max(test_data['Total_Crimes'].max(), test_data['Predicted_Crimes'].max())
-plt.plot([0, max_val], [0, max_val], 'r--', lw=2, label='Perfect Prediction Line')
-
-plt.title('ANN - Actual vs Predicted Values')
-plt.xlabel('Actual Values')
-plt.ylabel('Predicted Values')
-plt.legend()
-plt.grid(True)
-plt.show()
-
-# Calculate residuals
-residuals = test_data['Total_Crimes'] - test_data['Predicted_Crimes']
-
-# Plotting the residuals
-plt.figure(figsize=(10, 6))
-plt.scatter(test_data['Total_Crimes'], residuals, alpha=0.5)
-plt.title('Residuals Plot')
-plt.xlabel('Actual Crimes')
-plt.ylabel('Residuals')
-plt.axhline(y=0, color='r', linestyle='--')
-plt.grid(True)
-plt.show()
-
-# Histogram of the residuals
-plt.figure(figsize=(10, 6))
-plt.hist(residuals, bins=30, alpha=0.7, color='blue')
-plt.title('Histogram of Residuals')
-plt.xlabel('Residuals')
-plt.ylabel('Frequency')
-plt.grid(True)
-plt.show()
\ No newline at end of file
+test_data.to_csv(os.path.join(PREDICTIONS_DIR, 'ANN_predictions.csv'), index=False)
+
+run.begin('metrics')
+# Calculate and print the error metrics (MSE, RMSE, MAE, R2 and R)
+print_metrics(test_data['Total_Crimes'], test_data['Predicted_Crimes'])
+
+run.begin('plot')
+# Rendering the loss curves and diagnostic plots without blocking on a window
+directory = os.path.join(DIAGNOSTIC_PLOTS_DIR, 'ANN')
+figures = diagnostic_figures('ANN', test_data['Total_Crimes'], test_data['Predicted_Crimes'])
+figures.append(curve_figure(os.path.join(directory, 'ANN_loss.png'), np.arange(len(history['loss'])),
+                            {'Training Loss': history['loss'], 'Validation Loss': history['val_loss']},
+                            'Training and Validation Loss', 'Epoch', 'Loss'))
+render_figures(figures)
+print(f"Plots written to {directory}")
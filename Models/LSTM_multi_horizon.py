@@ -0,0 +1,139 @@
+import os
+import argparse
+import numpy as np
+import joblib
+from sklearn.preprocessing import MinMaxScaler
+from sklearn.model_selection import train_test_split
+from crime_data import load_cube, load_split, PREDICTIONS_DIR, SCRIPTS_DIR
+from artefact_cache import ArtefactCache, artefact_key
+from evaluation import print_metrics, regression_metrics
+from windowing import SERIES_FEATURES, SeriesWindows, scale_series, series_from_cube, series_positions
+from run_log import start_run
+
+# Same seed and LSTM settings as LSTM.py; the epochs are raised since each sample now carries a whole year of targets
+SEED = 73
+LSTM_PARAMS = {'units': 100, 'learning_rate': 0.01, 'epochs': 20, 'batch_size': 90}
+
+# Months of history fed to the LSTM and months forecast from each window in one forward pass
+N_TIMESTEPS = 12
+HORIZON = 12
+
+MODEL_DIR = os.path.join(SCRIPTS_DIR, 'LSTM')
+MODEL_FILE = 'lstm_multi_horizon.h5'
+SCALER_FILE = 'multi_horizon_scaler.gz'
+
+
+# One scaled monthly sequence per (area, crime category) over the training years and over every year
+def load_series(scaler):
+    cube = load_cube()
+    train_series = scale_series(series_from_cube(cube.split_view('train'), cube.areas, cube.months, cube.agg_ids), scaler)
+    full_series = scale_series(series_from_cube(cube.counts, cube.areas, cube.months, cube.agg_ids), scaler)
+    return cube, train_series, full_series
+
+
+# LSTM over n_timesteps months with one output per forecast month (a direct, not recursive, multi-step forecast)
+def build_model(n_timesteps, n_features, horizon, params):
+    import tensorflow as tf
+    model = tf.keras.Sequential()
+    model.add(tf.keras.layers.Input(shape=(n_timesteps, n_features)))
+    model.add(tf.keras.layers.LSTM(params['units']))
+    model.add(tf.keras.layers.Dense(horizon))
+    model.compile(loss='mae', optimizer=tf.keras.optimizers.Adam(learning_rate=params['learning_rate']))
+    return model
+
+
+# Batches gathered from the strided windows while training, so no [samples, timesteps, features] matrix is built
+def make_dataset(windows, sample_idx, batch_size, shuffle, seed=SEED):
+    import tensorflow as tf
+    rng = np.random.default_rng(seed)
+    signature = (tf.TensorSpec((None, windows.n_in, windows.series.shape[2]), tf.float32),
+                 tf.TensorSpec((None, windows.n_out), tf.float32))
+    dataset = tf.data.Dataset.from_generator(lambda: windows.batches(sample_idx, batch_size, shuffle, rng),
+                                             output_signature=signature)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+# Training on every window of the training years that fits n_timesteps months of history and a full horizon
+def train_model(train_series, n_timesteps, horizon, params):
+    import tensorflow as tf
+    tf.random.set_seed(SEED)
+    windows = SeriesWindows(train_series, n_in=n_timesteps, n_out=horizon)
+    train_idx, val_idx = train_test_split(np.arange(len(windows)), test_size=0.2, random_state=1)
+    model = build_model(n_timesteps, train_series.shape[2], horizon, params)
+    model.fit(make_dataset(windows, train_idx, params['batch_size'], shuffle=True),
+              validation_data=make_dataset(windows, val_idx, params['batch_size'], shuffle=False),
+              epochs=params['epochs'], verbose=2)
+    return model
+
+
+# Forecasts [series, horizon] for the months from `origin` on, from the n_timesteps months before it
+# Every series goes through a single batched predict call
+def forecast(model, full_series, origin, n_timesteps, scaler):
+    X = full_series[:, origin - n_timesteps:origin]
+    scaled = np.asarray(model.predict_on_batch(X))
+    # Only Total_Crimes (the last feature) is turned back into counts
+    return (scaled - scaler.min_[-1]) / scaler.scale_[-1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Direct multi-horizon LSTM forecasting up to a year ahead in one pass')
+    parser.add_argument('--timesteps', type=int, default=N_TIMESTEPS, help='Months of history per sample')
+    parser.add_argument('--horizon', type=int, default=HORIZON, help='Months forecast at once (1-12)')
+    parser.add_argument('--epochs', type=int, default=LSTM_PARAMS['epochs'])
+    args = parser.parse_args()
+    params = {**LSTM_PARAMS, 'epochs': args.epochs}
+    run = start_run()
+
+    run.begin('load')
+    data = load_split('train', drop_year=True, columns=['Area', 'Month', 'Crime_Category', 'Total_Crimes'])
+    test_data = load_split('test', drop_year=True, columns=['Area', 'Month', 'Crime_Category', 'Total_Crimes'])
+    model_path = os.path.join(MODEL_DIR, MODEL_FILE)
+    scaler_path = os.path.join(MODEL_DIR, SCALER_FILE)
+
+    run.begin('cache_lookup')
+    # Reusing the model, scaler and forecasts of an earlier run with the same data, preprocessing and hyperparameters
+    cache = ArtefactCache()
+    preprocessing = ['MinMaxScaler(0, 1)', f'SeriesWindows(n_in={args.timesteps}, n_out={args.horizon})',
+                     'train_test_split(0.2, random_state=1)']
+    key = artefact_key('lstm_multi_horizon', data, test_data, preprocessing, params, SEED)
+    entry = cache.lookup(key)
+
+    scaler = MinMaxScaler(feature_range=(0, 1)).fit(data[SERIES_FEATURES])
+    cube, train_series, full_series = load_series(scaler)
+    origin = train_series.shape[1]
+
+    if entry is None:
+        run.begin('fit')
+        model = train_model(train_series, args.timesteps, args.horizon, params)
+        if not os.path.exists(MODEL_DIR):
+            os.makedirs(MODEL_DIR)
+        run.begin('save_model')
+        model.save(model_path)
+        joblib.dump(scaler, scaler_path)
+        run.begin('predict')
+        forecasts = forecast(model, full_series, origin, args.timesteps, scaler)
+        run.begin('cache_store')
+        cache.store(key, files={MODEL_FILE: model_path, SCALER_FILE: scaler_path}, arrays={'forecasts': forecasts},
+                    meta={'model': 'lstm_multi_horizon', 'params': params, 'horizon': args.horizon})
+    else:
+        print(f"Reusing the multi-horizon LSTM trained in an earlier run ({entry})")
+        cache.restore(entry, {MODEL_FILE: model_path, SCALER_FILE: scaler_path})
+        forecasts = cache.load_array(entry, 'forecasts')
+
+    run.begin('metrics')
+    # Each test row takes the forecast of its series at its lead time (months after the last training month)
+    area_idx, year_idx, month_idx, agg_idx = cube.indices('test')
+    series_idx, time_idx = series_positions(area_idx, year_idx, month_idx, agg_idx, len(cube.months), len(cube.agg_ids))
+    lead = time_idx - origin
+    test_data = test_data[lead < args.horizon].copy()
+    test_data['Lead_Months'] = lead[lead < args.horizon] + 1
+    test_data['Predicted_Crimes'] = forecasts[series_idx[lead < args.horizon], lead[lead < args.horizon]]
+
+    # Error metrics over the whole forecast and for each lead time
+    print_metrics(test_data['Total_Crimes'], test_data['Predicted_Crimes'])
+    for lead_months, rows in test_data.groupby('Lead_Months'):
+        metrics = regression_metrics(rows['Total_Crimes'], rows['Predicted_Crimes'])
+        print(f'{lead_months} month(s) ahead: MSE {metrics["MSE"]:.3f}, MAE {metrics["MAE"]:.3f}, R {metrics["R"]:.3f}')
+
+    run.begin('write')
+    test_data.to_csv(os.path.join(PREDICTIONS_DIR, 'LSTM_multi_horizon_predictions.csv'), index=False)
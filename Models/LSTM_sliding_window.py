@@ -0,0 +1,156 @@
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import joblib
+from sklearn.model_selection import train_test_split
+from crime_data import load_cube, load_split, PREDICTIONS_DIR, SCRIPTS_DIR
+from windowing import SeriesWindows, scale_series, series_from_cube, series_positions
+from run_log import start_run
+
+# Step sizes tried in the original sliding window experiment (210 rows = 1 month of the test set)
+# 2520 is the entire test set, so it never re-trains and matches the initial model's results
+STEP_SIZES = [210, 420, 630, 840, 1050, 1260, 1470, 1680, 1890, 2100, 2310, 2520]
+
+# Training settings reused for every retraining step
+EPOCHS = 5
+BATCH_SIZE = 90
+
+MODEL_DIR = os.path.join(SCRIPTS_DIR, 'LSTM')
+
+
+# Fixed-size training window: new samples overwrite the oldest ones instead of reallocating arrays
+class RingBuffer:
+    def __init__(self, X, y, capacity):
+        self.X = np.empty((capacity,) + X.shape[1:], dtype=X.dtype)
+        self.y = np.empty((capacity,) + y.shape[1:], dtype=y.dtype)
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0
+        self.extend(X, y)
+
+    def extend(self, X, y):
+        # Only the newest rows can survive if more than the whole capacity arrives at once
+        if len(X) > self.capacity:
+            X, y = X[-self.capacity:], y[-self.capacity:]
+        n = len(X)
+        first = min(n, self.capacity - self.head)
+        self.X[self.head:self.head + first] = X[:first]
+        self.y[self.head:self.head + first] = y[:first]
+        self.X[:n - first] = X[first:]
+        self.y[:n - first] = y[first:]
+        self.head = (self.head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    # The samples currently in the window (order does not matter since fit shuffles them)
+    def contents(self):
+        return self.X[:self.size], self.y[:self.size]
+
+
+# Training windows (same split as LSTM.py) and the test inputs in chronological order
+def load_windows(scaler, n_timesteps):
+    cube = load_cube()
+    train_series = scale_series(series_from_cube(cube.split_view('train'), cube.areas, cube.months, cube.agg_ids), scaler)
+    train_windows = SeriesWindows(train_series, n_in=n_timesteps, n_out=1)
+    train_idx, _ = train_test_split(np.arange(len(train_windows)), test_size=0.2, random_state=1)
+    X_train, y_train = train_windows.take(train_idx)
+
+    full_series = scale_series(series_from_cube(cube.counts, cube.areas, cube.months, cube.agg_ids), scaler)
+    full_windows = SeriesWindows(full_series, n_in=n_timesteps, n_out=1)
+    area_idx, year_idx, month_idx, agg_idx = cube.indices('test')
+    series_idx, time_idx = series_positions(area_idx, year_idx, month_idx, agg_idx, len(cube.months), len(cube.agg_ids))
+
+    # The test set is stored area by area, so it is reordered month by month for the steps to follow time
+    order = np.argsort(time_idx, kind='mergesort')
+    test_X, _ = full_windows.take(full_windows.sample_index(series_idx[order], time_idx[order]))
+    return X_train, y_train, test_X, order
+
+
+# Predicting the test set step by step, continuing training from the previous weights after each step
+def sliding_window_prediction_with_retraining(model, X_train, y_train, test_X, step_size, epochs=EPOCHS, batch_size=BATCH_SIZE):
+    window = RingBuffer(X_train, y_train.reshape(-1, 1), capacity=len(X_train))
+    predictions = np.empty(len(test_X), dtype=np.float32)
+
+    for start_index in range(0, len(test_X), step_size):
+        end_index = min(start_index + step_size, len(test_X))
+        current_test_data = test_X[start_index:end_index]
+
+        # Make predictions for the current step
+        current_predictions = model.predict(current_test_data, verbose=0)
+        predictions[start_index:end_index] = current_predictions[:, 0]
+
+        # Nothing left to predict, so there is no point in retraining
+        if end_index == len(test_X):
+            break
+
+        # Add the predicted data to the window, dropping the oldest samples
+        window.extend(current_test_data, current_predictions)
+
+        # Continue training the same model on the updated window
+        current_train_data, current_train_labels = window.contents()
+        model.fit(current_train_data, current_train_labels, epochs=epochs, batch_size=batch_size, verbose=0)
+
+    return predictions
+
+
+# Worker process: runs one step size starting from the saved LSTM model
+def run_step_size(step_size, model_dir=MODEL_DIR):
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    # Same seeds as LSTM.py so every step size starts from identical conditions
+    tf.random.set_seed(73)
+    np.random.seed(73)
+
+    scaler = joblib.load(os.path.join(model_dir, 'scaler.gz'))
+    model = load_model(os.path.join(model_dir, 'lstm_model.h5'))
+    n_timesteps = model.input_shape[1]
+
+    X_train, y_train, test_X, order = load_windows(scaler, n_timesteps)
+    predictions = sliding_window_prediction_with_retraining(model, X_train, y_train, test_X, step_size)
+
+    # Inverse transform the predicted values and put them back in test set order
+    dummy_features = np.zeros((len(predictions), len(scaler.scale_) - 1))
+    full_predictions = np.concatenate([dummy_features, predictions.reshape(-1, 1)], axis=1)
+    final_predictions = np.empty(len(predictions))
+    final_predictions[order] = scaler.inverse_transform(full_predictions)[:, -1]
+    return step_size, final_predictions
+
+
+# Running several step sizes side by side, one worker process per step size
+def run_step_sizes(step_sizes, workers=None, model_dir=MODEL_DIR):
+    # TensorFlow is not fork-safe, so workers are started fresh
+    context = multiprocessing.get_context('spawn')
+    workers = workers or min(len(step_sizes), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(run_step_size, step_size, model_dir) for step_size in step_sizes]
+        return dict(future.result() for future in futures)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LSTM sliding window prediction with warm-started retraining')
+    parser.add_argument('--step-sizes', type=int, nargs='+', default=STEP_SIZES, help='Test rows predicted between retrainings')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: one per step size, up to the CPU count)')
+    args = parser.parse_args()
+    run = start_run()
+
+    run.begin('fit')
+    results = run_step_sizes(args.step_sizes, args.workers)
+
+    run.begin('metrics')
+    # Add the predictions of every step size to the test data
+    test_data = load_split('test', drop_year=True, columns=['Area', 'Month', 'Crime_Category', 'Total_Crimes'])
+    for step_size, final_predictions in results.items():
+        test_data[f'Predicted_Crimes_{step_size}'] = final_predictions
+
+    # Print error metrics for every step size
+    for step_size, final_predictions in results.items():
+        errors = test_data['Total_Crimes'] - final_predictions
+        mse = np.mean(errors ** 2)
+        print(f'Step size {step_size}: MSE {mse:.3f}, RMSE {np.sqrt(mse):.3f}, MAE {np.mean(np.abs(errors)):.3f}, '
+              f'R {np.corrcoef(test_data["Total_Crimes"], final_predictions)[0, 1]:.3f}')
+
+    run.begin('write')
+    # Save the predictions as a CSV
+    test_data.to_csv(os.path.join(PREDICTIONS_DIR, 'LSTM_sliding_window_predictions.csv'), index=False)
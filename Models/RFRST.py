@@ -1,85 +1,82 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
-import numpy as np
-import scipy.stats as stats
+import os
+from crime_data import load_split, PREDICTIONS_DIR, SCRIPTS_DIR
+from forest_export import RF_PARAMS, export_forest
+from artefact_cache import ArtefactCache, artefact_key
+from evaluation import print_metrics
+from plot_renderer import DIAGNOSTIC_PLOTS_DIR, diagnostic_figures, render_figures
+from run_log import start_run
 
+# Timing and peak memory of every stage, written to the run log when the script exits
+run = start_run()
+
+# Number of cores used to fit and predict with the forest (-1 uses all of them)
+N_JOBS = -1
+
+run.begin('load')
 # Loading the training data
-train_df = pd.read_csv(r'C:\\Users\\luigi\\Desktop\\Third Year\\Thesis\\Artefact\\Data\\train_set.csv')
+train_df = load_split('train')
 
 # Separating features and target variable for training data
 X_train = train_df.drop(columns=['total_crimes']).copy()
 y_train = train_df['total_crimes'].copy()
 
 # Loading testing data
-test_df = pd.read_csv(r'C:\\Users\\luigi\\Desktop\\Third Year\\Thesis\\Artefact\\Data\\test_set.csv')
+test_df = load_split('test')
 
 # Separating features and target variable for testing data
 X_test = test_df.drop(columns=['total_crimes']).copy()
 y_test = test_df['total_crimes'].copy()
 
-# Initialising Random Forest Regressor with optimised parameters obtained from Optuna
-best_rf = RandomForestRegressor(n_estimators=1857, min_samples_split=6, min_samples_leaf=2,
-                                 max_features=None, max_depth=90, bootstrap=True, random_state=0, oob_score=True)
+forest_dir = os.path.join(SCRIPTS_DIR, 'RFRST', 'forest')
+
+run.begin('cache_lookup')
+# Reusing the forest and predictions of an earlier run with the same data and parameters
+cache = ArtefactCache()
+key = artefact_key('rf', X_train, y_train, X_test, RF_PARAMS)
+entry = cache.lookup(key)
+
+if entry is None:
+    # Initialising Random Forest Regressor with optimised parameters obtained from Optuna
+    best_rf = RandomForestRegressor(**RF_PARAMS, n_jobs=N_JOBS)
 
-# Fitting the model on the training data
-best_rf.fit(X_train, y_train)
+    run.begin('fit')
+    # Fitting the model on the training data
+    best_rf.fit(X_train, y_train)
 
-# Predictions on the training set
-predictions_train = best_rf.predict(X_train)
+    run.begin('export')
+    # Exporting the fitted forest as flat node arrays, which load and predict much faster than the pickled forest
+    export_forest(best_rf, forest_dir)
 
-# Predictions on the test set
-predictions_test = best_rf.predict(X_test)
+    run.begin('predict')
+    # Predictions on the training set
+    predictions_train = best_rf.predict(X_train)
+
+    # Predictions on the test set
+    predictions_test = best_rf.predict(X_test)
+
+    run.begin('cache_store')
+    cache.store(key, files={'forest': forest_dir},
+                arrays={'predictions_train': predictions_train, 'predictions_test': predictions_test},
+                meta={'model': 'rf', 'params': RF_PARAMS})
+else:
+    print(f"Reusing the forest fitted in an earlier run ({entry})")
+    cache.restore(entry, {'forest': forest_dir})
+    predictions_train = cache.load_array(entry, 'predictions_train')
+    predictions_test = cache.load_array(entry, 'predictions_test')
 
 # Adding the predictions to the test_df
 test_df['rf_prediction'] = predictions_test
 
+run.begin('write')
 # Saving predictions as a CSV
-test_df.to_csv('C:\\Users\\luigi\\Desktop\\Third Year\\Thesis\\Artefact\\Data\\Model Predictions\\random_forest_predictions.csv', index=False)
-
-# Evaluating test set results
-test_mse = mean_squared_error(y_test, predictions_test)
-test_rmse = np.sqrt(test_mse)
-test_mae = mean_absolute_error(y_test, predictions_test)
-test_r2 = r2_score(y_test, predictions_test)
-test_corr = np.corrcoef(y_test, predictions_test)[0, 1]
-
-# Printing test set metrics
-print(f'Mean Squared Error (MSE): {test_mse:.2f}')
-print(f'Root Mean Squared Error (RMSE): {test_rmse:.2f}')
-print(f'Mean Absolute Error (MAE): {test_mae:.2f}')
-print(f'R-squared: {test_r2:.2f}')
-print(f'Correlation coefficient (R): {test_corr:.2f}')
-
-# Plotting Actual vs Predicted Values (Test Set)
-plt.figure(figsize=(20, 6))
-plt.subplot(1, 3, 1)
-plt.scatter(y_test, predictions_test, color='blue', alpha=0.5, label='Actual vs Predicted Values')
-plt.plot([min(y_test), max(y_test)], [min(y_test), max(y_test)], linestyle='--', color='red', label='Perfect Prediction Line')
-plt.title('Actual vs Predicted Values (Test Set)')
-plt.xlabel('Actual Values')
-plt.ylabel('Predicted Values')
-plt.grid(True)
-plt.legend()
-
-# Plotting Residuals vs Actual Values (Test Set)
-residuals = y_test - predictions_test
-plt.figure(figsize=(6, 6))
-plt.scatter(y_test, residuals, color='blue', alpha=0.5)
-plt.axhline(y=0, color='red', linestyle='--')
-plt.title('Residuals vs Actual Values')
-plt.xlabel('Actual Values')
-plt.ylabel('Residuals')
-plt.grid(True)
-
-# Plotting Histogram of Residuals (Test Set)
-plt.figure(figsize=(6, 6))
-plt.hist(residuals, bins=30, color='blue', alpha=0.5)
-plt.title('Histogram of Residuals')
-plt.xlabel('Residuals')
-plt.ylabel('Frequency')
-plt.grid(True)
-
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+test_df.to_csv(os.path.join(PREDICTIONS_DIR, 'random_forest_predictions.csv'), index=False)
+
+run.begin('metrics')
+# Evaluating and printing test set results
+print_metrics(y_test, predictions_test)
+
+run.begin('plot')
+# Rendering the diagnostic plots without blocking on a window
+render_figures(diagnostic_figures('RF', y_test, predictions_test))
+print(f"Plots written to {os.path.join(DIAGNOSTIC_PLOTS_DIR, 'RF')}")
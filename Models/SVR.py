@@ -1,93 +1,84 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split, learning_curve
-from sklearn.svm import SVR
+import argparse
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
-import matplotlib.pyplot as plt
-import numpy as np
-
-# Load training data
-train_data = pd.read_csv('C:\\Users\\luigi\\Desktop\\Third Year\\Thesis\\Artefact\\Data\\train_set.csv')
-
-# Remove the 'year' column from training data
-train_data.drop('year', axis=1, inplace=True)
+import os
+from crime_data import load_split, PREDICTIONS_DIR
+from svr_engines import C, EPSILON, SVR_ENGINES, make_svr
+from artefact_cache import ArtefactCache, artefact_key
+from evaluation import print_metrics
+from plot_renderer import DIAGNOSTIC_PLOTS_DIR, diagnostic_figures, render_figures
+from run_log import start_run
+
+# Timing and peak memory of every stage, written to the run log when the script exits
+run = start_run()
+
+# Choosing between the exact RBF SVR and the kernel-approximation fast path
+parser = argparse.ArgumentParser(description='SVR crime prediction model')
+parser.add_argument('--engine', choices=SVR_ENGINES, default='exact', help='exact RBF SVR or an approximate RBF feature map with a linear solver')
+args = parser.parse_args()
+
+run.begin('load')
+# Load training data without the 'year' column
+train_data = load_split('train', drop_year=True)
 
 # Define features and target variable for training data
 X_train = train_data[['month', 'area', 'agg_id']]  
 y_train = train_data['total_crimes']
 
-# Feature scaling for training data
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-
-# Initialize and train the SVR model
-svr = SVR(kernel='rbf', C=28657, epsilon=1, gamma='auto')
-svr.fit(X_train_scaled, y_train)
-
-# Load test data
-test_data = pd.read_csv('C:\\Users\\luigi\\Desktop\\Third Year\\Thesis\\Artefact\\Data\\test_set.csv')
-
-# Remove the 'year' column from test data
-test_data.drop('year', axis=1, inplace=True)
+# Load test data without the 'year' column
+test_data = load_split('test', drop_year=True)
 
 # Define features for test data
 X_test = test_data[['month', 'area', 'agg_id']] #Features
 y_test = test_data['total_crimes']  # Actual crime totals
 
-# Feature scaling for test data using the same scaler as the training data
-X_test_scaled = scaler.transform(X_test)
-
-# Predict on the test data
-y_pred = svr.predict(X_test_scaled)
-
-# Calculate evaluation metrics for testing set
-mse_test = mean_squared_error(y_test, y_pred)
-rmse_test = np.sqrt(mse_test)
-mae_test = mean_absolute_error(y_test, y_pred)
-r2_test = r2_score(y_test, y_pred)
-correlation_coefficient = np.corrcoef(y_test, y_pred)[0, 1]
-
-# Print testing set metrics
+run.begin('cache_lookup')
+# Reusing the model and predictions of an earlier run with the same data, scaling and hyperparameters
+cache = ArtefactCache()
+key = artefact_key('svr', args.engine, X_train, y_train, X_test, ['StandardScaler'], {'C': C, 'epsilon': EPSILON})
+entry = cache.lookup(key)
+
+if entry is None:
+    run.begin('scale')
+    # Feature scaling for training data
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+
+    run.begin('fit')
+    # Initialize and train the SVR model
+    svr = make_svr(args.engine, n_features=X_train_scaled.shape[1])
+    svr.fit(X_train_scaled, y_train)
+
+    run.begin('scale')
+    # Feature scaling for test data using the same scaler as the training data
+    X_test_scaled = scaler.transform(X_test)
+
+    run.begin('predict')
+    # Predict on the test data
+    y_pred = svr.predict(X_test_scaled)
+
+    # This script only reads predictions_test back; the fitted svr and scaler are kept for ensemble_router
+    cache.store(key, arrays={'predictions_test': y_pred}, objects={'svr': svr, 'scaler': scaler},
+                meta={'model': 'svr', 'engine': args.engine})
+else:
+    print(f"Reusing the SVR fitted in an earlier run ({entry})")
+    y_pred = cache.load_array(entry, 'predictions_test')
+
+run.begin('metrics')
+# Calculate and print evaluation metrics for testing set
 print("\nTesting Set Metrics:")
-print("Mean Squared Error (MSE):", mse_test)
-print("Root Mean Squared Error (RMSE):", rmse_test)
-print("Mean Absolute Error (MAE):", mae_test)
-print("R-squared (R2):", r2_test)
-print("Correlation Coefficient (R):", correlation_coefficient)
-
-# Plotting Actual Vs Predicted Values
-plt.figure(figsize=(8, 6))
-plt.scatter(y_test, y_pred, color='blue', alpha=0.5)
-plt.plot([y_test.min(), y_test.max()], [y_test.min(), y_test.max()], 'k--', lw=2)
-plt.xlabel('Actual Values')
-plt.ylabel('Predicted Values')
-plt.title('True vs Predicted Values')
-plt.grid(True)
-plt.show()
-
-# Plotting Residuals
-residuals = y_test - y_pred
-plt.figure(figsize=(8, 6))
-plt.scatter(y_test, residuals, color='blue', alpha=0.5)
-plt.axhline(y=0, color='red', linestyle='--')
-plt.xlabel('True Values')
-plt.ylabel('Residuals')
-plt.title('Residual Plot')
-plt.grid(True)
-plt.show()
-
-# Plotting Histogram of Residuals
-plt.figure(figsize=(8, 6))
-plt.hist(residuals, bins=30, color='blue', alpha=0.5, edgecolor='black')
-plt.xlabel('Residuals')
-plt.ylabel('Frequency')
-plt.title('Histogram of Residuals')
-plt.grid(True)
-plt.show()
+print_metrics(y_test, y_pred)
+
+run.begin('plot')
+# Rendering the diagnostic plots without blocking on a window
+model_name = 'SVR' if args.engine == 'exact' else f'SVR_{args.engine}'
+render_figures(diagnostic_figures(model_name, y_test, y_pred))
+print(f"Plots written to {os.path.join(DIAGNOSTIC_PLOTS_DIR, model_name)}")
 
 # Print the test data with predictions for visual comparison
 test_data['predicted_crimes'] = y_pred
 print(test_data)
 
-# Save predictions since this is the best SVR model developed
-test_data.to_csv('C:\\Users\\luigi\\Desktop\\Third Year\\Thesis\\Artefact\\Data\\Model Predictions\\SVR_predictions.csv', index=False)
\ No newline at end of file
+run.begin('write')
+# Save predictions since this is the best SVR model developed (approximate engines are kept separately)
+file_name = 'SVR_predictions.csv' if args.engine == 'exact' else f'SVR_{args.engine}_predictions.csv'
+test_data.to_csv(os.path.join(PREDICTIONS_DIR, file_name), index=False)
\ No newline at end of file
@@ -0,0 +1,70 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
+from crime_data import load_split, EVALUATION_DIR
+from svr_engines import SVR_ENGINES, make_svr
+from run_log import start_run
+
+# Timing and peak memory of every stage, written to the run log when the script exits
+run = start_run()
+
+# Benchmarking the approximate SVR engines against the exact RBF SVR on the train/test split
+parser = argparse.ArgumentParser(description='Fit time, predict time and accuracy of every SVR engine')
+parser.add_argument('--engines', nargs='+', choices=SVR_ENGINES, default=SVR_ENGINES)
+parser.add_argument('--n-components', type=int, default=300, help='Size of the approximate RBF feature map')
+args = parser.parse_args()
+
+run.begin('load')
+# Load the data and scale it exactly as SVR.py does
+train_data = load_split('train', drop_year=True)
+test_data = load_split('test', drop_year=True)
+X_train, y_train = train_data[['month', 'area', 'agg_id']], train_data['total_crimes']
+X_test, y_test = test_data[['month', 'area', 'agg_id']], test_data['total_crimes']
+run.begin('scale')
+scaler = StandardScaler()
+X_train_scaled = scaler.fit_transform(X_train)
+X_test_scaled = scaler.transform(X_test)
+
+results = []
+predictions = {}
+for engine in args.engines:
+    svr = make_svr(engine, n_features=X_train_scaled.shape[1], n_components=args.n_components)
+
+    run.begin(f'fit_{engine}')
+    start = time.perf_counter()
+    svr.fit(X_train_scaled, y_train)
+    fit_time = time.perf_counter() - start
+
+    run.begin(f'predict_{engine}')
+    start = time.perf_counter()
+    y_pred = svr.predict(X_test_scaled)
+    predict_time = time.perf_counter() - start
+    predictions[engine] = y_pred
+
+    mse = mean_squared_error(y_test, y_pred)
+    results.append({
+        'Engine': engine,
+        'Fit Time (s)': round(fit_time, 3),
+        'Predict Time (s)': round(predict_time, 3),
+        'MSE': round(mse, 3),
+        'RMSE': round(np.sqrt(mse), 3),
+        'MAE': round(mean_absolute_error(y_test, y_pred), 3),
+        'R-squared': round(r2_score(y_test, y_pred), 3),
+        'R': round(np.corrcoef(y_test, y_pred)[0, 1], 3)
+    })
+
+run.begin('metrics')
+# How far each approximation lands from the exact model's own predictions
+benchmark_df = pd.DataFrame(results)
+if 'exact' in predictions:
+    benchmark_df['MSE vs Exact'] = [round(mean_squared_error(predictions['exact'], predictions[engine]), 3)
+                                    for engine in benchmark_df['Engine']]
+print(benchmark_df.to_string(index=False))
+
+run.begin('write')
+# Save the benchmark next to the other model evaluation results
+benchmark_df.to_csv(os.path.join(EVALUATION_DIR, 'svr_benchmark.csv'), index=False)
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from sklearn.preprocessing import MinMaxScaler
+from sklearn.model_selection import train_test_split
+from crime_data import EVALUATION_DIR, SCRIPTS_DIR, load_split
+
+ANN_DIR = os.path.join(SCRIPTS_DIR, 'ANN')
+
+# Hyperparameters of the best ANN model
+ANN_PARAMS = {'units': [118, 86, 54], 'dropout': [0.04, 0.03, 0.5], 'learning_rate': 0.0002,
+              'epochs': 1000, 'batch_size': 29}
+
+# Budgeted runs keep their checkpoints, state and best weights apart from the tracked model_weights files
+# of Scripts/ANN, so the checkpoint manager never takes those for its own (the folder is gitignored)
+CHECKPOINT_DIR = os.path.join(ANN_DIR, 'checkpoints')
+CHECKPOINT_NAME = 'budgeted'
+STATE_FILE = 'training_state.json'
+BEST_WEIGHTS_FILE = 'best_model.weights.h5'
+
+# Defaults of the budgeted training mode
+BUDGET_MINUTES = 30
+PATIENCE = 50
+CHECKPOINT_EVERY = 10
+
+# Batch sizes compared by the time-to-target report (29 is the batch size of ANN.py)
+REPORT_BATCH_SIZES = [29, 64, 128, 256, 512]
+
+
+# Scaling, sorting and splitting the training rows exactly as ANN.py does
+def prepare_training_data(data):
+    columns = ['Month', 'Area', 'Crime_Category', 'Total_Crimes']
+    scaler = MinMaxScaler(feature_range=(0, 1))
+    scaled_df = pd.DataFrame(scaler.fit_transform(data[columns]), columns=columns)
+
+    # Sorting data in a stable manner to prevent any randomness due to equivalent sorting keys
+    scaled_df.sort_values(by=['Month', 'Crime_Category', 'Area'], inplace=True, kind='mergesort')
+
+    X = scaled_df[['Month', 'Area', 'Crime_Category']]
+    y = scaled_df['Total_Crimes']
+    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=1)
+    return scaler, X_train, X_val, y_train, y_val
+
+
+# The ANN architecture of ANN.py for a set of hyperparameters
+def build_ann(params, n_features):
+    model = tf.keras.Sequential()
+    model.add(tf.keras.layers.Input(shape=(n_features,)))
+    for units, dropout in zip(params['units'], params['dropout']):
+        model.add(tf.keras.layers.Dense(units, activation='relu'))
+        model.add(tf.keras.layers.Dropout(dropout))
+    model.add(tf.keras.layers.Dense(1))
+    model.compile(loss='mae', optimizer=tf.keras.optimizers.Adam(learning_rate=params['learning_rate']))
+    return model
+
+
+# Input pipeline: the rows are converted to tensors once, kept in memory, reshuffled every epoch
+# and batched ahead of the training step instead of being sliced out of pandas frames each epoch
+def make_dataset(X, y, batch_size, shuffle=True, seed=0):
+    dataset = tf.data.Dataset.from_tensor_slices((np.asarray(X, dtype=np.float32), np.asarray(y, dtype=np.float32)))
+    dataset = dataset.cache()
+    if shuffle:
+        dataset = dataset.shuffle(len(X), seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+# Stops on a validation plateau or when the wall-clock budget runs out, keeps the best weights,
+# and checkpoints the model, optimiser and its own state so an interrupted run can carry on
+class TrainingGuard(tf.keras.callbacks.Callback):
+    def __init__(self, directory, state, budget_seconds, patience, checkpoint_every, manager, target_loss=None):
+        super().__init__()
+        self.directory = directory
+        self.state = state
+        self.budget_seconds = budget_seconds
+        self.patience = patience
+        self.checkpoint_every = checkpoint_every
+        self.manager = manager
+        self.target_loss = target_loss
+
+    def on_train_begin(self, logs=None):
+        # Time spent in earlier sessions of a resumed run counts against the budget
+        self.session_start = time.perf_counter() - self.state['elapsed']
+
+    def on_epoch_end(self, epoch, logs=None):
+        state = self.state
+        state['epoch'] = epoch + 1
+        state['elapsed'] = time.perf_counter() - self.session_start
+        for name, value in (logs or {}).items():
+            state['history'].setdefault(name, []).append(float(value))
+
+        val_loss = float(logs['val_loss'])
+        if val_loss < state['best_val_loss']:
+            state['best_val_loss'] = val_loss
+            state['best_epoch'] = epoch + 1
+            state['wait'] = 0
+            self.model.save_weights(os.path.join(self.directory, BEST_WEIGHTS_FILE))
+        else:
+            state['wait'] += 1
+        if self.target_loss is not None and state['time_to_target'] is None and val_loss <= self.target_loss:
+            state['time_to_target'] = state['elapsed']
+            state['epochs_to_target'] = epoch + 1
+
+        if state['wait'] >= self.patience:
+            state['stopped'] = 'plateau'
+        elif state['elapsed'] >= self.budget_seconds:
+            state['stopped'] = 'budget'
+        if state['stopped']:
+            self.model.stop_training = True
+        if state['stopped'] or (epoch + 1) % self.checkpoint_every == 0:
+            self.save()
+
+    def save(self):
+        self.state['checkpoint'] = self.manager.save(checkpoint_number=self.state['epoch'])
+        tmp_path = os.path.join(self.directory, f'{STATE_FILE}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, os.path.join(self.directory, STATE_FILE))
+
+
+def _new_state(run_key, max_epochs):
+    return {'run_key': run_key, 'max_epochs': max_epochs, 'epoch': 0, 'elapsed': 0.0, 'history': {},
+            'best_val_loss': float('inf'), 'best_epoch': 0, 'wait': 0, 'stopped': None,
+            'time_to_target': None, 'epochs_to_target': None, 'checkpoint': None}
+
+
+# Training with a streaming pipeline, a plateau/wall-clock stopping rule and periodic checkpoints
+# A run with the same run_key as the checkpoint in directory resumes from it; anything else starts afresh
+# Returns the model with its best weights and the training state (history, stop reason, timings)
+def train_budgeted(params, X_train, y_train, X_val, y_val, directory=CHECKPOINT_DIR, run_key=None,
+                   budget_seconds=BUDGET_MINUTES * 60, patience=PATIENCE, checkpoint_every=CHECKPOINT_EVERY,
+                   resume=True, target_loss=None, seed=0, verbose=2):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    model = build_ann(params, np.shape(X_train)[1])
+    checkpoint = tf.train.Checkpoint(model=model, optimizer=model.optimizer)
+    manager = tf.train.CheckpointManager(checkpoint, directory, max_to_keep=2, checkpoint_name=CHECKPOINT_NAME)
+
+    state = None
+    state_path = os.path.join(directory, STATE_FILE)
+    if resume and os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        # Checkpoints of other data or hyperparameters, or of a finished run, are not resumed
+        if state.get('run_key') != run_key or state.get('stopped') or not state.get('checkpoint'):
+            state = None
+    if state is not None and os.path.exists(f"{state['checkpoint']}.index"):
+        checkpoint.restore(state['checkpoint'])
+        print(f"Resuming from epoch {state['epoch']} ({state['elapsed']:.0f}s already spent)")
+    else:
+        state = _new_state(run_key, params['epochs'])
+
+    guard = TrainingGuard(directory, state, budget_seconds, patience, checkpoint_every, manager, target_loss)
+    if state['epoch'] < params['epochs']:
+        model.fit(make_dataset(X_train, y_train, params['batch_size'], seed=seed),
+                  validation_data=make_dataset(X_val, y_val, params['batch_size'], shuffle=False),
+                  epochs=params['epochs'], initial_epoch=state['epoch'], callbacks=[guard], verbose=verbose)
+    if not state['stopped']:
+        state['stopped'] = 'epochs'
+        guard.save()
+
+    best_weights = os.path.join(directory, BEST_WEIGHTS_FILE)
+    if os.path.exists(best_weights):
+        model.load_weights(best_weights)
+    return model, state
+
+
+# Wall-clock time each batch size needs to reach a validation loss, every run under the same budget
+def time_to_target_report(params, batch_sizes, target_loss, budget_seconds, patience=PATIENCE, seed=74):
+    data = load_split('train', drop_year=True, columns=['Area', 'Month', 'Crime_Category', 'Total_Crimes'])
+    _, X_train, X_val, y_train, y_val = prepare_training_data(data)
+
+    rows = []
+    for batch_size in batch_sizes:
+        tf.random.set_seed(seed)
+        directory = os.path.join(CHECKPOINT_DIR, 'batch_size_report', str(batch_size))
+        _, state = train_budgeted({**params, 'batch_size': batch_size}, X_train, y_train, X_val, y_val, directory,
+                                  run_key=f'report/{batch_size}', budget_seconds=budget_seconds, patience=patience,
+                                  resume=False, target_loss=target_loss, seed=seed, verbose=0)
+        rows.append({
+            'batch_size': batch_size,
+            'target_loss': target_loss,
+            'time_to_target': state['time_to_target'],
+            'epochs_to_target': state['epochs_to_target'],
+            'seconds_per_epoch': state['elapsed'] / max(state['epoch'], 1),
+            'best_val_loss': state['best_val_loss'],
+            'best_epoch': state['best_epoch'],
+            'epochs': state['epoch'],
+            'stopped': state['stopped']
+        })
+        print(rows[-1])
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time-to-target validation loss of the ANN for several batch sizes')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=REPORT_BATCH_SIZES)
+    parser.add_argument('--target-loss', type=float, default=0.03, help='Validation MAE on the scaled target')
+    parser.add_argument('--budget-minutes', type=float, default=5, help='Wall-clock budget of each batch size')
+    parser.add_argument('--patience', type=int, default=PATIENCE)
+    parser.add_argument('--output', default=os.path.join(EVALUATION_DIR, 'ann_batch_size_report.csv'))
+    args = parser.parse_args()
+
+    report = time_to_target_report(ANN_PARAMS, args.batch_sizes, args.target_loss, args.budget_minutes * 60, args.patience)
+    report.to_csv(args.output, index=False)
+    print(report)
@@ -0,0 +1,161 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from crime_data import DATA_DIR
+from shapefiles import read_attributes, read_shapes
+
+AREAS_SHP = os.path.join(DATA_DIR, 'Shapefiles', 'Areas.shp')
+
+# LAPD area number ('prec' in the areas table) of every record of Areas.shp
+# The .dbf holding 'prec' is not in the repository, so the records were matched to the areas by location
+AREA_BY_RECORD = {
+    1: 3, 2: 4, 3: 5, 4: 6, 5: 1, 6: 2, 7: 11, 8: 12, 9: 13, 10: 14, 11: 7,
+    12: 8, 13: 9, 14: 10, 15: 19, 16: 20, 17: 21, 18: 15, 19: 16, 20: 17, 21: 18
+}
+
+# Names of the LAPD areas ('Area' in the areas table)
+AREA_NAMES = {
+    1: 'Central', 2: 'Rampart', 3: 'Southwest', 4: 'Hollenbeck', 5: 'Harbor', 6: 'Hollywood', 7: 'Wilshire',
+    8: 'West LA', 9: 'Van Nuys', 10: 'West Valley', 11: 'Northeast', 12: '77th Street', 13: 'Newton',
+    14: 'Pacific', 15: 'N Hollywood', 16: 'Foothill', 17: 'Devonshire', 18: 'Southeast', 19: 'Mission',
+    20: 'Olympic', 21: 'Topanga'
+}
+
+# Horizontal bands of the grid; a point is only tested against the edges crossing its band
+N_BANDS = 2048
+
+# Points times candidate edges compared at once, bounding the memory of a dense band
+MAX_PAIRS = 1 << 22
+
+# Points read at a time from an incident CSV
+CHUNK_SIZE = 500_000
+
+
+# Area numbers of the polygons of a shapefile: its 'prec' column when the .dbf is there, AREA_BY_RECORD otherwise
+def polygon_areas(path, shapes):
+    attributes = read_attributes(path)
+    if attributes is not None and 'prec' in attributes:
+        return np.array(attributes['prec'], dtype=np.int64)
+    return np.array([AREA_BY_RECORD[shape.record] for shape in shapes], dtype=np.int64)
+
+
+# Point-in-polygon lookup over a uniform grid of horizontal bands
+# Every polygon edge is stored in the bands its y-range covers; the crossing number of a point (a ray cast
+# towards +x) then only needs the edges of its own band, and all rings of a polygon (holes, islands) are
+# handled by the even-odd rule
+class AreaIndex:
+    def __init__(self, path=AREAS_SHP, n_bands=N_BANDS):
+        shapes = read_shapes(path)
+        self.areas = polygon_areas(path, shapes)
+
+        # Every ring as its list of edges (x1, y1) -> (x2, y2), with the polygon it belongs to
+        starts, ends, owners = [], [], []
+        for polygon, shape in enumerate(shapes):
+            for ring in shape.rings():
+                ring = np.asarray(ring, dtype=np.float64)
+                starts.append(ring[:-1])
+                ends.append(ring[1:])
+                owners.append(np.full(len(ring) - 1, polygon))
+        starts, ends, owners = np.concatenate(starts), np.concatenate(ends), np.concatenate(owners)
+
+        self.xmin, self.ymin = starts.min(axis=0)
+        self.xmax, self.ymax = starts.max(axis=0)
+        self.n_bands = n_bands
+        self.band_height = (self.ymax - self.ymin) / n_bands
+
+        # Edges sorted by band, each edge repeated in every band it spans; band b owns edges offsets[b]:offsets[b + 1]
+        low = self._band(np.minimum(starts[:, 1], ends[:, 1]))
+        high = self._band(np.maximum(starts[:, 1], ends[:, 1]))
+        spans = high - low + 1
+        edge_idx = np.repeat(np.arange(len(starts)), spans)
+        band_idx = np.repeat(low, spans) + np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+        order = np.argsort(band_idx, kind='stable')
+        edge_idx = edge_idx[order]
+        self.offsets = np.searchsorted(band_idx[order], np.arange(n_bands + 1))
+        self.x1, self.y1 = starts[edge_idx, 0], starts[edge_idx, 1]
+        self.x2, self.y2 = ends[edge_idx, 0], ends[edge_idx, 1]
+        self.owners = owners[edge_idx]
+        self.n_polygons = len(shapes)
+
+    def _band(self, y):
+        return np.clip(((y - self.ymin) / self.band_height).astype(np.int64), 0, self.n_bands - 1)
+
+    # Polygon index (or -1) of points that all fall in one band
+    def _locate_band(self, x, y, band):
+        start, stop = self.offsets[band], self.offsets[band + 1]
+        if start == stop:
+            return np.full(len(x), -1)
+        x1, y1, x2, y2 = self.x1[start:stop], self.y1[start:stop], self.x2[start:stop], self.y2[start:stop]
+        one_hot = np.zeros((stop - start, self.n_polygons), dtype=np.float32)
+        one_hot[np.arange(stop - start), self.owners[start:stop]] = 1
+
+        found = np.empty(len(x), dtype=np.int64)
+        step = max(1, MAX_PAIRS // (stop - start))
+        for i in range(0, len(x), step):
+            px, py = x[i:i + step, None], y[i:i + step, None]
+            straddles = (y1 > py) != (y2 > py)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            crossings = (straddles & (px < x_cross)).astype(np.float32) @ one_hot
+            inside = (crossings.astype(np.int64) & 1).astype(bool)
+            found[i:i + step] = np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+        return found
+
+    # Area number of every (lon, lat) point; points outside every area get `outside`
+    def assign(self, lon, lat, outside=0):
+        x = np.asarray(lon, dtype=np.float64)
+        y = np.asarray(lat, dtype=np.float64)
+        result = np.full(len(x), outside, dtype=np.int64)
+        candidates = np.flatnonzero((x >= self.xmin) & (x <= self.xmax) & (y >= self.ymin) & (y <= self.ymax))
+        if not candidates.size:
+            return result
+
+        # Points grouped by band, so every band's edges are read once per batch
+        bands = self._band(y[candidates])
+        order = np.argsort(bands, kind='stable')
+        candidates, bands = candidates[order], bands[order]
+        boundaries = np.flatnonzero(np.diff(bands)) + 1
+        for group in np.split(np.arange(len(candidates)), boundaries):
+            points = candidates[group]
+            polygons = self._locate_band(x[points], y[points], bands[group[0]])
+            result[points[polygons >= 0]] = self.areas[polygons[polygons >= 0]]
+        return result
+
+
+# Re-assigning the area of every incident of a CSV from its coordinates, one chunk at a time
+# Incidents without usable coordinates (the LAPD data uses 0, 0) or outside every area keep their recorded area
+def assign_csv(input_path, output_path, lon_column='LON', lat_column='LAT', area_column='area',
+               chunk_size=CHUNK_SIZE, index=None):
+    index = index or AreaIndex()
+    n_rows = n_changed = 0
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    for i, chunk in enumerate(pd.read_csv(input_path, chunksize=chunk_size)):
+        lon = pd.to_numeric(chunk[lon_column], errors='coerce').to_numpy()
+        lat = pd.to_numeric(chunk[lat_column], errors='coerce').to_numpy()
+        assigned = index.assign(lon, lat, outside=0)
+        if area_column in chunk.columns:
+            recorded = pd.to_numeric(chunk[area_column], errors='coerce').fillna(0).to_numpy(np.int64)
+            n_changed += int(((assigned > 0) & (assigned != recorded)).sum())
+            assigned = np.where(assigned > 0, assigned, recorded)
+        chunk[area_column] = assigned
+        chunk.to_csv(tmp_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        n_rows += len(chunk)
+    os.replace(tmp_path, output_path)
+    return n_rows, n_changed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Assign LAPD areas to incidents from their coordinates using Areas.shp')
+    parser.add_argument('input', help='Incident CSV with longitude/latitude columns')
+    parser.add_argument('output', help='Where to write the incidents with corrected areas')
+    parser.add_argument('--lon-column', default='LON')
+    parser.add_argument('--lat-column', default='LAT')
+    parser.add_argument('--area-column', default='area', help='Area column to correct (or create)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--shapefile', default=AREAS_SHP)
+    args = parser.parse_args()
+
+    n_rows, n_changed = assign_csv(args.input, args.output, args.lon_column, args.lat_column, args.area_column,
+                                   args.chunk_size, AreaIndex(args.shapefile))
+    print(f'{n_rows} incidents written to {args.output}, {n_changed} moved to another area')
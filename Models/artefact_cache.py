@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+import joblib
+from crime_data import CACHE_DIR
+
+# Fitted models, scalers and predictions of previous runs, one folder per key
+ARTEFACT_CACHE_DIR = os.path.join(CACHE_DIR, 'artefacts')
+
+# Total size the cache may grow to before the least recently used entries are removed
+DEFAULT_BUDGET_BYTES = 4 * 1024 ** 3
+
+# Written last into every entry; folders without it are unfinished and ignored
+META_FILE = 'meta.json'
+
+# Age after which an unfinished entry is taken to belong to a run that was killed mid-store
+STALE_TMP_SECONDS = 60 * 60
+
+
+# Feeding one part of a key into the hash; arrays and frames are hashed by content, not identity
+def _update(digest, part):
+    if isinstance(part, pd.DataFrame):
+        digest.update(json.dumps([str(column) for column in part.columns]).encode())
+        for column in part.columns:
+            _update(digest, part[column].to_numpy())
+    elif isinstance(part, pd.Series):
+        _update(digest, part.to_numpy())
+    elif isinstance(part, np.ndarray):
+        array = np.ascontiguousarray(part)
+        digest.update(f'{array.dtype.str}:{array.shape}'.encode())
+        digest.update(array.tobytes())
+    else:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+    digest.update(b'|')
+
+
+# Key of a training run: hash of its input data, preprocessing steps and hyperparameters
+def artefact_key(*parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        _update(digest, part)
+    return digest.hexdigest()
+
+
+# Folder size in bytes
+def _entry_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+# Content-addressed store of training artefacts with least-recently-used eviction under a size budget
+class ArtefactCache:
+    def __init__(self, directory=ARTEFACT_CACHE_DIR, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    # Folder of a complete entry (marking it as just used), or None on a miss
+    def lookup(self, key):
+        meta_path = os.path.join(self.path(key), META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        # The meta file's modification time doubles as the entry's last use
+        os.utime(meta_path)
+        return self.path(key)
+
+    def meta(self, entry):
+        with open(os.path.join(entry, META_FILE)) as f:
+            return json.load(f)
+
+    def load_array(self, entry, name, mmap_mode=None):
+        return np.load(os.path.join(entry, f'{name}.npy'), mmap_mode=mmap_mode)
+
+    def load_object(self, entry, name):
+        return joblib.load(os.path.join(entry, f'{name}.joblib'))
+
+    # Copying files or folders out of an entry to where the scripts expect them
+    def restore(self, entry, destinations):
+        for name, destination in destinations.items():
+            source = os.path.join(entry, name)
+            if os.path.isdir(source):
+                shutil.copytree(source, destination, dirs_exist_ok=True)
+            else:
+                if not os.path.exists(os.path.dirname(destination)):
+                    os.makedirs(os.path.dirname(destination))
+                shutil.copy2(source, destination)
+
+    # Adding an entry from existing files or folders, arrays, picklable objects (fitted estimators, scalers)
+    # and JSON metadata, then enforcing the budget
+    # The entry is assembled in a temporary folder and renamed into place, so readers never see half of it
+    def store(self, key, files=None, arrays=None, objects=None, meta=None):
+        entry = self.path(key)
+        tmp_entry = f'{entry}.{os.getpid()}.tmp'
+        os.makedirs(tmp_entry)
+        for name, source in (files or {}).items():
+            if os.path.isdir(source):
+                shutil.copytree(source, os.path.join(tmp_entry, name))
+            else:
+                shutil.copy2(source, os.path.join(tmp_entry, name))
+        for name, array in (arrays or {}).items():
+            np.save(os.path.join(tmp_entry, f'{name}.npy'), np.asarray(array))
+        for name, obj in (objects or {}).items():
+            joblib.dump(obj, os.path.join(tmp_entry, f'{name}.joblib'))
+        with open(os.path.join(tmp_entry, META_FILE), 'w') as f:
+            json.dump({'key': key, 'created': time.time(), **(meta or {})}, f)
+
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.replace(tmp_entry, entry)
+        self.evict(keep=(key,))
+        return entry
+
+    # Complete entries as (last used, size, key), oldest first
+    def entries(self):
+        if not os.path.exists(self.directory):
+            return []
+        entries = []
+        for key in os.listdir(self.directory):
+            meta_path = os.path.join(self.directory, key, META_FILE)
+            if os.path.exists(meta_path):
+                entries.append((os.path.getmtime(meta_path), _entry_size(self.path(key)), key))
+        return sorted(entries)
+
+    # Removing temporary folders left behind by stores that never finished
+    def remove_stale(self, max_age=STALE_TMP_SECONDS):
+        if not os.path.exists(self.directory):
+            return []
+        removed = []
+        for name in os.listdir(self.directory):
+            tmp_entry = os.path.join(self.directory, name)
+            if name.endswith('.tmp') and time.time() - os.path.getmtime(tmp_entry) > max_age:
+                shutil.rmtree(tmp_entry, ignore_errors=True)
+                removed.append(name)
+        return removed
+
+    # Removing the least recently used entries until the cache fits its budget
+    def evict(self, keep=()):
+        self.remove_stale()
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, key in entries:
+            if total <= self.budget_bytes:
+                break
+            if key in keep:
+                continue
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= size
+            removed.append(key)
+        return removed
+
+    def clear(self):
+        self.remove_stale(max_age=0)
+        for _, _, key in self.entries():
+            shutil.rmtree(self.path(key), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect or trim the training artefact cache')
+    parser.add_argument('--budget-mb', type=float, help='Evict least recently used entries down to this size')
+    parser.add_argument('--clear', action='store_true', help='Remove every entry')
+    args = parser.parse_args()
+
+    cache = ArtefactCache()
+    if args.clear:
+        cache.clear()
+    elif args.budget_mb is not None:
+        cache.budget_bytes = int(args.budget_mb * 1024 ** 2)
+        print(f'Evicted {len(cache.evict())} entries')
+
+    for last_used, size, key in cache.entries():
+        meta = cache.meta(cache.path(key))
+        print(f'{key}  {meta.get("model", "?"):6}  {size / 1024 ** 2:10.1f} MB  last used {time.ctime(last_used)}')
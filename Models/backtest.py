@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from crime_data import CACHE_DIR, COLUMNS, EVALUATION_DIR, META_FILE, load_cube
+from evaluation import regression_metrics
+from numpy_inference import ExportedScaler, inverse_scale_counts
+from run_log import single_threaded_workers, start_run
+
+# Row table shared by the workers and the predictions of every fold already run
+BACKTEST_CACHE_DIR = os.path.join(CACHE_DIR, 'backtest')
+
+BACKTEST_MODELS = ['lr', 'rf', 'knn', 'svr', 'ann', 'lstm']
+
+# Feature columns of each model, as in its script (the ANN and LSTM also scale total_crimes with them)
+FEATURES = {
+    'rf': ['area', 'year', 'month', 'agg_id'],
+    'knn': ['area', 'year', 'month', 'agg_id'],
+    'svr': ['month', 'area', 'agg_id'],
+    'ann': ['month', 'area', 'agg_id', 'total_crimes'],
+    'lstm': ['month', 'area', 'agg_id', 'total_crimes']
+}
+
+# Months per fold step
+STEP_MONTHS = {'month': 1, 'year': 12}
+
+# Per-period statistics of every column; they add up (or reduce) over periods, so the scalers of any
+# fold are computed from its periods' statistics without reading its rows
+PERIOD_STATISTICS = ['n', 'sum', 'sum_squares', 'min', 'max']
+
+
+# Every cell of the crime cube as an (area, year, month, agg_id, total_crimes) row, ordered by period
+# (year, month) and then area and agg_id, so the rows of any run of months are one contiguous slice
+# The table is memory-mapped, so every worker process reads the same read-only pages
+class PeriodRows:
+    def __init__(self, rows, years, months, n_areas, n_aggs, stats):
+        self.rows = rows
+        self.years = years
+        self.months = months
+        self.n_areas = n_areas
+        self.n_aggs = n_aggs
+        self.stats = stats
+        self.period_size = n_areas * n_aggs
+        self.n_periods = len(years) * len(months)
+
+    # Rows of periods start..stop-1, without copying
+    def slice(self, start, stop, columns=COLUMNS):
+        block = self.rows[start * self.period_size:stop * self.period_size]
+        return block[:, [COLUMNS.index(column) for column in columns]] if list(columns) != COLUMNS else block
+
+    # Year and month of a period, as text
+    def label(self, period):
+        year, month = divmod(period, len(self.months))
+        return f'{self.years[year]}-{self.months[month]:02d}'
+
+    # Min-max (0, 1) scaler of the rows of periods start..stop-1, as MinMaxScaler would fit it
+    def minmax_scaler(self, columns, start, stop):
+        idx = [COLUMNS.index(column) for column in columns]
+        minimum = self.stats['min'][start:stop, idx].min(axis=0)
+        data_range = self.stats['max'][start:stop, idx].max(axis=0) - minimum
+        scale = 1 / np.where(data_range > 0, data_range, 1)
+        return ExportedScaler(-minimum * scale, scale)
+
+    # Standardising scaler of the rows of periods start..stop-1, as StandardScaler would fit it
+    def standard_scaler(self, columns, start, stop):
+        idx = [COLUMNS.index(column) for column in columns]
+        n = self.stats['n'][start:stop].sum()
+        mean = self.stats['sum'][start:stop, idx].sum(axis=0) / n
+        variance = np.clip(self.stats['sum_squares'][start:stop, idx].sum(axis=0) / n - mean ** 2, 0, None)
+        scale = 1 / np.where(variance > 0, np.sqrt(variance), 1)
+        return ExportedScaler(-mean * scale, scale)
+
+    # Counts as [area, agg_id, period], the layout trend_forecast.py fits
+    def counts_by_series(self):
+        counts = self.rows[:, COLUMNS.index('total_crimes')].reshape(self.n_periods, self.n_areas, self.n_aggs)
+        return counts.transpose(1, 2, 0)
+
+    # Monthly sequences [series, period, features] in the layout of windowing.series_from_cube
+    def series(self, columns):
+        values = self.slice(0, self.n_periods, columns).reshape(self.n_periods, self.n_areas * self.n_aggs, len(columns))
+        return np.ascontiguousarray(values.transpose(1, 0, 2), dtype=np.float32)
+
+
+# Key of the row table: the source signature of the crime cube it was built from
+def _rows_key():
+    with open(os.path.join(CACHE_DIR, META_FILE)) as f:
+        source = json.load(f)['source']
+    return hashlib.sha1(json.dumps(source, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# Rows and per-period statistics of a [area, year, month, agg_id] count cube
+def period_rows_arrays(counts, areas, years, months, agg_ids):
+    n_areas, n_years, n_months, n_aggs = np.shape(counts)
+    area_idx, agg_idx = np.divmod(np.arange(n_areas * n_aggs), n_aggs)
+    n_periods = n_years * n_months
+    rows = np.empty((n_periods, n_areas * n_aggs, len(COLUMNS)), dtype=np.float64)
+    rows[:, :, 0] = np.asarray(areas)[area_idx]
+    rows[:, :, 1] = np.repeat(years, n_months)[:, None]
+    rows[:, :, 2] = np.tile(months, n_years)[:, None]
+    rows[:, :, 3] = np.asarray(agg_ids)[agg_idx]
+    rows[:, :, 4] = np.asarray(counts).transpose(1, 2, 0, 3).reshape(n_periods, -1)
+
+    stats = {
+        'n': np.full(n_periods, n_areas * n_aggs, dtype=np.float64),
+        'sum': rows.sum(axis=1),
+        'sum_squares': (rows ** 2).sum(axis=1),
+        'min': rows.min(axis=1),
+        'max': rows.max(axis=1)
+    }
+    return rows.reshape(-1, len(COLUMNS)), stats
+
+
+# Building the row table and its per-period statistics once for the current cube
+def build_period_rows(cube, path):
+    rows, stats = period_rows_arrays(cube.counts, cube.areas, cube.years, cube.months, cube.agg_ids)
+    np.savez(f'{path}.stats.{os.getpid()}.npz', **stats)
+    os.replace(f'{path}.stats.{os.getpid()}.npz', f'{path}.stats.npz')
+    # The rows are written last, so their presence means the statistics are complete
+    np.save(f'{path}.{os.getpid()}.npy', rows)
+    os.replace(f'{path}.{os.getpid()}.npy', f'{path}.npy')
+
+
+# Opening the row table of the current cube, building it first if needed
+def load_period_rows(cache_dir=BACKTEST_CACHE_DIR):
+    cube = load_cube()
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f'period_rows_{_rows_key()}')
+    if not os.path.exists(f'{path}.npy'):
+        build_period_rows(cube, path)
+    with np.load(f'{path}.stats.npz') as data:
+        stats = {name: data[name] for name in PERIOD_STATISTICS}
+    return PeriodRows(np.load(f'{path}.npy', mmap_mode='r'), cube.years, cube.months,
+                      len(cube.areas), len(cube.agg_ids), stats)
+
+
+# Hyperparameters of a model as its script uses them, with overrides (--params) on top
+# They are imported where the scripts keep them, only when asked for, since ann_training.py needs TensorFlow;
+# LSTM.py keeps its own at the top of the script, so they are repeated here
+def model_params(model, overrides=None):
+    if model == 'rf':
+        from forest_export import RF_PARAMS
+        # Without the out-of-bag score RFRST.py reports, which every fold would pay for without using it
+        params = {name: value for name, value in RF_PARAMS.items() if name != 'oob_score'}
+    elif model == 'svr':
+        from svr_engines import C, EPSILON
+        params = {'C': C, 'epsilon': EPSILON}
+    elif model == 'ann':
+        from ann_training import ANN_PARAMS
+        params = {**ANN_PARAMS, 'seed': 74}
+    elif model == 'lstm':
+        params = {'units': 100, 'learning_rate': 0.01, 'epochs': 5, 'batch_size': 90, 'n_in': 1, 'seed': 73}
+    elif model == 'knn':
+        params = {'n_neighbors': 2}
+    else:
+        params = {}
+    return {**params, **(overrides or {})}
+
+
+# Folds as (train start, test start, test stop) periods; the test months always follow the training ones
+# expanding: training always starts at the first month; rolling: the latest `window` months only
+def make_folds(n_periods, scheme='expanding', step='year', min_train=12, window=None, horizon=None):
+    unit = STEP_MONTHS[step]
+    horizon = horizon or unit
+    window = window or min_train
+    folds = []
+    for cut in range(min_train, n_periods - horizon + 1, unit):
+        start = 0 if scheme == 'expanding' else max(0, cut - window)
+        folds.append((start, cut, cut + horizon))
+    return folds
+
+
+# Starting the predict stage of a fold when a run log is passed, so scaling_benchmark.py times fit and predict apart
+def _begin(run, stage):
+    if run is not None:
+        run.begin(stage)
+
+
+# Linear trend of every (area, crime category) series over the training months, as in trend_forecast.py
+def _fit_predict_lr(data, fold, params, run=None):
+    from trend_forecast import extend_trends, fit_trends
+    start, cut, stop = fold
+    series = data.counts_by_series()[..., start:cut]
+    slope, intercept, n = fit_trends(series, series > 0)
+    _begin(run, 'predict')
+    # Series never recorded in the training months were not fitted by the notebook; they forecast nothing
+    predictions = np.where(n[..., None] > 0, extend_trends(slope, intercept, n, stop - cut), 0)
+    return predictions.transpose(2, 0, 1).reshape(-1)
+
+
+# The forest is single-threaded here, the folds themselves run in parallel
+def _fit_predict_rf(data, fold, params, run=None):
+    from sklearn.ensemble import RandomForestRegressor
+    start, cut, stop = fold
+    forest = RandomForestRegressor(**params, n_jobs=1)
+    forest.fit(data.slice(start, cut, FEATURES['rf']), data.slice(start, cut, ['total_crimes'])[:, 0])
+    _begin(run, 'predict')
+    return forest.predict(data.slice(cut, stop, FEATURES['rf']))
+
+
+def _fit_predict_knn(data, fold, params, run=None):
+    from knn_index import CosineKNNRegressor
+    start, cut, stop = fold
+    # Each fold's tree is used once, so it is not kept in the KNN cache
+    knn = CosineKNNRegressor(n_jobs=1, cache_dir=None, **params)
+    knn.fit(data.slice(start, cut, FEATURES['knn']), data.slice(start, cut, ['total_crimes'])[:, 0])
+    _begin(run, 'predict')
+    return knn.predict(data.slice(cut, stop, FEATURES['knn']))
+
+
+def _fit_predict_svr(data, fold, params, run=None):
+    from svr_engines import make_svr
+    start, cut, stop = fold
+    scaler = data.standard_scaler(FEATURES['svr'], start, cut)
+    svr = make_svr('exact', n_features=len(FEATURES['svr']), **params)
+    svr.fit(scaler.transform(data.slice(start, cut, FEATURES['svr'])), data.slice(start, cut, ['total_crimes'])[:, 0])
+    _begin(run, 'predict')
+    return svr.predict(scaler.transform(data.slice(cut, stop, FEATURES['svr'])))
+
+
+def _fit_predict_ann(data, fold, params, run=None):
+    import tensorflow as tf
+    from ann_training import build_ann
+    start, cut, stop = fold
+    tf.random.set_seed(params['seed'])
+    scaler = data.minmax_scaler(FEATURES['ann'], start, cut)
+    train = scaler.transform(data.slice(start, cut, FEATURES['ann']))
+    model = build_ann(params, train.shape[1] - 1)
+    model.fit(train[:, :-1], train[:, -1], epochs=params['epochs'], batch_size=params['batch_size'], verbose=0)
+    _begin(run, 'predict')
+    test = scaler.transform(data.slice(cut, stop, FEATURES['ann']))
+    return inverse_scale_counts(scaler, model.predict(test[:, :-1], verbose=0))
+
+
+# One-month-ahead LSTM: each test month is predicted from the n_in months before it, as LSTM.py does for 2019
+def _fit_predict_lstm(data, fold, params, run=None):
+    import tensorflow as tf
+    from windowing import SeriesWindows, scale_series
+    start, cut, stop = fold
+    tf.random.set_seed(params['seed'])
+    scaler = data.minmax_scaler(FEATURES['lstm'], start, cut)
+    series = scale_series(data.series(FEATURES['lstm'])[:, :stop], scaler)
+
+    train_windows = SeriesWindows(series[:, start:cut], n_in=params['n_in'], n_out=1)
+    X_train, y_train = train_windows.take(np.arange(len(train_windows)))
+    model = tf.keras.Sequential()
+    model.add(tf.keras.layers.Input(shape=(params['n_in'], series.shape[2])))
+    model.add(tf.keras.layers.LSTM(params['units']))
+    model.add(tf.keras.layers.Dense(1))
+    model.compile(loss='mae', optimizer=tf.keras.optimizers.Adam(learning_rate=params['learning_rate']))
+    model.fit(X_train, y_train, epochs=params['epochs'], batch_size=params['batch_size'], verbose=0)
+    _begin(run, 'predict')
+
+    # Test samples in row order: period-major, then series
+    windows = SeriesWindows(series, n_in=params['n_in'], n_out=1)
+    series_idx = np.tile(np.arange(series.shape[0]), stop - cut)
+    time_idx = np.repeat(np.arange(cut, stop), series.shape[0])
+    X_test, _ = windows.take(windows.sample_index(series_idx, time_idx))
+    return inverse_scale_counts(scaler, model.predict(X_test, verbose=0))
+
+
+FIT_PREDICT = {
+    'lr': _fit_predict_lr,
+    'rf': _fit_predict_rf,
+    'knn': _fit_predict_knn,
+    'svr': _fit_predict_svr,
+    'ann': _fit_predict_ann,
+    'lstm': _fit_predict_lstm
+}
+
+
+# Where the test predictions of one model and fold are kept, keyed by the row table, parameters and periods
+def _fold_path(cache_dir, rows_key, model, params, fold):
+    params_key = hashlib.sha1(json.dumps([model, params], sort_keys=True).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, 'folds', rows_key, f'{model}_{params_key}_{fold[0]}_{fold[1]}_{fold[2]}.npy')
+
+
+# One worker process: fitting a model on a fold's training months and saving its test predictions
+def run_fold(model, params, fold, path, cache_dir=BACKTEST_CACHE_DIR):
+    start_time = time.perf_counter()
+    predictions = np.asarray(FIT_PREDICT[model](load_period_rows(cache_dir), fold, params), dtype=np.float64).reshape(-1)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.save(f'{path}.{os.getpid()}.npy', predictions)
+    os.replace(f'{path}.{os.getpid()}.npy', path)
+    return time.perf_counter() - start_time
+
+
+# Running every (model, fold) pair not already cached across a process pool, then scoring all of them
+def backtest(models, scheme='expanding', step='year', min_train=12, window=None, horizon=None, workers=None,
+             params=None, cache_dir=BACKTEST_CACHE_DIR):
+    data = load_period_rows(cache_dir)
+    rows_key = _rows_key()
+    folds = make_folds(data.n_periods, scheme, step, min_train, window, horizon)
+    settings = {model: model_params(model, (params or {}).get(model)) for model in models}
+
+    jobs = [(model, fold, _fold_path(cache_dir, rows_key, model, settings[model], fold))
+            for model in models for fold in folds]
+    pending = [job for job in jobs if not os.path.exists(job[2])]
+    print(f'{len(folds)} {scheme} folds by {step}, {len(models)} models: '
+          f'{len(jobs) - len(pending)} fold fits cached, {len(pending)} to run')
+
+    seconds = {}
+    if pending:
+        context = multiprocessing.get_context('spawn')
+        # Parallelism comes from the worker processes, so each one keeps its libraries single-threaded
+        with single_threaded_workers(), \
+                ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as executor:
+            futures = {executor.submit(run_fold, model, settings[model], fold, path, cache_dir): (model, fold)
+                       for model, fold, path in pending}
+            for future, job in futures.items():
+                seconds[job] = future.result()
+
+    results = []
+    for model, fold, path in jobs:
+        start, cut, stop = fold
+        actual = data.slice(cut, stop, ['total_crimes'])[:, 0]
+        results.append({
+            'Model': model, 'Train Start': data.label(start), 'Train End': data.label(cut - 1),
+            'Test Start': data.label(cut), 'Test End': data.label(stop - 1),
+            'Train Rows': (cut - start) * data.period_size, 'Test Rows': len(actual),
+            **regression_metrics(actual, np.load(path)), 'Seconds': seconds.get((model, fold))
+        })
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Walk-forward backtesting of the models over every month of the crime cube')
+    parser.add_argument('--models', nargs='+', choices=BACKTEST_MODELS, default=['lr', 'knn', 'svr'])
+    parser.add_argument('--scheme', choices=['expanding', 'rolling'], default='expanding')
+    parser.add_argument('--step', choices=sorted(STEP_MONTHS), default='year', help='Distance between folds (and default test length)')
+    parser.add_argument('--min-train', type=int, default=12, help='Training months of the first fold')
+    parser.add_argument('--window', type=int, help='Training months of a rolling fold (default: --min-train)')
+    parser.add_argument('--horizon', type=int, help='Test months per fold (default: one step)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: all cores)')
+    parser.add_argument('--params', type=json.loads, default={}, help='Parameter overrides per model, e.g. \'{"rf": {"n_estimators": 200}}\'')
+    parser.add_argument('--output', help='CSV of the per-fold metrics (default: Model Evaluation/backtest_<scheme>_<step>.csv)')
+    args = parser.parse_args()
+    run = start_run()
+
+    run.begin('backtest')
+    results = backtest(args.models, args.scheme, args.step, args.min_train, args.window, args.horizon, args.workers, args.params)
+    run.begin('write')
+    output = args.output or os.path.join(EVALUATION_DIR, f'backtest_{args.scheme}_{args.step}.csv')
+    results.round(3).to_csv(output, index=False)
+    print(results.groupby('Model')[['MSE', 'RMSE', 'MAE', 'R-squared', 'R']].mean().round(3))
+    print(f'Per-fold metrics written to {output}')
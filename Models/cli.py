@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import argparse
+
+# Single entry point for every model: python Models/cli.py [--data-dir ...] {train,predict,evaluate,export} ...
+# Only os, sys and argparse are imported up front; numpy, pandas, sklearn and TensorFlow are imported
+# inside the command that needs them, so e.g. 'evaluate' never waits on a TensorFlow import
+
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS = ['lr', 'rf', 'knn', 'svr', 'ann', 'lstm']
+
+# Script that trains each model (and writes its predictions, metrics and plots)
+TRAIN_SCRIPTS = {
+    'lr': 'trend_forecast.py',
+    'rf': 'RFRST.py',
+    'knn': 'KNN.py',
+    'svr': 'SVR.py',
+    'ann': 'ANN.py',
+    'lstm': 'LSTM.py'
+}
+
+# Models with a saved model the predict command can reuse; the others are refitted by their script
+# (KNN is fitted instantly and SVR reuses its artefact cache entry)
+SAVED_MODELS = ['lr', 'rf', 'ann', 'lstm']
+
+# Models that can be exported to flat NumPy files (numpy_inference.py)
+EXPORTABLE_MODELS = ['ann', 'lstm']
+
+# Command line options overriding the data folders, and the environment variables crime_data.py reads them from
+PATH_OPTIONS = {
+    'data_dir': 'CRIME_DATA_DIR',
+    'predictions_dir': 'CRIME_PREDICTIONS_DIR',
+    'cache_dir': 'CRIME_CACHE_DIR'
+}
+
+
+# Running a model script as if it had been started directly, with its own command line options
+def run_script(script, script_args):
+    import runpy
+    path = os.path.join(MODELS_DIR, script)
+    argv = sys.argv
+    sys.argv = [path] + list(script_args)
+    try:
+        runpy.run_path(path, run_name='__main__')
+    finally:
+        sys.argv = argv
+
+
+def train(args):
+    run_script(TRAIN_SCRIPTS[args.model], args.script_args)
+
+
+# Test set predictions of a saved model, in the layout of the CSV its training script writes
+def saved_model_predictions(model, engine='auto'):
+    import numpy as np
+    from crime_data import load_cube, load_split
+
+    if model == 'lr':
+        from trend_forecast import trend_predictions
+        return trend_predictions()
+
+    if model == 'rf':
+        from crime_data import SCRIPTS_DIR
+        from forest_export import FlatForest
+        forest_dir = os.path.join(SCRIPTS_DIR, 'RFRST', 'forest')
+        if not os.path.exists(os.path.join(forest_dir, 'forest.json')):
+            raise SystemExit(f'No exported forest in {forest_dir}, run "train rf" first')
+        test_df = load_split('test')
+        forest = FlatForest(forest_dir)
+        test_df['rf_prediction'] = forest.predict(test_df.drop(columns=['total_crimes']).to_numpy(), n_jobs=-1)
+        return test_df
+
+    from prediction_service import LstmPredictor
+    from numpy_inference import inverse_scale_counts, load_network
+    from windowing import series_positions
+    test_data = load_split('test', drop_year=True, columns=['Area', 'Month', 'Crime_Category', 'Total_Crimes'])
+    if model == 'ann':
+        network, scaler = load_network('ann', engine)
+        scaled = scaler.transform(test_data[['Month', 'Area', 'Crime_Category', 'Total_Crimes']].to_numpy())
+        predictions = network.predict_on_batch(np.asarray(scaled[:, :3], dtype=np.float32))
+    else:
+        # The months leading up to every test row, as LSTM.py feeds them
+        cube = load_cube()
+        predictor = LstmPredictor('lstm', cube, engine)
+        area_idx, year_idx, month_idx, agg_idx = cube.indices('test')
+        series_idx, time_idx = series_positions(area_idx, year_idx, month_idx, agg_idx, len(cube.months), len(cube.agg_ids))
+        X, _ = predictor.windows.take(predictor.windows.sample_index(series_idx, time_idx))
+        predictions, scaler = predictor.model.predict_on_batch(X), predictor.scaler
+    test_data['Predicted_Crimes'] = inverse_scale_counts(scaler, predictions)
+    return test_data
+
+
+def predict(args):
+    if args.model not in SAVED_MODELS:
+        print(f'{args.model} keeps no saved model, running {TRAIN_SCRIPTS[args.model]} instead')
+        run_script(TRAIN_SCRIPTS[args.model], [])
+        return
+
+    from crime_data import PREDICTIONS_DIR, PREDICTION_FILES
+    predictions = saved_model_predictions(args.model, args.engine)
+    output = args.output or os.path.join(PREDICTIONS_DIR, PREDICTION_FILES[args.model][0])
+    predictions.to_csv(output, index=False)
+    print(f'{len(predictions)} {args.model} predictions written to {output}')
+
+
+def evaluate(args):
+    from evaluation import merge_predictions, model_stats_table, write_evaluation
+    from crime_data import EVALUATION_DIR
+    output_dir = args.output_dir or EVALUATION_DIR
+    source = args.input if args.input else merge_predictions(args.models)
+    results = write_evaluation(source, output_dir)
+    print(model_stats_table(results[()]))
+
+
+def export(args):
+    from numpy_inference import EXPORT_FILES, SOURCE_FILES, check_parity, export_model
+    for model in args.models:
+        layers = export_model(*SOURCE_FILES[model], EXPORT_FILES[model])
+        print(f'{model}: {" -> ".join(layer["type"] for layer in layers)} written to {EXPORT_FILES[model]}')
+        error = check_parity(model)
+        print(f'{model}: matches Keras to {error:.2e}' if error is not None else f'{model}: TensorFlow not installed, parity not checked')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Train, predict with, evaluate and export the crime prediction models')
+    parser.add_argument('--data-dir', help='Folder with train_set.csv and test_set.csv (default: Data)')
+    parser.add_argument('--predictions-dir', help='Folder of the prediction CSVs (default: <data dir>/Model Predictions)')
+    parser.add_argument('--cache-dir', help='Folder of the cube and artefact caches (default: <data dir>/Cache)')
+    parser.add_argument('--timing', action='store_true', help='Print how long the command took')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = commands.add_parser('train', help='Train a model with its script, passing any further options on to it')
+    train_parser.add_argument('model', choices=MODELS)
+    train_parser.add_argument('script_args', nargs=argparse.REMAINDER, help='Options of the model script (e.g. --budgeted for ann)')
+    train_parser.set_defaults(handler=train)
+
+    predict_parser = commands.add_parser('predict', help='Predict the test set with a saved model, without retraining')
+    predict_parser.add_argument('model', choices=MODELS)
+    predict_parser.add_argument('--engine', choices=['auto', 'numpy', 'keras'], default='auto', help='How the ANN/LSTM are evaluated')
+    predict_parser.add_argument('--output', help='CSV to write (default: the model\'s prediction CSV)')
+    predict_parser.set_defaults(handler=predict)
+
+    evaluate_parser = commands.add_parser('evaluate', help='Metrics of the existing prediction CSVs')
+    evaluate_parser.add_argument('--models', nargs='+', choices=MODELS, default=MODELS)
+    evaluate_parser.add_argument('--input', help='Merged predictions CSV to evaluate instead of the per-model CSVs')
+    evaluate_parser.add_argument('--output-dir', help='Folder of the metric CSVs (default: Model Evaluation)')
+    evaluate_parser.set_defaults(handler=evaluate)
+
+    export_parser = commands.add_parser('export', help='Export the ANN/LSTM to NumPy files for TensorFlow-free inference')
+    export_parser.add_argument('--models', nargs='+', choices=EXPORTABLE_MODELS, default=EXPORTABLE_MODELS)
+    export_parser.set_defaults(handler=export)
+    return parser
+
+
+def main(argv=None):
+    start = time.perf_counter()
+    args = build_parser().parse_args(argv)
+
+    # Set before any project module is imported, so crime_data picks the folders up
+    for option, variable in PATH_OPTIONS.items():
+        if getattr(args, option):
+            os.environ[variable] = os.path.abspath(getattr(args, option))
+
+    args.handler(args)
+    if args.timing:
+        print(f'{args.command} took {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Project folders, resolved relative to the repository instead of a fixed Windows path
+# The data, predictions and cache folders can be moved with the CRIME_*_DIR environment variables (see cli.py)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.environ.get('CRIME_DATA_DIR', os.path.join(BASE_DIR, 'Data'))
+PREDICTIONS_DIR = os.environ.get('CRIME_PREDICTIONS_DIR', os.path.join(DATA_DIR, 'Model Predictions'))
+EVALUATION_DIR = os.path.join(PREDICTIONS_DIR, 'Model Evaluation')
+SCRIPTS_DIR = os.path.join(BASE_DIR, 'Scripts')
+CACHE_DIR = os.environ.get('CRIME_CACHE_DIR', os.path.join(DATA_DIR, 'Cache'))
+
+# Train/test splits extracted in the Data Analysis notebook
+SPLIT_FILES = {'train': 'train_set.csv', 'test': 'test_set.csv'}
+COLUMNS = ['area', 'year', 'month', 'agg_id', 'total_crimes']
+
+# Prediction CSV of every model and how its columns map onto area, month, agg_id, total_crimes, prediction
+PREDICTION_FILES = {
+    'lr': ('linear_regression_predictions.csv', {'Area': 'area', 'Month': 'month', 'Agg_id': 'agg_id',
+                                                 'Total_crimes': 'total_crimes', 'Lr_prediction': 'prediction'}),
+    'rf': ('random_forest_predictions.csv', {'rf_prediction': 'prediction'}),
+    'knn': ('KNN_predictions.csv', {'knn_predictions': 'prediction'}),
+    'svr': ('SVR_predictions.csv', {'predicted_crimes': 'prediction'}),
+    'ann': ('ANN_predictions.csv', {'Area': 'area', 'Month': 'month', 'Crime_Category': 'agg_id',
+                                    'Total_Crimes': 'total_crimes', 'Predicted_Crimes': 'prediction'}),
+    'lstm': ('LSTM_predictions.csv', {'Area': 'area', 'Month': 'month', 'Crime_Category': 'agg_id',
+                                      'Total_Crimes': 'total_crimes', 'Predicted_Crimes': 'prediction'})
+}
+
+# Description of every crime category (agg_des in the crime_data_summary table)
+AGG_DESCRIPTIONS = {
+    300: 'Simple Assault',
+    400: 'Aggrevated Assault',
+    725: 'Robbery',
+    750: 'Burglary',
+    775: 'Theft',
+    800: 'Identity Theft',
+    850: 'Property Crimes/Theft',
+    1700: 'Violation of Restraining/Court Order',
+    1900: 'Damage of Asset',
+    2400: 'Threats & Scares'
+}
+
+# Names of the files making up the cached cube
+CUBE_FILE = 'crime_cube.npy'
+META_FILE = 'crime_cube.json'
+
+# Cubes already opened by this process, keyed by their cache folder
+_open_cubes = {}
+
+
+# Dense area x year x month x agg_id count cube backed by a memory-mapped file
+class CrimeCube:
+    def __init__(self, counts, areas, years, months, agg_ids, rows):
+        self.counts = counts
+        self.areas = areas
+        self.years = years
+        self.months = months
+        self.agg_ids = agg_ids
+        # Flat cube indices of every split, kept in the original CSV row order
+        self.rows = rows
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    # Zero-copy slice of the cube covering a contiguous range of years
+    def view(self, first_year=None, last_year=None):
+        start = 0 if first_year is None else int(np.searchsorted(self.years, first_year, side='left'))
+        stop = len(self.years) if last_year is None else int(np.searchsorted(self.years, last_year, side='right'))
+        return self.counts[:, start:stop]
+
+    # Zero-copy slice of the cube covering the years of one split
+    def split_view(self, split):
+        split_years = self.years[np.unique(self.indices(split)[1])]
+        return self.view(split_years[0], split_years[-1])
+
+    # Cube positions (area, year, month, agg_id indices) of every row of a split
+    def indices(self, split):
+        return np.unravel_index(self.rows[split], self.counts.shape)
+
+    # Axis values (area, year, month, agg_id) of every row of a split
+    def coords(self, split):
+        area_idx, year_idx, month_idx, agg_idx = self.indices(split)
+        return self.areas[area_idx], self.years[year_idx], self.months[month_idx], self.agg_ids[agg_idx]
+
+    # Long-format frame of a split, identical to reading its CSV
+    def table(self, split):
+        area, year, month, agg_id = self.coords(split)
+        total_crimes = self.counts.reshape(-1)[self.rows[split]]
+        return pd.DataFrame({
+            'area': area.astype(np.int64),
+            'year': year.astype(np.int64),
+            'month': month.astype(np.int64),
+            'agg_id': agg_id.astype(np.int64),
+            'total_crimes': total_crimes.astype(np.int64)
+        })
+
+
+# Size and modification time of source files, used to detect a stale cache
+def file_signature(paths):
+    signature = {}
+    for key, path in paths.items():
+        stat = os.stat(path)
+        signature[key] = [os.path.basename(path), stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def _source_signature(data_dir):
+    return file_signature({split: os.path.join(data_dir, file_name) for split, file_name in SPLIT_FILES.items()})
+
+
+# Writing an array next to its final path and moving it into place once complete
+def _save_array(path, array):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=array.dtype, shape=array.shape)
+    out[...] = array
+    out.flush()
+    del out
+    os.replace(tmp_path, path)
+
+
+# Parsing the split CSVs once and caching them as a dense count cube
+def build_cube(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    frames = {split: pd.read_csv(os.path.join(data_dir, file_name), usecols=COLUMNS)
+              for split, file_name in SPLIT_FILES.items()}
+    every_row = pd.concat(frames.values(), ignore_index=True)
+
+    # Axes come from the data, so more areas or crime categories only grow the cube
+    areas = np.sort(every_row['area'].unique())
+    years = np.sort(every_row['year'].unique())
+    months = np.sort(every_row['month'].unique())
+    agg_ids = np.sort(every_row['agg_id'].unique())
+    shape = (len(areas), len(years), len(months), len(agg_ids))
+
+    counts = np.zeros(shape, dtype=np.int32)
+    rows = {}
+    for split, df in frames.items():
+        flat = np.ravel_multi_index((np.searchsorted(areas, df['area'].values),
+                                     np.searchsorted(years, df['year'].values),
+                                     np.searchsorted(months, df['month'].values),
+                                     np.searchsorted(agg_ids, df['agg_id'].values)), shape)
+        counts.reshape(-1)[flat] = df['total_crimes'].values
+        rows[split] = flat.astype(np.int64)
+
+    _save_array(os.path.join(cache_dir, CUBE_FILE), counts)
+    for split, flat in rows.items():
+        _save_array(os.path.join(cache_dir, f'crime_cube_{split}_rows.npy'), flat)
+
+    # The metadata file is written last so a half-written cache is never picked up
+    meta = {
+        'source': _source_signature(data_dir),
+        'areas': areas.tolist(),
+        'years': years.tolist(),
+        'months': months.tolist(),
+        'agg_ids': agg_ids.tolist()
+    }
+    meta_path = os.path.join(cache_dir, META_FILE)
+    with open(f'{meta_path}.{os.getpid()}.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(f'{meta_path}.{os.getpid()}.tmp', meta_path)
+    return meta
+
+
+# Opening the cached cube, rebuilding it first if the CSVs changed since it was written
+def load_cube(data_dir=DATA_DIR, cache_dir=CACHE_DIR, rebuild=False):
+    key = os.path.abspath(cache_dir)
+    if key in _open_cubes and not rebuild:
+        return _open_cubes[key]
+
+    meta_path = os.path.join(cache_dir, META_FILE)
+    meta = None
+    if os.path.exists(meta_path) and not rebuild:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['source'] != _source_signature(data_dir):
+            meta = None
+    if meta is None:
+        meta = build_cube(data_dir, cache_dir)
+
+    counts = np.load(os.path.join(cache_dir, CUBE_FILE), mmap_mode='r')
+    rows = {split: np.load(os.path.join(cache_dir, f'crime_cube_{split}_rows.npy'), mmap_mode='r')
+            for split in SPLIT_FILES}
+    cube = CrimeCube(counts, np.array(meta['areas']), np.array(meta['years']),
+                     np.array(meta['months']), np.array(meta['agg_ids']), rows)
+    _open_cubes[key] = cube
+    return cube
+
+
+# Loading a split as a DataFrame, optionally without 'year' and under the caller's column names
+def load_split(split, drop_year=False, columns=None):
+    df = load_cube().table(split)
+    if drop_year:
+        df.drop('year', axis=1, inplace=True)
+    if columns is not None:
+        df.columns = columns
+    return df
+
+
+# Loading one model's prediction CSV under the common column names
+def load_predictions(model, predictions_dir=PREDICTIONS_DIR):
+    file_name, renames = PREDICTION_FILES[model]
+    df = pd.read_csv(os.path.join(predictions_dir, file_name)).rename(columns=renames)
+    return df[['area', 'month', 'agg_id', 'total_crimes', 'prediction']]
@@ -0,0 +1,159 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from crime_data import EVALUATION_DIR, PREDICTIONS_DIR, SCRIPTS_DIR, load_cube, load_split
+from evaluation import PREDICTION_COLUMNS, print_metrics
+from run_log import start_run
+
+# Per crime category metrics the best model of every category is chosen from (written by evaluation.py)
+SELECTION_FILE = os.path.join(EVALUATION_DIR, 'model_stats_perCrimeType.csv')
+
+# Metrics where a higher value is better; the others (MSE, RMSE, MAE) are minimised
+HIGHER_IS_BETTER = ['R-squared', 'R']
+
+
+# Best model of every crime category, as the last cells of the Data Analysis notebook pick it
+def select_models(path=SELECTION_FILE, metric='MSE', exclude=()):
+    stats = pd.read_csv(path)
+    models = {column: model for model, column in PREDICTION_COLUMNS.items()}
+    stats['model'] = stats['Model'].map(models)
+    stats = stats[stats['model'].notna() & ~stats['model'].isin(exclude)]
+    best = stats.groupby('Crime Category')[metric].idxmax() if metric in HIGHER_IS_BETTER \
+        else stats.groupby('Crime Category')[metric].idxmin()
+    return {int(agg_id): stats.loc[row, 'model'] for agg_id, row in best.items()}
+
+
+# Loaders of every model, each returning a function from a frame of (area, year, month, agg_id) rows to predictions
+# The heavy imports (sklearn, TensorFlow) happen inside, so a model that is never selected is never imported
+def _lr_predictor(cube, engine):
+    from trend_forecast import trend_predictions
+    # The trend forecasts cover the year after the fitted years; series never recorded forecast nothing
+    forecasts = trend_predictions(cube).set_index(['Area', 'Month', 'Agg_id'])['Lr_prediction']
+    return lambda rows: forecasts.reindex(pd.MultiIndex.from_frame(rows[['area', 'month', 'agg_id']])).fillna(0).to_numpy()
+
+
+def _rf_predictor(cube, engine):
+    from forest_export import FlatForest
+    forest_dir = os.path.join(SCRIPTS_DIR, 'RFRST', 'forest')
+    if not os.path.exists(os.path.join(forest_dir, 'forest.json')):
+        raise SystemExit(f'No exported forest in {forest_dir}, run RFRST.py first')
+    forest = FlatForest(forest_dir)
+    return lambda rows: forest.predict(rows[['area', 'year', 'month', 'agg_id']].to_numpy(), n_jobs=-1)
+
+
+def _knn_predictor(cube, engine):
+    from knn_index import CosineKNNRegressor
+    train_data = load_split('train')
+    knn = CosineKNNRegressor(n_neighbors=2).fit(train_data.drop(columns=['total_crimes']), train_data['total_crimes'])
+    return lambda rows: knn.predict(rows[['area', 'year', 'month', 'agg_id']])
+
+
+def _svr_predictor(cube, engine):
+    from svr_engines import C, EPSILON
+    from artefact_cache import ArtefactCache, artefact_key
+    # The SVR fitted by SVR.py, found under the same artefact key
+    train_data = load_split('train', drop_year=True)
+    test_data = load_split('test', drop_year=True)
+    cache = ArtefactCache()
+    entry = cache.lookup(artefact_key('svr', 'exact', train_data[['month', 'area', 'agg_id']], train_data['total_crimes'],
+                                      test_data[['month', 'area', 'agg_id']], ['StandardScaler'],
+                                      {'C': C, 'epsilon': EPSILON}))
+    if entry is None:
+        raise SystemExit('No fitted SVR in the artefact cache, run SVR.py first')
+    svr, scaler = cache.load_object(entry, 'svr'), cache.load_object(entry, 'scaler')
+    return lambda rows: svr.predict(scaler.transform(rows[['month', 'area', 'agg_id']]))
+
+
+# The ANN and LSTM prepare each row as prediction_service.py does, then predict the whole partition at once
+def _network_predictor(predictor):
+    def predict(rows):
+        inputs = [predictor.prepare(area, month, agg_id, year)
+                  for area, year, month, agg_id in rows[['area', 'year', 'month', 'agg_id']].itertuples(index=False)]
+        return predictor.predict_batch(inputs)
+    return predict
+
+
+def _ann_predictor(cube, engine):
+    from prediction_service import AnnPredictor
+    return _network_predictor(AnnPredictor('ann', cube, engine))
+
+
+def _lstm_predictor(cube, engine):
+    from prediction_service import LstmPredictor
+    return _network_predictor(LstmPredictor('lstm', cube, engine))
+
+
+MODEL_LOADERS = {
+    'lr': _lr_predictor,
+    'rf': _rf_predictor,
+    'knn': _knn_predictor,
+    'svr': _svr_predictor,
+    'ann': _ann_predictor,
+    'lstm': _lstm_predictor
+}
+
+
+# Ensemble answering every crime category with the model selected for it
+# A batch is split by selected model, each model predicts its own rows in one call and the results are put back
+# in request order; models are loaded on first use, so models no category selects are never loaded
+class RoutedEnsemble:
+    def __init__(self, selection, cube=None, engine='auto'):
+        self.selection = selection
+        self.cube = cube if cube is not None else load_cube()
+        self.engine = engine
+        self.predictors = {}
+
+    def _predictor(self, model):
+        if model not in self.predictors:
+            self.predictors[model] = MODEL_LOADERS[model](self.cube, self.engine)
+        return self.predictors[model]
+
+    # Model answering every row of a batch
+    def route(self, agg_id):
+        unknown = sorted(set(np.unique(agg_id).tolist()) - set(self.selection))
+        if unknown:
+            raise ValueError(f'No model selected for agg_id {unknown}')
+        return np.array([self.selection[value] for value in np.asarray(agg_id).tolist()], dtype=object)
+
+    # Predictions of (area, month, agg_id) requests, the year defaulting to the latest one in the cube
+    def predict(self, area, month, agg_id, year=None):
+        rows = pd.DataFrame({'area': np.asarray(area, dtype=np.int64), 'month': np.asarray(month, dtype=np.int64),
+                             'agg_id': np.asarray(agg_id, dtype=np.int64)})
+        rows['year'] = int(self.cube.years[-1]) if year is None else np.asarray(year, dtype=np.int64)
+        models = self.route(rows['agg_id'].to_numpy())
+
+        predictions = np.empty(len(rows))
+        for model in pd.unique(models):
+            idx = np.flatnonzero(models == model)
+            predictions[idx] = np.asarray(self._predictor(model)(rows.iloc[idx].reset_index(drop=True)), dtype=np.float64).reshape(-1)
+        return predictions, models
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Predict the test set with the best model of every crime category')
+    parser.add_argument('--selection', default=SELECTION_FILE, help='Per crime category metrics CSV to pick the models from')
+    parser.add_argument('--metric', default='MSE', choices=['MSE', 'RMSE', 'MAE', 'R-squared', 'R'])
+    parser.add_argument('--exclude', nargs='+', default=[], choices=sorted(MODEL_LOADERS), help='Models never to select')
+    parser.add_argument('--engine', choices=['auto', 'numpy', 'keras'], default='auto', help='How the ANN/LSTM are evaluated')
+    parser.add_argument('--output', default=os.path.join(PREDICTIONS_DIR, 'ensemble_predictions.csv'))
+    args = parser.parse_args()
+    run = start_run()
+
+    run.begin('select')
+    selection = select_models(args.selection, args.metric, args.exclude)
+    print('Selected models:', ', '.join(f'{agg_id}: {model}' for agg_id, model in sorted(selection.items())))
+
+    run.begin('predict')
+    ensemble = RoutedEnsemble(selection, engine=args.engine)
+    test_data = load_split('test')
+    predictions, models = ensemble.predict(test_data['area'], test_data['month'], test_data['agg_id'], test_data['year'])
+    test_data['ensemble_prediction'] = predictions
+    test_data['model'] = models
+    run.begin('write')
+    test_data.to_csv(args.output, index=False)
+    print(f'Loaded only {", ".join(ensemble.predictors)}; {len(test_data)} predictions written to {args.output}')
+
+    run.begin('metrics')
+    # Calculate and print the error metrics of the routed predictions, to compare with model_stats.csv
+    print_metrics(test_data['total_crimes'], test_data['ensemble_prediction'])
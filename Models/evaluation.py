@@ -0,0 +1,170 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from crime_data import EVALUATION_DIR, PREDICTIONS_DIR, load_predictions
+
+# Prediction columns of merged_predictions.csv and the model names used in model_stats.csv
+MODEL_NAMES = {
+    'lr_prediction': 'Linear Regression',
+    'rf_predictions': 'Random Forest',
+    'knn_predictions': 'KNN',
+    'ann_predictions': 'ANN',
+    'svr_predictions': 'SVR',
+    'lstm_predictions': 'LSTM'
+}
+
+# Column of every model's predictions in merged_predictions.csv (keys as in crime_data.PREDICTION_FILES)
+PREDICTION_COLUMNS = {
+    'lr': 'lr_prediction',
+    'knn': 'knn_predictions',
+    'rf': 'rf_predictions',
+    'svr': 'svr_predictions',
+    'ann': 'ann_predictions',
+    'lstm': 'lstm_predictions'
+}
+
+# Per-group sums every metric can be derived from; they add up, so coarser groups are sums of finer ones
+STATISTICS = ['n', 'sum_y', 'sum_yy', 'sum_p', 'sum_pp', 'sum_yp', 'sum_ee', 'sum_abs_e']
+
+
+# Sufficient statistics of every (group, model) pair in one vectorised pass
+# actual: [rows], predictions: [rows, models], group_codes: [rows] in 0..n_groups-1
+def sufficient_statistics(actual, predictions, group_codes, n_groups):
+    actual = np.asarray(actual, dtype=np.float64)[:, None]
+    predictions = np.asarray(predictions, dtype=np.float64)
+    errors = actual - predictions
+    actual = np.broadcast_to(actual, predictions.shape)
+    columns = [np.ones_like(predictions), actual, actual ** 2, predictions, predictions ** 2,
+               actual * predictions, errors ** 2, np.abs(errors)]
+
+    # One scatter-add for all statistics and models: [rows, models, statistics] -> [groups, models, statistics]
+    stats = np.zeros((n_groups, predictions.shape[1], len(STATISTICS)))
+    np.add.at(stats, group_codes, np.stack(columns, axis=-1))
+    return stats
+
+
+# MSE, RMSE, MAE, R-squared and Pearson R from sufficient statistics (any leading shape)
+def metrics_from_statistics(stats):
+    n, sum_y, sum_yy, sum_p, sum_pp, sum_yp, sum_ee, sum_abs_e = np.moveaxis(stats, -1, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mse = sum_ee / n
+        ss_tot = sum_yy - sum_y ** 2 / n
+        covariance = n * sum_yp - sum_y * sum_p
+        variance_y = n * sum_yy - sum_y ** 2
+        variance_p = n * sum_pp - sum_p ** 2
+        return {
+            'MSE': mse,
+            'RMSE': np.sqrt(mse),
+            'MAE': sum_abs_e / n,
+            'R-squared': 1 - sum_ee / ss_tot,
+            'R': covariance / np.sqrt(np.clip(variance_y, 0, None) * np.clip(variance_p, 0, None))
+        }
+
+
+# Metrics of a single set of predictions, for the model scripts
+def regression_metrics(actual, predicted):
+    stats = sufficient_statistics(actual, np.asarray(predicted).reshape(-1, 1), np.zeros(len(actual), dtype=np.intp), 1)
+    return {name: float(values[0, 0]) for name, values in metrics_from_statistics(stats).items()}
+
+
+# Printing the usual error metrics of a model script
+def print_metrics(actual, predicted):
+    metrics = regression_metrics(actual, predicted)
+    print("Mean Squared Error (MSE):", metrics['MSE'])
+    print("Root Mean Squared Error (RMSE):", metrics['RMSE'])
+    print("Mean Absolute Error (MAE):", metrics['MAE'])
+    print("R-squared (R2):", metrics['R-squared'])
+    print("Pearson correlation coefficient (R):", metrics['R'])
+    return metrics
+
+
+# Metrics for every model at several grouping levels, all derived from one pass over the rows
+# levels are tuples of columns, e.g. () for overall, ('agg_id',) and ('agg_id', 'area')
+def evaluate(df, prediction_columns=None, levels=((), ('agg_id',), ('agg_id', 'area')), actual='total_crimes'):
+    if prediction_columns is None:
+        prediction_columns = [column for column in MODEL_NAMES if column in df.columns]
+
+    # The finest grouping covers every column used by any level
+    finest = [column for level in levels for column in level]
+    finest = list(dict.fromkeys(finest))
+    if finest:
+        keys, group_codes = np.unique(df[finest].to_numpy(), axis=0, return_inverse=True)
+        group_codes = group_codes.reshape(-1)
+    else:
+        keys, group_codes = np.empty((1, 0)), np.zeros(len(df), dtype=np.intp)
+    leaf_stats = sufficient_statistics(df[actual], df[prediction_columns], group_codes, len(keys))
+
+    results = {}
+    for level in levels:
+        # Coarser levels only re-add the leaf statistics, never the rows
+        positions = [finest.index(column) for column in level]
+        if level:
+            level_keys, level_codes = np.unique(keys[:, positions], axis=0, return_inverse=True)
+            level_codes = level_codes.reshape(-1)
+        else:
+            level_keys, level_codes = np.empty((1, 0)), np.zeros(len(keys), dtype=np.intp)
+        stats = np.zeros((len(level_keys),) + leaf_stats.shape[1:])
+        np.add.at(stats, level_codes, leaf_stats)
+
+        metrics = metrics_from_statistics(stats)
+        frame = pd.DataFrame({
+            **{column: np.repeat(level_keys[:, i], len(prediction_columns)) for i, column in enumerate(level)},
+            'Model': np.tile(prediction_columns, len(level_keys)),
+            **{name: values.reshape(-1) for name, values in metrics.items()}
+        })
+        results[level] = frame
+    return results
+
+
+# Overall metrics in the layout of model_stats.csv (metrics as rows, models as columns)
+def model_stats_table(overall):
+    table = overall.set_index('Model')[['MSE', 'MAE', 'RMSE', 'R-squared', 'R']].T.round(3)
+    table.index = ['MSE', 'MAE', 'RMSE', 'R2', 'R']
+    table.columns = [MODEL_NAMES.get(column, column) for column in table.columns]
+    return table
+
+
+# Per crime category metrics in the layout of model_stats_perCrimeType.csv
+def per_crime_type_table(per_agg_id):
+    table = per_agg_id.rename(columns={'agg_id': 'Crime Category'}).round(3)
+    table['Crime Category'] = table['Crime Category'].astype(np.int64)
+    return table.sort_values(by=['Model', 'MSE'], ascending=[True, True], kind='mergesort')
+
+
+# Joining the prediction CSVs of several models on (area, month, agg_id) in the layout of merged_predictions.csv
+def merge_predictions(models=tuple(PREDICTION_COLUMNS), predictions_dir=PREDICTIONS_DIR):
+    merged = None
+    for model in models:
+        df = load_predictions(model, predictions_dir).rename(columns={'prediction': PREDICTION_COLUMNS[model]})
+        if merged is None:
+            merged = df
+        else:
+            merged = merged.merge(df.drop(columns='total_crimes'), on=['area', 'month', 'agg_id'], how='inner')
+    return merged
+
+
+# Computing every metric table from a merged predictions file (or frame) and writing the evaluation CSVs
+def write_evaluation(input_path=os.path.join(EVALUATION_DIR, 'merged_predictions.csv'), output_dir=EVALUATION_DIR,
+                     prediction_columns=None):
+    df = input_path if isinstance(input_path, pd.DataFrame) else pd.read_csv(input_path)
+    results = evaluate(df, prediction_columns)
+    os.makedirs(output_dir, exist_ok=True)
+    model_stats_table(results[()]).to_csv(os.path.join(output_dir, 'model_stats.csv'), index=True)
+    per_crime_type_table(results[('agg_id',)]).to_csv(os.path.join(output_dir, 'model_stats_perCrimeType.csv'), index=False)
+
+    per_area = results[('agg_id', 'area')].rename(columns={'agg_id': 'Crime Category', 'area': 'Area'}).round(3)
+    per_area[['Crime Category', 'Area']] = per_area[['Crime Category', 'Area']].astype(np.int64)
+    per_area.to_csv(os.path.join(output_dir, 'model_stats_perAreaCrimeType.csv'), index=False)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate every model per crime category and area in one pass')
+    parser.add_argument('--input', default=os.path.join(EVALUATION_DIR, 'merged_predictions.csv'), help='CSV with total_crimes, agg_id, area and prediction columns')
+    parser.add_argument('--output-dir', default=EVALUATION_DIR)
+    parser.add_argument('--columns', nargs='+', help='Prediction columns to evaluate (default: every known model column present)')
+    args = parser.parse_args()
+
+    results = write_evaluation(args.input, args.output_dir, args.columns)
+    print(model_stats_table(results[()]))
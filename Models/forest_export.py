@@ -0,0 +1,88 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Optimised Random Forest parameters obtained from Optuna, fitted by RFRST.py
+RF_PARAMS = {'n_estimators': 1857, 'min_samples_split': 6, 'min_samples_leaf': 2, 'max_features': None,
+             'max_depth': 90, 'bootstrap': True, 'random_state': 0, 'oob_score': True}
+
+# Node arrays written for an exported forest, one memory-mappable .npy file each
+NODE_ARRAYS = ['feature', 'threshold', 'children_left', 'children_right', 'value']
+
+
+# Writing every tree of a fitted RandomForestRegressor as flat node arrays
+# Child indices are local to their tree; roots[t] is where tree t starts in the flat arrays
+def export_forest(forest, directory):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    trees = [estimator.tree_ for estimator in forest.estimators_]
+    node_counts = np.array([tree.node_count for tree in trees], dtype=np.int64)
+    roots = np.concatenate([[0], np.cumsum(node_counts)[:-1]])
+
+    arrays = {
+        'feature': np.concatenate([tree.feature for tree in trees]).astype(np.int32),
+        'threshold': np.concatenate([tree.threshold for tree in trees]).astype(np.float64),
+        'children_left': np.concatenate([tree.children_left for tree in trees]).astype(np.int32),
+        'children_right': np.concatenate([tree.children_right for tree in trees]).astype(np.int32),
+        'value': np.concatenate([tree.value[:, 0, 0] for tree in trees]).astype(np.float64),
+        'roots': roots
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), array)
+
+    meta = {
+        'n_trees': len(trees),
+        'n_nodes': int(node_counts.sum()),
+        'n_features': int(forest.n_features_in_),
+        'max_depth': int(max(tree.max_depth for tree in trees))
+    }
+    with open(os.path.join(directory, 'forest.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+# Forest loaded from the flat node arrays, predicting whole batches with vectorised traversal
+class FlatForest:
+    def __init__(self, directory, mmap_mode='r'):
+        with open(os.path.join(directory, 'forest.json')) as f:
+            self.meta = json.load(f)
+        for name in NODE_ARRAYS + ['roots']:
+            setattr(self, name, np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode))
+        self.n_trees = self.meta['n_trees']
+
+    # Leaf value reached by every (sample, tree) pair of a chunk, walking all of them down together
+    def _predict_chunk(self, X):
+        n_samples = len(X)
+        flat_roots = np.tile(np.asarray(self.roots), n_samples)
+        samples = np.repeat(np.arange(n_samples), self.n_trees)
+        nodes = flat_roots.copy()
+
+        # Pairs that have not reached a leaf yet; the loop runs at most max_depth times
+        active = np.arange(len(nodes))
+        while active.size:
+            current = nodes[active]
+            feature = self.feature[current]
+            not_leaf = feature >= 0
+            active, current, feature = active[not_leaf], current[not_leaf], feature[not_leaf]
+            if not active.size:
+                break
+            go_left = X[samples[active], feature] <= self.threshold[current]
+            child = np.where(go_left, self.children_left[current], self.children_right[current])
+            nodes[active] = flat_roots[active] + child
+
+        return self.value[nodes].reshape(n_samples, self.n_trees).mean(axis=1)
+
+    # Forest prediction (mean over trees), same as RandomForestRegressor.predict
+    # Chunks keep the (sample, tree) working set bounded and are spread over n_jobs threads
+    def predict(self, X, chunk_size=1024, n_jobs=1):
+        # sklearn compares float32 features against the float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        chunks = [X[start:start + chunk_size] for start in range(0, len(X), chunk_size)]
+        if n_jobs == 1 or len(chunks) == 1:
+            results = [self._predict_chunk(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs if n_jobs > 0 else os.cpu_count()) as executor:
+                results = list(executor.map(self._predict_chunk, chunks))
+        return np.concatenate(results) if results else np.empty(0)
@@ -0,0 +1,224 @@
+import os
+import json
+import math
+import argparse
+import numpy as np
+from crime_data import BASE_DIR, DATA_DIR
+from shapefiles import POLYGON, read_attributes, read_shapes
+from area_assignment import AREA_BY_RECORD, AREA_NAMES
+
+# Static geometry loaded by the web map instead of the GeoServer WMS/WFS layers
+GEOMETRY_DIR = os.path.join(BASE_DIR, 'Web GIS', 'data')
+SHAPEFILES_DIR = os.path.join(DATA_DIR, 'Shapefiles')
+
+# Layer written for every shapefile, as <name>_z<zoom>.topojson
+LAYERS = {
+    'areas': os.path.join(SHAPEFILES_DIR, 'Areas.shp'),
+    'cbd_lines': os.path.join(SHAPEFILES_DIR, 'Local CBD Lines.shp')
+}
+
+# Detail levels; level z is drawn for map zooms above the previous level up to z (same list in Web GIS/main.js)
+ZOOM_LEVELS = [10, 12, 14, 16]
+
+# Largest simplification error and coordinate step allowed at a level, in screen pixels at its zoom
+TOLERANCE_PIXELS = 0.5
+QUANTIZATION_PIXELS = 0.25
+
+
+# Size of a screen pixel in degrees of longitude at a zoom level of the web mercator tile grid
+def degrees_per_pixel(zoom):
+    return 360 / (256 * 2 ** zoom)
+
+
+# Douglas-Peucker simplification keeping both end points; returns the indices of the kept points
+def simplify_line(points, tolerance):
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, stop = stack.pop()
+        if stop - start < 2:
+            continue
+        a, b = points[start], points[stop]
+        segment = points[start + 1:stop]
+        direction = b - a
+        length = math.hypot(*direction)
+        if length == 0:
+            distances = np.hypot(*(segment - a).T)
+        else:
+            distances = np.abs(direction[0] * (segment[:, 1] - a[1]) - direction[1] * (segment[:, 0] - a[0])) / length
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            middle = start + 1 + farthest
+            keep[middle] = True
+            stack.extend([(start, middle), (middle, stop)])
+    return np.flatnonzero(keep)
+
+
+# Simplifying an arc; closed arcs (whole rings) are split in three so they never collapse below a triangle
+def simplify_arc(points, tolerance):
+    if len(points) > 4 and np.array_equal(points[0], points[-1]):
+        cuts = [0, len(points) // 3, 2 * len(points) // 3, len(points) - 1]
+        kept = [simplify_line(points[start:stop + 1], tolerance) + start for start, stop in zip(cuts[:-1], cuts[1:])]
+        return points[np.unique(np.concatenate(kept))]
+    return points[simplify_line(points, tolerance)]
+
+
+# Twice the signed area of a ring; negative for the clockwise outer rings of the shapefile format
+def _signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+
+def _ring_contains(ring, point):
+    x1, y1, x2, y2 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+    straddles = (y1 > point[1]) != (y2 > point[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x1 + (point[1] - y1) * (x2 - x1) / (y2 - y1)
+    return bool(np.count_nonzero(straddles & (point[0] < x_cross)) % 2)
+
+
+# Polygons of a shape as lists of rings (outer ring first, then its holes)
+def _polygons(shape):
+    rings = [np.asarray(ring, dtype=np.float64) for ring in shape.rings()]
+    outers = [ring for ring in rings if _signed_area(ring) <= 0]
+    polygons = [[ring] for ring in outers]
+    for ring in rings:
+        if _signed_area(ring) > 0:
+            owner = next((polygon for polygon in polygons if _ring_contains(polygon[0], ring[0])), None)
+            if owner is None:
+                polygons.append([ring])
+            else:
+                owner.append(ring)
+    return polygons
+
+
+# Splitting rings and lines into arcs shared between neighbours, as TopoJSON does
+# A ring is cut wherever the set of shapes it borders changes, so the boundary between two areas is a single
+# arc stored once; simplifying it once keeps the neighbours' edges identical, leaving no gaps or slivers
+class ArcBuilder:
+    def __init__(self):
+        self.arcs = []
+        self.lookup = {}
+
+    # Index of an arc, ~index when the stored arc runs the other way
+    def add(self, points):
+        key = points.tobytes()
+        if key in self.lookup:
+            return self.lookup[key]
+        reverse_key = points[::-1].tobytes()
+        if reverse_key in self.lookup:
+            return ~self.lookup[reverse_key]
+        index = len(self.arcs)
+        self.arcs.append(points)
+        self.lookup[key] = index
+        return index
+
+    # Arcs of a closed ring, cut at the vertices where the shapes sharing its edges change
+    # owners maps a vertex (as bytes) to the bitmask of shapes having that vertex
+    def add_ring(self, ring, owners):
+        vertices = ring[:-1]
+        masks = np.array([owners[vertex.tobytes()] for vertex in vertices], dtype=object)
+        edge_masks = masks & np.roll(masks, -1)
+        cuts = np.flatnonzero(edge_masks != np.roll(edge_masks, 1))
+        if not cuts.size:
+            # Nothing to cut at: the ring starts at its lowest vertex so a shared ring is recognised both ways
+            start = int(np.lexsort((vertices[:, 1], vertices[:, 0]))[0])
+            rotated = np.concatenate([vertices[start:], vertices[:start + 1]])
+            return [self.add(rotated)]
+        rotated = np.concatenate([vertices[cuts[0]:], vertices[:cuts[0]], vertices[cuts[0]:cuts[0] + 1]])
+        cuts = np.append(cuts - cuts[0], len(vertices))
+        return [self.add(rotated[start:stop + 1]) for start, stop in zip(cuts[:-1], cuts[1:])]
+
+
+# Properties of every record: the .dbf columns when there is one, otherwise the area number and name
+# for the areas (the 'prec' and 'Area' attributes the web map styles by) and the record number for lines
+def _properties(name, path, shapes):
+    attributes = read_attributes(path)
+    if attributes is not None:
+        return [{column: values[i] for column, values in attributes.items()} for i in range(len(shapes))]
+    if name == 'areas':
+        return [{'prec': AREA_BY_RECORD[shape.record], 'Area': AREA_NAMES[AREA_BY_RECORD[shape.record]]}
+                for shape in shapes]
+    return [{'record': shape.record} for shape in shapes]
+
+
+# Topology of a shapefile: its shared arcs and, per record, its geometry as arc indices
+def build_topology(shapes):
+    builder = ArcBuilder()
+    geometries = []
+    if shapes and shapes[0].shape_type == POLYGON:
+        owners = {}
+        for i, shape in enumerate(shapes):
+            for vertex in np.unique(np.asarray(shape.points, dtype=np.float64), axis=0):
+                owners[vertex.tobytes()] = owners.get(vertex.tobytes(), 0) | (1 << i)
+        for shape in shapes:
+            polygons = [[builder.add_ring(ring, owners) for ring in rings] for rings in _polygons(shape)]
+            if len(polygons) == 1:
+                geometries.append({'type': 'Polygon', 'arcs': polygons[0]})
+            else:
+                geometries.append({'type': 'MultiPolygon', 'arcs': polygons})
+    else:
+        for shape in shapes:
+            lines = [[builder.add(np.asarray(part, dtype=np.float64))] for part in shape.rings()]
+            if len(lines) == 1:
+                geometries.append({'type': 'LineString', 'arcs': lines[0]})
+            else:
+                geometries.append({'type': 'MultiLineString', 'arcs': lines})
+    return builder.arcs, geometries
+
+
+# Quantized, delta-encoded arcs of one detail level; consecutive points falling on the same grid cell are merged
+def encode_arcs(arcs, tolerance, translate, scale):
+    encoded = []
+    for arc in arcs:
+        simplified = simplify_arc(arc, tolerance) if tolerance > 0 else arc
+        quantized = np.round((simplified - translate) / scale).astype(np.int64)
+        repeated = np.all(quantized[1:] == quantized[:-1], axis=1)
+        quantized = quantized[np.concatenate([[True], ~repeated])]
+        if len(quantized) == 1:
+            quantized = np.repeat(quantized, 2, axis=0)
+        encoded.append(np.concatenate([quantized[:1], np.diff(quantized, axis=0)]).tolist())
+    return encoded
+
+
+# Writing one TopoJSON file per detail level of a shapefile
+def export_layer(name, path, output_dir=GEOMETRY_DIR, zoom_levels=ZOOM_LEVELS):
+    shapes = read_shapes(path)
+    arcs, geometries = build_topology(shapes)
+    for geometry, properties in zip(geometries, _properties(name, path, shapes)):
+        geometry['properties'] = properties
+
+    points = np.concatenate(arcs)
+    translate = points.min(axis=0)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    written = {}
+    for zoom in zoom_levels:
+        pixel = degrees_per_pixel(zoom)
+        # Quantization steps fine enough for the zoom, rounded to a power of two so levels share the grid
+        scale = np.full(2, 2.0 ** math.floor(math.log2(pixel * QUANTIZATION_PIXELS)))
+        topology = {
+            'type': 'Topology',
+            'transform': {'scale': scale.tolist(), 'translate': translate.tolist()},
+            'objects': {name: {'type': 'GeometryCollection', 'geometries': geometries}},
+            'arcs': encode_arcs(arcs, pixel * TOLERANCE_PIXELS, translate, scale)
+        }
+        output_path = os.path.join(output_dir, f'{name}_z{zoom}.topojson')
+        with open(f'{output_path}.{os.getpid()}.tmp', 'w') as f:
+            json.dump(topology, f, separators=(',', ':'))
+        os.replace(f'{output_path}.{os.getpid()}.tmp', output_path)
+        written[zoom] = output_path
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the area and CBD line shapefiles as multi-resolution TopoJSON for the web map')
+    parser.add_argument('--layers', nargs='+', choices=sorted(LAYERS), default=sorted(LAYERS))
+    parser.add_argument('--output-dir', default=GEOMETRY_DIR)
+    args = parser.parse_args()
+
+    for name in args.layers:
+        for zoom, output_path in export_layer(name, LAYERS[name], args.output_dir).items():
+            print(f'{name} zoom {zoom}: {os.path.getsize(output_path) / 1024:.1f} KB written to {output_path}')
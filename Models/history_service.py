@@ -0,0 +1,214 @@
+import os
+import json
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from crime_data import load_cube
+from prediction_rollup import load_rollup
+
+# Answers kept ready to send, most recently used last; the map only asks a few hundred distinct questions
+MAX_CACHED_ANSWERS = 4096
+
+
+# Per-area historical crime counts for any (year, month, crime categories) filter of the web map
+# totals[y, m, agg_id, area] holds the counts of year slot y and month slot m, where the last year and
+# month slots are the totals over every year and every month, so a query sums at most ten rows
+class HistoryIndex:
+    def __init__(self, counts, areas, years, months, agg_ids):
+        self.areas = np.asarray(areas)
+        self.years = np.asarray(years)
+        self.months = np.asarray(months)
+        self.agg_ids = np.asarray(agg_ids)
+
+        # counts is area x year x month x agg_id, as in the crime cube and the ingested incident counts
+        by_year = np.asarray(counts, dtype=np.int64).transpose(1, 2, 3, 0)
+        by_year = np.concatenate([by_year, by_year.sum(axis=1, keepdims=True)], axis=1)
+        self.totals = np.concatenate([by_year, by_year.sum(axis=0, keepdims=True)], axis=0)
+
+        # Changes whenever the counts do, so ETags handed out before a rebuild stop matching
+        self.version = hashlib.sha1(self.totals.tobytes() + self.areas.tobytes()).hexdigest()[:16]
+
+    @classmethod
+    def from_cube(cls, cube):
+        return cls(cube.counts, cube.areas, cube.years, cube.months, cube.agg_ids)
+
+    # Index of a value on an axis, or the 'every value' slot after the axis for None
+    def _slot(self, axis, value, name):
+        if value is None:
+            return len(axis)
+        idx = int(np.searchsorted(axis, value))
+        if idx >= len(axis) or axis[idx] != value:
+            raise ValueError(f'Unknown {name}: {value}')
+        return idx
+
+    # Totals per area for one year and month (every one if None) and the given agg_ids (all if empty)
+    def area_counts(self, year=None, month=None, agg_ids=None):
+        rows = self.totals[self._slot(self.years, year, 'year'), self._slot(self.months, month, 'month')]
+        if agg_ids:
+            rows = rows[[self._slot(self.agg_ids, agg_id, 'agg_id') for agg_id in agg_ids]]
+        return dict(zip(self.areas.tolist(), rows.sum(axis=0).tolist()))
+
+
+# Year, month and sorted crime categories of a query string such as year=2018&month=03&agg_id=300,400
+# agg_id may be repeated or comma separated; a missing or empty year/month means every one
+def parse_query(query):
+    params = parse_qs(query)
+    year = params.get('year', [''])[0]
+    month = params.get('month', [''])[0]
+    agg_ids = sorted({int(value) for values in params.get('agg_id', []) for value in values.split(',') if value})
+    return int(year) if year else None, int(month) if month else None, tuple(agg_ids)
+
+
+# Model, month and sorted crime categories of a prediction query such as model=lstm&month=3&agg_id=300,400
+# The model defaults to the LSTM, whose predictions the map shows; a missing month means the whole year
+def parse_prediction_query(query):
+    params = parse_qs(query)
+    _, month, agg_ids = parse_query(query)
+    return params.get('model', ['lstm'])[0], month, agg_ids
+
+
+# Handles GET /history?year=2018&month=3&agg_id=300,400 and GET /predictions?model=lstm&month=3&agg_id=300,400
+# (per-area prediction totals from prediction_rollup.py) with ETag revalidation
+class HistoryHandler(BaseHTTPRequestHandler):
+    index = None
+    rollup = None
+    answers = OrderedDict()
+    lock = threading.Lock()
+    # File the index was loaded from and how to load it again, set when it can change while serving
+    index_source = None
+    index_mtime = None
+    load_index = None
+
+    def _send(self, status, payload=b'', etag=None):
+        self.send_response(status)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if etag:
+            self.send_header('ETag', etag)
+            # Browsers keep the answer but ask again each time, getting an empty 304 while nothing changed
+            self.send_header('Cache-Control', 'no-cache')
+        if status != 304:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(payload)
+
+    def _send_json(self, status, body):
+        self._send(status, json.dumps(body).encode('utf-8'))
+
+    # Body of a normalised query and the version of the data it was answered from
+    def _body(self, key):
+        if key[0] == 'history':
+            _, year, month, agg_ids = key
+            return {'year': year, 'month': month, 'agg_ids': list(agg_ids),
+                    'counts': self.index.area_counts(year, month, agg_ids)}, self.index.version
+        _, model, month, agg_ids = key
+        totals = self.rollup.area_totals(model, month, month, list(agg_ids) or None)
+        return {'model': model, 'month': month, 'agg_ids': list(agg_ids),
+                'counts': {area: int(total) for area, total in totals.items()}}, self.rollup.version
+
+    # Rebuilding the index once its file has changed, starting a fresh set of answers for it
+    def _refresh_index(self):
+        if self.index_source is None:
+            return
+        try:
+            mtime = os.stat(self.index_source).st_mtime_ns
+        except FileNotFoundError:
+            return
+        with self.lock:
+            if mtime == HistoryHandler.index_mtime:
+                return
+            HistoryHandler.index = HistoryHandler.load_index()
+            HistoryHandler.index_mtime = mtime
+            HistoryHandler.answers = OrderedDict()
+
+    # Encoded answer and ETag of a normalised query, computed once and then served from memory
+    def _answer(self, key):
+        with self.lock:
+            # Answers computed while the index is rebuilt go to the old set and are dropped with it
+            answers = self.answers
+            if key in answers:
+                answers.move_to_end(key)
+                return answers[key]
+
+        body, version = self._body(key)
+        payload = json.dumps(body).encode('utf-8')
+        etag = f'"{version}-{hashlib.sha1(payload).hexdigest()[:16]}"'
+
+        with self.lock:
+            answers[key] = payload, etag
+            if len(answers) > MAX_CACHED_ANSWERS:
+                answers.popitem(last=False)
+        return payload, etag
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self._refresh_index()
+        if url.path == '/health':
+            self._send_json(200, {'status': 'ok', 'version': self.index.version})
+            return
+        if url.path not in ('/history', '/predictions'):
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        try:
+            if url.path == '/history':
+                key = ('history',) + parse_query(url.query)
+            else:
+                key = ('predictions',) + parse_prediction_query(url.query)
+            payload, etag = self._answer(key)
+        except ValueError as error:
+            self._send_json(400, {'error': str(error)})
+            return
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self._send(304, etag=etag)
+        else:
+            self._send(200, payload, etag)
+
+    # Keeps the console quiet under many small dashboard queries
+    def log_message(self, format, *args):
+        pass
+
+
+# Serving the counts of the crime cube (or of the incident counts of incident_ingest.py) and the prediction
+# totals of the rollup until interrupted
+# The incident counts are reloaded whenever incident_ingest.py saves new ones
+def serve(host='127.0.0.1', port=8001, incidents=False):
+    if incidents:
+        from incident_ingest import AGG_IDS, AREAS, MONTHS, INGEST_DIR, STATE_FILE, IncidentCounts
+        state_path = os.path.join(INGEST_DIR, STATE_FILE)
+        if not os.path.exists(state_path):
+            raise SystemExit('No ingested incidents yet, run incident_ingest.py first')
+
+        def load_index():
+            counts = IncidentCounts.load()
+            return HistoryIndex(counts.counts, AREAS, counts.years, MONTHS, AGG_IDS)
+
+        HistoryHandler.index_source = state_path
+        HistoryHandler.index_mtime = os.stat(state_path).st_mtime_ns
+        HistoryHandler.load_index = load_index
+        HistoryHandler.index = load_index()
+    else:
+        HistoryHandler.index = HistoryIndex.from_cube(load_cube())
+    HistoryHandler.rollup = load_rollup()
+    server = ThreadingHTTPServer((host, port), HistoryHandler)
+    print(f'Serving historical crime counts on http://{host}:{port}/history and predictions on /predictions')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-area historical crime counts for the web map, in place of counting WFS features')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--incidents', action='store_true', help='Serve the counts stored by incident_ingest.py instead of the train/test cube')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.incidents)
@@ -0,0 +1,211 @@
+import os
+import json
+import argparse
+from datetime import date
+import numpy as np
+import pandas as pd
+from crime_data import AGG_DESCRIPTIONS, CACHE_DIR, DATA_DIR, SPLIT_FILES, file_signature
+
+# Running counts of every incident ingested so far, kept between runs so new months can be appended
+INGEST_DIR = os.path.join(CACHE_DIR, 'incidents')
+COUNTS_FILE = 'incident_counts.npy'
+STATE_FILE = 'incident_counts.json'
+
+# Axes of the cube, as in the all_combinations CTE of the Data Analysis notebook
+AREAS = np.arange(1, 22)
+MONTHS = np.arange(1, 13)
+AGG_IDS = np.array(sorted(AGG_DESCRIPTIONS))
+
+# Years written to train_set.csv (FIRST_YEAR up to TEST_YEAR - 1) and test_set.csv (TEST_YEAR)
+FIRST_YEAR = 2015
+TEST_YEAR = 2019
+
+# Incidents parsed at a time; memory stays bounded by this, whatever the size of the file
+CHUNK_SIZE = 500_000
+
+# Date format of the LAPD 'DATE OCC' column, used when the months come from a date column
+DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+
+# Index of every value along an axis, and whether the value is on the axis at all
+def _positions(axis, values):
+    idx = np.searchsorted(axis, values)
+    valid = idx < len(axis)
+    valid[valid] = axis[idx[valid]] == values[valid]
+    return idx, valid
+
+
+# Area x year x month x agg_id incident counts, zero-filled, filled one chunk of incidents at a time
+# last_period (year * 12 + month - 1) is the latest month ingested; appending only counts later months
+class IncidentCounts:
+    def __init__(self, counts, years, sources=None, last_period=None):
+        self.counts = counts
+        self.years = np.asarray(years)
+        self.sources = sources or {}
+        self.last_period = last_period
+
+    @classmethod
+    def empty(cls, first_year=FIRST_YEAR, last_year=TEST_YEAR):
+        years = np.arange(first_year, last_year + 1)
+        return cls(np.zeros((len(AREAS), len(years), len(MONTHS), len(AGG_IDS)), dtype=np.int64), years)
+
+    # Growing the year axis with zero-filled years, so appended months can start a new year
+    def ensure_years(self, last_year):
+        if last_year <= self.years[-1]:
+            return
+        extra = np.arange(self.years[-1] + 1, last_year + 1)
+        padding = np.zeros((len(AREAS), len(extra), len(MONTHS), len(AGG_IDS)), dtype=self.counts.dtype)
+        self.counts = np.concatenate([self.counts, padding], axis=1)
+        self.years = np.concatenate([self.years, extra])
+
+    # Adding one chunk of incidents; rows outside the ten crime categories, the areas, the years
+    # or already ingested months are dropped. Returns how many rows were counted
+    def add(self, area, year, month, agg_id, after_period=None):
+        periods = year * 12 + month - 1
+        area_idx, valid_area = _positions(AREAS, area)
+        month_idx, valid_month = _positions(MONTHS, month)
+        agg_idx, valid_agg = _positions(AGG_IDS, agg_id)
+        # Years after the current one are typos (such as 20190), checked before they can grow the year axis
+        keep = valid_area & valid_month & valid_agg & (year >= self.years[0]) & (year <= date.today().year)
+        if after_period is not None:
+            keep &= periods > after_period
+        if not keep.any():
+            return 0
+        self.ensure_years(int(year[keep].max()))
+        year_idx, valid_year = _positions(self.years, year)
+        keep &= valid_year
+
+        # One bincount per chunk instead of one update per incident
+        flat = np.ravel_multi_index((area_idx[keep], year_idx[keep], month_idx[keep], agg_idx[keep]), self.counts.shape)
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        latest = int(periods[keep].max())
+        self.last_period = latest if self.last_period is None else max(self.last_period, latest)
+        return int(keep.sum())
+
+    # Long-format rows of a range of years, in the layout of train_set.csv and test_set.csv
+    def table(self, first_year, last_year):
+        start, stop = np.searchsorted(self.years, [first_year, last_year + 1])
+        counts = self.counts[:, start:stop]
+        area_idx, year_idx, month_idx, agg_idx = np.indices(counts.shape).reshape(4, -1)
+        return pd.DataFrame({
+            'area': AREAS[area_idx],
+            'year': self.years[start:stop][year_idx],
+            'month': MONTHS[month_idx],
+            'agg_id': AGG_IDS[agg_idx],
+            'total_crimes': counts.reshape(-1)
+        })
+
+    def save(self, directory=INGEST_DIR):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        counts_path = os.path.join(directory, COUNTS_FILE)
+        with open(f'{counts_path}.{os.getpid()}.tmp', 'wb') as f:
+            np.save(f, self.counts)
+        os.replace(f'{counts_path}.{os.getpid()}.tmp', counts_path)
+
+        # The state file is written last, so it never describes counts that were not saved
+        state = {'years': self.years.tolist(), 'sources': self.sources, 'last_period': self.last_period}
+        state_path = os.path.join(directory, STATE_FILE)
+        with open(f'{state_path}.{os.getpid()}.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(f'{state_path}.{os.getpid()}.tmp', state_path)
+
+    @classmethod
+    def load(cls, directory=INGEST_DIR):
+        state_path = os.path.join(directory, STATE_FILE)
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path) as f:
+            state = json.load(f)
+        return cls(np.load(os.path.join(directory, COUNTS_FILE)), state['years'], state['sources'], state['last_period'])
+
+
+# Streaming a raw incident CSV as (area, year, month, agg_id) integer arrays, chunk_size rows at a time
+# The months come from year/month columns (crime_dataset_clean) or from a date column (the raw LAPD export),
+# and agg_id from an agg_id column or from the crime code through a crm_cd -> agg_id mapping
+def read_incidents(path, chunk_size=CHUNK_SIZE, area_column='area', agg_column='agg_id', date_column=None,
+                   date_format=DATE_FORMAT, crime_codes=None, code_column='crm_cd'):
+    columns = [area_column, code_column if crime_codes is not None else agg_column]
+    columns += [date_column] if date_column else ['year', 'month']
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size, dtype=str):
+        area = pd.to_numeric(chunk[area_column], errors='coerce')
+        if date_column:
+            dates = pd.to_datetime(chunk[date_column], format=date_format, errors='coerce')
+            year, month = dates.dt.year, dates.dt.month
+        else:
+            year = pd.to_numeric(chunk['year'], errors='coerce')
+            month = pd.to_numeric(chunk['month'], errors='coerce')
+        if crime_codes is not None:
+            agg_id = pd.to_numeric(chunk[code_column], errors='coerce').map(crime_codes)
+        else:
+            agg_id = pd.to_numeric(chunk[agg_column], errors='coerce')
+
+        # Rows with a missing or unreadable field cannot be placed in the cube
+        valid = (area.notna() & year.notna() & month.notna() & agg_id.notna()).to_numpy()
+        yield tuple(np.asarray(values, dtype=np.float64)[valid].astype(np.int64) for values in (area, year, month, agg_id))
+
+
+# Crime code to agg_id mapping from a CSV export of the crimecodes_agg table
+def load_crime_codes(path, code_column='crm_cd'):
+    codes = pd.read_csv(path, usecols=[code_column, 'agg_id'])
+    return dict(zip(codes[code_column].astype(np.int64), codes['agg_id'].astype(np.int64)))
+
+
+# Adding incident files to the stored counts; files already ingested are skipped and, when appending,
+# only months after the latest one already counted are added, so history is never read twice
+def ingest(paths, directory=INGEST_DIR, append=True, first_year=FIRST_YEAR, last_year=TEST_YEAR, **read_options):
+    counts = IncidentCounts.load(directory) if append else None
+    if counts is None:
+        counts = IncidentCounts.empty(first_year, last_year)
+    # Read once: files of the same run cover the same new months, so one file must not hide the months of the next
+    after_period = counts.last_period
+
+    for path in paths:
+        signature = file_signature({'incidents': path})['incidents']
+        if counts.sources.get(os.path.abspath(path)) == signature:
+            print(f'{path} was already ingested, skipping it')
+            continue
+
+        n_rows = n_counted = 0
+        for area, year, month, agg_id in read_incidents(path, **read_options):
+            n_rows += len(area)
+            n_counted += counts.add(area, year, month, agg_id, after_period)
+        counts.sources[os.path.abspath(path)] = signature
+        counts.save(directory)
+        print(f'{path}: {n_counted} of {n_rows} incidents counted')
+    return counts
+
+
+# Writing train_set.csv and test_set.csv from the counts, every combination present with zeros where nothing happened
+def write_splits(counts, data_dir=DATA_DIR, first_year=FIRST_YEAR, test_year=TEST_YEAR):
+    splits = {'train': counts.table(first_year, test_year - 1), 'test': counts.table(test_year, test_year)}
+    for split, df in splits.items():
+        path = os.path.join(data_dir, SPLIT_FILES[split])
+        df.to_csv(f'{path}.{os.getpid()}.tmp', index=False)
+        os.replace(f'{path}.{os.getpid()}.tmp', path)
+    return splits
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Aggregate raw incident CSVs into train_set.csv and test_set.csv without a database')
+    parser.add_argument('incidents', nargs='+', help='Incident CSVs, one row per incident')
+    parser.add_argument('--restart', action='store_true', help='Discard the stored counts instead of appending to them')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--area-column', default='area')
+    parser.add_argument('--agg-column', default='agg_id')
+    parser.add_argument('--date-column', help='Date column to take the year and month from (e.g. "DATE OCC") instead of year/month columns')
+    parser.add_argument('--date-format', default=DATE_FORMAT)
+    parser.add_argument('--crime-codes', help='CSV with crm_cd and agg_id columns, to map crime codes onto the crime categories')
+    parser.add_argument('--code-column', default='crm_cd', help='Crime code column of the incidents, used with --crime-codes')
+    parser.add_argument('--first-year', type=int, default=FIRST_YEAR)
+    parser.add_argument('--test-year', type=int, default=TEST_YEAR)
+    parser.add_argument('--output-dir', default=DATA_DIR, help='Folder train_set.csv and test_set.csv are written to')
+    args = parser.parse_args()
+
+    crime_codes = load_crime_codes(args.crime_codes, args.code_column) if args.crime_codes else None
+    counts = ingest(args.incidents, append=not args.restart, first_year=args.first_year, last_year=args.test_year,
+                    chunk_size=args.chunk_size, area_column=args.area_column, agg_column=args.agg_column,
+                    date_column=args.date_column, date_format=args.date_format, crime_codes=crime_codes,
+                    code_column=args.code_column)
+    splits = write_splits(counts, args.output_dir, args.first_year, args.test_year)
+    print(', '.join(f'{len(df)} {split} rows' for split, df in splits.items()) + f' written to {args.output_dir}')
@@ -0,0 +1,78 @@
+import os
+import hashlib
+import numpy as np
+import joblib
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.neighbors import KDTree
+from sklearn.preprocessing import normalize
+from crime_data import CACHE_DIR
+
+# Where built neighbour indexes are kept, one file per distinct training set
+KNN_CACHE_DIR = os.path.join(CACHE_DIR, 'knn')
+
+# Most indexes kept; the least recently used ones are removed past this
+MAX_CACHED_TREES = 8
+
+
+# Removing the least recently used indexes beyond the newest `keep`
+def _evict(cache_dir, keep=MAX_CACHED_TREES):
+    paths = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.joblib')]
+    for path in sorted(paths, key=os.path.getmtime)[:-keep]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# Loading the KD-tree built for these (already normalised) training rows, or building and saving it
+# cache_dir=None builds the tree without keeping it, for one-off fits such as cross-validation folds
+def load_or_build_tree(X_unit, leaf_size=40, cache_dir=KNN_CACHE_DIR):
+    if cache_dir is None:
+        return KDTree(X_unit, leaf_size=leaf_size)
+    key = hashlib.sha1(np.ascontiguousarray(X_unit).tobytes() + f'{X_unit.shape}/{leaf_size}'.encode()).hexdigest()
+    path = os.path.join(cache_dir, f'{key}.joblib')
+    if os.path.exists(path):
+        # Marking the index as recently used
+        os.utime(path)
+        return joblib.load(path)
+
+    tree = KDTree(X_unit, leaf_size=leaf_size)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    joblib.dump(tree, tmp_path)
+    os.replace(tmp_path, path)
+    _evict(cache_dir)
+    return tree
+
+
+# KNN regressor with the same neighbours as KNeighborsRegressor(metric='cosine')
+# On L2-normalised rows, Euclidean distance is sqrt(2 - 2 * cosine similarity), so the neighbour
+# ordering is the same as with cosine distance, but a KD-tree can be used instead of brute force
+class CosineKNNRegressor(RegressorMixin, BaseEstimator):
+    def __init__(self, n_neighbors=2, leaf_size=40, batch_size=1024, n_jobs=-1, cache_dir=KNN_CACHE_DIR):
+        self.n_neighbors = n_neighbors
+        self.leaf_size = leaf_size
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+        self.cache_dir = cache_dir
+
+    def fit(self, X, y):
+        X_unit = normalize(np.asarray(X, dtype=np.float64))
+        self.tree_ = load_or_build_tree(X_unit, self.leaf_size, self.cache_dir)
+        self.y_ = np.asarray(y, dtype=np.float64)
+        self.n_features_in_ = X_unit.shape[1]
+        return self
+
+    # Indices of the nearest training rows, queried in batches spread over n_jobs threads
+    def kneighbors(self, X):
+        X_unit = normalize(np.asarray(X, dtype=np.float64))
+        batches = [X_unit[start:start + self.batch_size] for start in range(0, len(X_unit), self.batch_size)]
+        results = Parallel(n_jobs=self.n_jobs, prefer='threads')(
+            delayed(self.tree_.query)(batch, k=self.n_neighbors, return_distance=False) for batch in batches)
+        return np.concatenate(results) if results else np.empty((0, self.n_neighbors), dtype=np.intp)
+
+    # Uniform average of the neighbours' targets, as KNeighborsRegressor does
+    def predict(self, X):
+        return self.y_[self.kneighbors(X)].mean(axis=1)
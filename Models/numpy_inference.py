@@ -0,0 +1,245 @@
+import os
+import json
+import hashlib
+import argparse
+import importlib.util
+import numpy as np
+from crime_data import SCRIPTS_DIR
+
+# Keras models and scalers written by ANN.py and LSTM.py, and the flat exports made from them
+SOURCE_FILES = {
+    'ann': (os.path.join(SCRIPTS_DIR, 'ANN', 'ann_model.h5'), os.path.join(SCRIPTS_DIR, 'ANN', 'scaler.gz')),
+    'lstm': (os.path.join(SCRIPTS_DIR, 'LSTM', 'lstm_model.h5'), os.path.join(SCRIPTS_DIR, 'LSTM', 'scaler.gz'))
+}
+EXPORT_FILES = {
+    'ann': os.path.join(SCRIPTS_DIR, 'ANN', 'ann_model.npz'),
+    'lstm': os.path.join(SCRIPTS_DIR, 'LSTM', 'lstm_model.npz')
+}
+
+# Largest difference allowed between the export's and the Keras model's (scaled) outputs
+PARITY_TOLERANCE = 1e-5
+
+# Layers the NumPy forward pass implements; Dropout and InputLayer do nothing at inference time
+SUPPORTED_LAYERS = ['Dense', 'LSTM', 'Dropout', 'InputLayer']
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def _hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0, 1)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid
+}
+
+
+# Weights of one layer of a Keras .h5 file, keyed by their short name (kernel, recurrent_kernel, bias)
+def _layer_weights(h5_file, layer_name):
+    group = h5_file['model_weights'][layer_name]
+    weights = {}
+    for weight_name in group.attrs.get('weight_names', []):
+        weight_name = weight_name.decode() if isinstance(weight_name, bytes) else weight_name
+        short_name = weight_name.split('/')[-1].split(':')[0]
+        weights[short_name] = np.asarray(group[weight_name], dtype=np.float32)
+    return weights
+
+
+# Fingerprint of the contents of the Keras model and scaler an export is made from; modification times say
+# nothing once the files are copied back by the artefact cache or checked out by git
+def source_hash(model_path, scaler_path):
+    digest = hashlib.sha1()
+    for path in (model_path, scaler_path):
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+# Writing a Keras .h5 model and its MinMaxScaler as one flat .npz, read with h5py instead of TensorFlow
+def export_model(model_path, scaler_path, output_path):
+    import h5py
+    import joblib
+
+    layers, arrays, input_shape = [], {}, None
+    with h5py.File(model_path, 'r') as f:
+        config = f.attrs['model_config']
+        config = json.loads(config.decode() if isinstance(config, bytes) else config)
+        for layer in config['config']['layers']:
+            class_name, layer_config = layer['class_name'], layer['config']
+            # Keras 2 keeps the input shape on the first layer, Keras 3 on the InputLayer
+            input_shape = input_shape or layer_config.get('batch_input_shape') or layer_config.get('batch_shape')
+            if class_name not in SUPPORTED_LAYERS:
+                raise ValueError(f'Cannot export {class_name} layer {layer_config["name"]}')
+            if class_name in ('Dropout', 'InputLayer'):
+                continue
+
+            weights = _layer_weights(f, layer_config['name'])
+            index = len(layers)
+            spec = {'type': class_name, 'activation': layer_config.get('activation', 'linear')}
+            if class_name == 'LSTM':
+                spec['recurrent_activation'] = layer_config.get('recurrent_activation', 'sigmoid')
+                spec['return_sequences'] = layer_config.get('return_sequences', False)
+            for short_name, values in weights.items():
+                arrays[f'layer{index}_{short_name}'] = values
+            layers.append(spec)
+
+    scaler = joblib.load(scaler_path)
+    arrays['scaler_min'] = scaler.min_.astype(np.float64)
+    arrays['scaler_scale'] = scaler.scale_.astype(np.float64)
+    arrays['architecture'] = np.array(json.dumps({'input_shape': input_shape, 'layers': layers}))
+    arrays['source_hash'] = np.array(source_hash(model_path, scaler_path))
+    np.savez(output_path, **arrays)
+    return layers
+
+
+# The MinMaxScaler parameters kept in an export, with the attributes and methods the scripts use
+class ExportedScaler:
+    def __init__(self, min_, scale_):
+        self.min_ = min_
+        self.scale_ = scale_
+
+    def transform(self, X):
+        return np.asarray(X, dtype=np.float64) * self.scale_ + self.min_
+
+    def inverse_transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.min_) / self.scale_
+
+
+# Turning the scaled Total_Crimes column back into crime counts
+def inverse_scale_counts(scaler, predictions):
+    dummy_features = np.zeros((len(predictions), len(scaler.scale_) - 1))
+    full_predictions = np.concatenate([dummy_features, np.asarray(predictions).reshape(-1, 1)], axis=1)
+    return scaler.inverse_transform(full_predictions)[:, -1]
+
+
+# A Dense/LSTM network and its scaler evaluated with NumPy only, a drop-in for the Keras model's
+# predict_on_batch and input_shape in the prediction scripts and service
+class NumpyNetwork:
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            architecture = json.loads(str(data['architecture']))
+            self.layers = architecture['layers']
+            self.weights = [{name.split('_', 1)[1]: data[name] for name in data.files if name.startswith(f'layer{i}_')}
+                            for i in range(len(self.layers))]
+            self.scaler = ExportedScaler(data['scaler_min'], data['scaler_scale'])
+            self.source_hash = str(data['source_hash']) if 'source_hash' in data.files else None
+        self.input_shape = tuple(architecture['input_shape'])
+
+    def _dense(self, x, weights, spec):
+        out = x @ weights['kernel']
+        if 'bias' in weights:
+            out += weights['bias']
+        return ACTIVATIONS[spec['activation']](out)
+
+    # Gates in Keras order (input, forget, cell, output), one time step at a time over the whole batch
+    def _lstm(self, x, weights, spec):
+        kernel, recurrent_kernel = weights['kernel'], weights['recurrent_kernel']
+        bias = weights.get('bias', np.zeros(kernel.shape[1], dtype=np.float32))
+        activation = ACTIVATIONS[spec['activation']]
+        recurrent_activation = ACTIVATIONS[spec['recurrent_activation']]
+        units = recurrent_kernel.shape[0]
+
+        # The input projection of every time step is one matrix product
+        projected = x @ kernel + bias
+        h = np.zeros((x.shape[0], units), dtype=np.float32)
+        c = np.zeros((x.shape[0], units), dtype=np.float32)
+        outputs = []
+        for t in range(x.shape[1]):
+            z = projected[:, t] + h @ recurrent_kernel
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            g = activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * activation(c)
+            outputs.append(h)
+        return np.stack(outputs, axis=1) if spec['return_sequences'] else h
+
+    # Network output for a batch of already scaled inputs ([rows, features] or [rows, steps, features])
+    def predict_on_batch(self, X):
+        x = np.asarray(X, dtype=np.float32)
+        for spec, weights in zip(self.layers, self.weights):
+            x = self._lstm(x, weights, spec) if spec['type'] == 'LSTM' else self._dense(x, weights, spec)
+        return x
+
+    # Same as predict_on_batch, in chunks to bound memory on very large inputs
+    def predict(self, X, batch_size=4096):
+        X = np.asarray(X)
+        return np.concatenate([self.predict_on_batch(X[start:start + batch_size])
+                               for start in range(0, len(X), batch_size)]) if len(X) else np.empty((0, 1))
+
+    # MinMaxScaler.transform of the leading feature columns (the scaler covers the features then Total_Crimes)
+    def scale_inputs(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        n = X.shape[-1]
+        return (X * self.scaler.scale_[:n] + self.scaler.min_[:n]).astype(np.float32)
+
+    # Turning scaled Total_Crimes predictions back into crime counts
+    def inverse_scale_target(self, predictions):
+        return (np.asarray(predictions, dtype=np.float64).reshape(-1) - self.scaler.min_[-1]) / self.scaler.scale_[-1]
+
+
+# Hash of the Keras files an export was made from, None for exports made before it was recorded
+def _export_hash(export_path):
+    with np.load(export_path, allow_pickle=False) as data:
+        return str(data['source_hash']) if 'source_hash' in data.files else None
+
+
+# Model and scaler of 'ann' or 'lstm': the NumPy export when it was made from the Keras files as they are now,
+# or when only the export is deployed (engine='auto'), or always one or the other ('numpy' / 'keras')
+def load_network(name, engine='auto'):
+    model_path, scaler_path = SOURCE_FILES[name]
+    export_path = EXPORT_FILES[name]
+    if engine == 'auto':
+        if not os.path.exists(export_path):
+            engine = 'keras'
+        elif not (os.path.exists(model_path) and os.path.exists(scaler_path)):
+            engine = 'numpy'
+        else:
+            engine = 'numpy' if _export_hash(export_path) == source_hash(model_path, scaler_path) else 'keras'
+
+    if engine == 'numpy':
+        network = NumpyNetwork(export_path)
+        return network, network.scaler
+    if engine == 'keras':
+        import joblib
+        from tensorflow.keras.models import load_model
+        return load_model(model_path), joblib.load(scaler_path)
+    raise ValueError(f'Unknown engine: {engine} (choose from auto, numpy, keras)')
+
+
+# Largest difference between the export's and the Keras model's outputs on random scaled inputs, None when
+# TensorFlow is not installed; raises ValueError past PARITY_TOLERANCE
+def check_parity(name, n_samples=512, seed=0):
+    if importlib.util.find_spec('tensorflow') is None:
+        return None
+    from tensorflow.keras.models import load_model
+    network = NumpyNetwork(EXPORT_FILES[name])
+    model = load_model(SOURCE_FILES[name][0])
+    # Scaled inputs lie in [0, 1]; a free time axis is given one step
+    shape = [dim or 1 for dim in network.input_shape[1:]]
+    X = np.random.default_rng(seed).random((n_samples, *shape), dtype=np.float32)
+    error = float(np.abs(np.asarray(model.predict_on_batch(X)) - network.predict_on_batch(X)).max())
+    if error > PARITY_TOLERANCE:
+        raise ValueError(f'{name} export differs from the Keras model by up to {error:.2e}')
+    return error
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the ANN/LSTM Keras models and scalers to flat .npz files')
+    parser.add_argument('--models', nargs='+', choices=sorted(SOURCE_FILES), default=sorted(SOURCE_FILES))
+    args = parser.parse_args()
+
+    for name in args.models:
+        model_path, scaler_path = SOURCE_FILES[name]
+        layers = export_model(model_path, scaler_path, EXPORT_FILES[name])
+        print(f'{name}: {" -> ".join(layer["type"] for layer in layers)} written to {EXPORT_FILES[name]}')
+        error = check_parity(name)
+        print(f'{name}: matches Keras to {error:.2e}' if error is not None else f'{name}: TensorFlow not installed, parity not checked')
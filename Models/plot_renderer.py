@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from crime_data import AGG_DESCRIPTIONS, CACHE_DIR, SCRIPTS_DIR
+
+# Where the model scripts and the trend forecaster write their figures
+DIAGNOSTIC_PLOTS_DIR = os.path.join(SCRIPTS_DIR, 'Diagnostic Plots')
+TREND_PLOTS_DIR = os.path.join(SCRIPTS_DIR, 'Prediction Plots')
+
+# Digest of the data behind every figure written so far, keyed by the figure's path
+MANIFEST_FILE = os.path.join(CACHE_DIR, 'plot_manifest.json')
+
+# Bumped whenever the drawing code changes, so every figure is drawn again once
+RENDERER_VERSION = 1
+
+# Below this many figures a process pool costs more than it saves
+MIN_PARALLEL_FIGURES = 8
+
+
+# Everything needed to draw one figure: the kind of plot, its arrays and its labels
+class FigureSpec:
+    def __init__(self, path, kind, data, options=None):
+        self.path = os.path.abspath(path)
+        self.kind = kind
+        self.data = {name: np.asarray(values) for name, values in data.items()}
+        self.options = options or {}
+
+    # Hash of the inputs; a figure whose digest is unchanged does not need drawing again
+    def digest(self):
+        digest = hashlib.sha1(json.dumps([RENDERER_VERSION, self.kind, self.options], sort_keys=True).encode())
+        for name in sorted(self.data):
+            array = np.ascontiguousarray(self.data[name])
+            digest.update(f'{name}:{array.dtype.str}:{array.shape}'.encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+
+def _draw_scatter(ax, data, options):
+    ax.scatter(data['x'], data['y'], color='blue', alpha=0.5, label=options.get('label'))
+    if options.get('identity_line'):
+        low, high = min(data['x'].min(), data['y'].min()), max(data['x'].max(), data['y'].max())
+        ax.plot([low, high], [low, high], linestyle='--', color='red', label='Perfect Prediction Line')
+    if options.get('zero_line'):
+        ax.axhline(y=0, color='red', linestyle='--')
+
+
+def _draw_histogram(ax, data, options):
+    ax.hist(data['values'], bins=options.get('bins', 30), color='blue', alpha=0.5, edgecolor='black')
+
+
+def _draw_curves(ax, data, options):
+    for name, label in options['curves'].items():
+        ax.plot(data['x'], data[name], marker=options.get('marker'), label=label)
+
+
+def _draw_bars(ax, data, options):
+    positions = np.arange(len(data['heights']))
+    ax.bar(positions, data['heights'], align='center')
+    ax.set_xticks(positions)
+    ax.set_xticklabels(options['labels'], rotation=90)
+
+
+# Historical series with its trend line extended over the forecast months (Optimal_Models notebook)
+def _draw_trend(ax, data, options):
+    history, predictions = data['history'], data['predictions']
+    steps = np.arange(len(history) + len(predictions))
+    ax.plot(steps[:len(history)], history, marker='o', label='Historical Data')
+    ax.plot(steps, data['trend'], color='blue', linestyle='--', label='Trend line')
+    ax.scatter(steps[len(history):], predictions, color='yellow', label=options.get('prediction_label', 'Predictions'))
+    ticks = np.arange(0, len(steps), 12)
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(options['year_labels'][:len(ticks)], rotation=90)
+
+
+DRAW = {
+    'scatter': _draw_scatter,
+    'histogram': _draw_histogram,
+    'curves': _draw_curves,
+    'bars': _draw_bars,
+    'trend': _draw_trend
+}
+
+
+# Drawing a figure straight onto an Agg canvas: no display, no pyplot state, safe in any process
+def render_figure(spec):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    options = spec.options
+    figure = Figure(figsize=options.get('figsize', (10, 6)))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(1, 1, 1)
+    DRAW[spec.kind](ax, spec.data, options)
+    ax.set_title(options.get('title', ''))
+    ax.set_xlabel(options.get('xlabel', ''))
+    ax.set_ylabel(options.get('ylabel', ''))
+    ax.grid(options.get('grid', True))
+    if ax.get_legend_handles_labels()[0]:
+        ax.legend(loc='best')
+    figure.tight_layout()
+
+    directory = os.path.dirname(spec.path)
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{spec.path}.{os.getpid()}.tmp.png'
+    figure.savefig(tmp_path)
+    os.replace(tmp_path, spec.path)
+    return spec.path
+
+
+def _load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+# Drawing every figure whose inputs changed (or whose file is missing), spread over a process pool
+# Returns the paths that were drawn; unchanged figures are skipped
+def render_figures(specs, workers=None, force=False, manifest_path=MANIFEST_FILE):
+    manifest = _load_manifest(manifest_path)
+    digests = {spec.path: spec.digest() for spec in specs}
+    pending = [spec for spec in specs
+               if force or manifest.get(spec.path) != digests[spec.path] or not os.path.exists(spec.path)]
+
+    workers = min(workers or os.cpu_count(), len(pending))
+    if workers <= 1 or len(pending) < MIN_PARALLEL_FIGURES:
+        rendered = [render_figure(spec) for spec in pending]
+    else:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            chunk_size = max(1, len(pending) // (workers * 4))
+            rendered = list(executor.map(render_figure, pending, chunksize=chunk_size))
+
+    if rendered:
+        # Re-reading the manifest keeps entries written meanwhile by other scripts
+        manifest = _load_manifest(manifest_path)
+        manifest.update({path: digests[path] for path in rendered})
+        directory = os.path.dirname(manifest_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with open(f'{manifest_path}.{os.getpid()}.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(f'{manifest_path}.{os.getpid()}.tmp', manifest_path)
+    return rendered
+
+
+# Actual vs predicted, residuals and residual histogram of a model's test predictions
+def diagnostic_figures(model_name, actual, predicted, output_dir=DIAGNOSTIC_PLOTS_DIR):
+    actual = np.asarray(actual, dtype=np.float64)
+    predicted = np.asarray(predicted, dtype=np.float64).reshape(-1)
+    residuals = actual - predicted
+    directory = os.path.join(output_dir, model_name)
+    return [
+        FigureSpec(os.path.join(directory, f'{model_name}_actual_vs_predicted.png'), 'scatter',
+                   {'x': actual, 'y': predicted},
+                   {'title': f'{model_name} - Actual vs Predicted Values (Test Set)', 'xlabel': 'Actual Values',
+                    'ylabel': 'Predicted Values', 'label': 'Actual vs Predicted Values', 'identity_line': True}),
+        FigureSpec(os.path.join(directory, f'{model_name}_residuals.png'), 'scatter',
+                   {'x': actual, 'y': residuals},
+                   {'title': f'{model_name} - Residuals vs Actual Values', 'xlabel': 'Actual Values',
+                    'ylabel': 'Residuals', 'zero_line': True}),
+        FigureSpec(os.path.join(directory, f'{model_name}_residual_histogram.png'), 'histogram',
+                   {'values': residuals},
+                   {'title': f'{model_name} - Histogram of Residuals', 'xlabel': 'Residuals', 'ylabel': 'Frequency'})
+    ]
+
+
+# Line plot of one or more curves sharing an x axis (loss or learning curves)
+def curve_figure(path, x, curves, title, xlabel, ylabel, marker=None):
+    data = {'x': x, **{f'curve_{i}': values for i, values in enumerate(curves.values())}}
+    labels = {f'curve_{i}': label for i, label in enumerate(curves)}
+    return FigureSpec(path, 'curves', data, {'curves': labels, 'title': title, 'xlabel': xlabel,
+                                             'ylabel': ylabel, 'marker': marker})
+
+
+# Bar chart with one labelled bar per value (feature importances)
+def bar_figure(path, labels, heights, title, xlabel, ylabel):
+    return FigureSpec(path, 'bars', {'heights': heights}, {'labels': [str(label) for label in labels], 'title': title,
+                                                           'xlabel': xlabel, 'ylabel': ylabel, 'grid': False})
+
+
+# One trend figure per series of trend_forecast.trend_predictions, in Area{n} folders as the notebook wrote them
+def trend_figures(predictions_df, cube, first_year, last_year, output_dir=TREND_PLOTS_DIR):
+    history = np.asarray(cube.view(first_year, last_year))
+    specs = []
+    for (area, agg_id), series_predictions in predictions_df.groupby(['Area', 'Agg_id'], sort=False):
+        series = history[np.searchsorted(cube.areas, area), :, :, np.searchsorted(cube.agg_ids, agg_id)].reshape(-1)
+        # Months without a record were missing from the database, so they are not drawn
+        series = series[series > 0]
+        predictions = series_predictions['Lr_prediction'].values
+
+        # The trend line through the predictions, continued back over the historical months
+        slope = predictions[1] - predictions[0] if len(predictions) > 1 else 0.0
+        trend = predictions[0] + slope * (np.arange(len(series) + len(predictions)) - len(series))
+
+        # Sanitising agg_des string to remove characters not supported in filenames
+        agg_des = re.sub(r'[\\/*?:"<>|]', '_', AGG_DESCRIPTIONS[agg_id])
+        path = os.path.join(output_dir, f'Area{area}', f'Area{area}_{agg_des}.png')
+        specs.append(FigureSpec(path, 'trend', {'history': series, 'trend': trend, 'predictions': predictions}, {
+            'title': f'Total {agg_des} in Area {area} ({first_year}-{last_year})',
+            'xlabel': 'Months',
+            'ylabel': 'Total Theft Crimes',
+            'prediction_label': f'Predictions for {last_year + 1}',
+            'year_labels': [str(year) for year in range(first_year, last_year + 2)]
+        }))
+    return specs
@@ -0,0 +1,130 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from crime_data import CACHE_DIR, PREDICTIONS_DIR, PREDICTION_FILES, file_signature, load_predictions
+
+# Names of the files making up the cached rollup
+ROLLUP_FILE = 'prediction_rollup.npy'
+ROLLUP_META_FILE = 'prediction_rollup.json'
+
+# The recorded crime counts are kept next to the models so the same query gives actual totals
+ACTUAL = 'actual'
+
+
+# Per-area prediction totals for any month range and crime category subset
+# cumulative[model, agg_id, m, area] holds the total of months before index m, so a range costs one subtraction
+class PredictionRollup:
+    def __init__(self, cumulative, models, agg_ids, months, areas):
+        self.cumulative = cumulative
+        self.models = models
+        self.agg_ids = agg_ids
+        self.months = months
+        self.areas = areas
+        # Changes whenever the totals do, for the ETags of history_service.py
+        self.version = hashlib.sha1(np.ascontiguousarray(cumulative).tobytes() + json.dumps(models).encode()).hexdigest()[:16]
+
+    def _index(self, axis, values, name):
+        idx = np.searchsorted(axis, values)
+        if np.any(idx >= len(axis)) or np.any(axis[np.minimum(idx, len(axis) - 1)] != values):
+            raise ValueError(f'Unknown {name}: {values}')
+        return idx
+
+    # Totals per area for months first_month..last_month (inclusive) and the given agg_ids (all if None)
+    def area_totals(self, model, first_month=None, last_month=None, agg_ids=None):
+        if model not in self.models:
+            raise ValueError(f'Unknown model: {model} (available: {", ".join(self.models)})')
+        model_idx = self.models.index(model)
+        start = 0 if first_month is None else int(self._index(self.months, first_month, 'month'))
+        stop = len(self.months) if last_month is None else int(self._index(self.months, last_month, 'month')) + 1
+        if start >= stop:
+            raise ValueError(f'First month {first_month} is after last month {last_month}')
+        agg_idx = slice(None) if agg_ids is None else self._index(self.agg_ids, np.asarray(agg_ids), 'agg_id')
+
+        cumulative = self.cumulative[model_idx, agg_idx]
+        totals = (cumulative[..., stop, :] - cumulative[..., start, :]).reshape(-1, len(self.areas)).sum(axis=0)
+        return dict(zip(self.areas.tolist(), totals.tolist()))
+
+
+# Paths of the prediction CSVs that exist, keyed by model
+def _prediction_paths(predictions_dir):
+    paths = {model: os.path.join(predictions_dir, file_name) for model, (file_name, _) in PREDICTION_FILES.items()}
+    return {model: path for model, path in paths.items() if os.path.exists(path)}
+
+
+# Reading every prediction CSV once into a (model, agg_id, month, area) array with cumulative sums along month
+def build_rollup(predictions_dir=PREDICTIONS_DIR, cache_dir=CACHE_DIR):
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    paths = _prediction_paths(predictions_dir)
+    frames = {model: load_predictions(model, predictions_dir) for model in paths}
+    every_row = pd.concat(frames.values(), ignore_index=True)
+    areas = np.sort(every_row['area'].unique())
+    months = np.sort(every_row['month'].unique())
+    agg_ids = np.sort(every_row['agg_id'].unique())
+
+    models = list(frames) + [ACTUAL]
+    values = np.zeros((len(models), len(agg_ids), len(months), len(areas)))
+    for model_idx, model in enumerate(models):
+        # The recorded counts are the same in every prediction file, so the first one is used
+        df = frames[model] if model != ACTUAL else next(iter(frames.values()))
+        column = 'prediction' if model != ACTUAL else 'total_crimes'
+        position = (model_idx, np.searchsorted(agg_ids, df['agg_id'].values),
+                    np.searchsorted(months, df['month'].values), np.searchsorted(areas, df['area'].values))
+        # Each cell is rounded half up before summing, the same as the map does with Math.round
+        np.add.at(values, position, np.floor(df[column].values + 0.5))
+
+    # A leading zero month lets every range be answered as cumulative[stop] - cumulative[start]
+    cumulative = np.zeros((len(models), len(agg_ids), len(months) + 1, len(areas)))
+    np.cumsum(values, axis=2, out=cumulative[:, :, 1:])
+
+    rollup_path = os.path.join(cache_dir, ROLLUP_FILE)
+    np.save(f'{rollup_path}.{os.getpid()}.npy', cumulative)
+    os.replace(f'{rollup_path}.{os.getpid()}.npy', rollup_path)
+
+    meta = {
+        'source': file_signature(paths),
+        'models': models,
+        'agg_ids': agg_ids.tolist(),
+        'months': months.tolist(),
+        'areas': areas.tolist()
+    }
+    meta_path = os.path.join(cache_dir, ROLLUP_META_FILE)
+    with open(f'{meta_path}.{os.getpid()}.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(f'{meta_path}.{os.getpid()}.tmp', meta_path)
+    return meta
+
+
+# Opening the cached rollup, rebuilding it first if any prediction CSV changed
+def load_rollup(predictions_dir=PREDICTIONS_DIR, cache_dir=CACHE_DIR, rebuild=False):
+    meta_path = os.path.join(cache_dir, ROLLUP_META_FILE)
+    meta = None
+    if os.path.exists(meta_path) and not rebuild:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['source'] != file_signature(_prediction_paths(predictions_dir)):
+            meta = None
+    if meta is None:
+        meta = build_rollup(predictions_dir, cache_dir)
+
+    cumulative = np.load(os.path.join(cache_dir, ROLLUP_FILE), mmap_mode='r')
+    return PredictionRollup(cumulative, meta['models'], np.array(meta['agg_ids']),
+                            np.array(meta['months']), np.array(meta['areas']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-area prediction totals from the precomputed rollup')
+    parser.add_argument('--model', default='lstm', help=f'Model to total ({", ".join(PREDICTION_FILES)} or {ACTUAL})')
+    parser.add_argument('--months', type=int, nargs='+', help='A single month or a first and last month')
+    parser.add_argument('--agg-ids', type=int, nargs='+', help='Crime categories to include (default: all)')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the rollup even if it is up to date')
+    args = parser.parse_args()
+
+    rollup = load_rollup(rebuild=args.rebuild)
+    first_month = args.months[0] if args.months else None
+    last_month = args.months[-1] if args.months else None
+    print(json.dumps(rollup.area_totals(args.model, first_month, last_month, args.agg_ids)))
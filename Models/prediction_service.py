@@ -0,0 +1,199 @@
+import json
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from crime_data import load_cube
+from numpy_inference import SOURCE_FILES as MODEL_FILES, inverse_scale_counts, load_network
+from windowing import SeriesWindows, scale_series, series_from_cube, series_positions
+
+
+# Raised for queries the models cannot answer (unknown area, crime category, etc.)
+class QueryError(ValueError):
+    pass
+
+
+# Shared checks and cube lookups for both models
+class Predictor:
+    def __init__(self, name, cube, engine='auto'):
+        self.model, self.scaler = load_network(name, engine)
+        self.cube = cube
+
+    # Cube positions of a query, the year defaulting to the latest one available
+    def positions(self, area, month, agg_id, year=None):
+        year = self.cube.years[-1] if year is None else year
+        lookups = [(self.cube.areas, area, 'area'), (self.cube.years, year, 'year'),
+                   (self.cube.months, month, 'month'), (self.cube.agg_ids, agg_id, 'agg_id')]
+        indices = []
+        for axis, value, name in lookups:
+            idx = int(np.searchsorted(axis, value))
+            if idx >= len(axis) or axis[idx] != value:
+                raise QueryError(f'Unknown {name}: {value}')
+            indices.append(idx)
+        return indices
+
+    # One model.predict call for a whole batch of prepared inputs
+    def predict_batch(self, X):
+        return inverse_scale_counts(self.scaler, self.model.predict_on_batch(np.stack(X)))
+
+
+# ANN inputs: the scaled (Month, Area, Crime_Category) of the query
+class AnnPredictor(Predictor):
+    def prepare(self, area, month, agg_id, year=None):
+        self.positions(area, month, agg_id, year)
+        row = np.array([[month, area, agg_id, 0]], dtype=np.float32)
+        return (row * self.scaler.scale_ + self.scaler.min_)[0, :3].astype(np.float32)
+
+
+# LSTM inputs: the scaled months leading up to the query, taken from the crime cube
+class LstmPredictor(Predictor):
+    def __init__(self, name, cube, engine='auto'):
+        super().__init__(name, cube, engine)
+        series = scale_series(series_from_cube(cube.counts, cube.areas, cube.months, cube.agg_ids), self.scaler)
+        self.windows = SeriesWindows(series, n_in=self.model.input_shape[1], n_out=1)
+
+    def prepare(self, area, month, agg_id, year=None):
+        area_idx, year_idx, month_idx, agg_idx = self.positions(area, month, agg_id, year)
+        series_idx, time_idx = series_positions(area_idx, year_idx, month_idx, agg_idx,
+                                                len(self.cube.months), len(self.cube.agg_ids))
+        try:
+            sample = self.windows.sample_index(series_idx, time_idx)
+        except IndexError as error:
+            raise QueryError(str(error))
+        return self.windows.take([sample])[0][0]
+
+
+# Collects concurrent requests for one model and answers them with a single predict call
+class MicroBatcher:
+    def __init__(self, predictor, max_batch=256, max_wait=0.005):
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    # Queue prepared inputs; the returned future resolves to their predictions
+    def submit(self, inputs):
+        future = Future()
+        self.requests.put((inputs, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0][0])
+            # Keep collecting until the batch is full or nothing else arrives within max_wait
+            while size < self.max_batch:
+                try:
+                    item = self.requests.get(timeout=self.max_wait)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            inputs = [x for item, _ in batch for x in item]
+            try:
+                predictions = self.predictor.predict_batch(inputs)
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            start = 0
+            for item, future in batch:
+                future.set_result(predictions[start:start + len(item)].tolist())
+                start += len(item)
+
+
+# Handles GET /predict?model=lstm&area=1&month=3&agg_id=300 and POST /predict {"model": ..., "queries": [...]}
+class PredictionHandler(BaseHTTPRequestHandler):
+    batchers = {}
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _answer(self, model_name, queries):
+        if model_name not in self.batchers:
+            raise QueryError(f'Unknown model: {model_name} (available: {", ".join(self.batchers)})')
+        batcher = self.batchers[model_name]
+        inputs = [batcher.predictor.prepare(int(q['area']), int(q['month']), int(q['agg_id']),
+                                            int(q['year']) if q.get('year') is not None else None)
+                  for q in queries]
+        if not inputs:
+            return []
+        return batcher.submit(inputs).result()
+
+    def _handle(self, model_name, queries):
+        try:
+            predictions = self._answer(model_name, queries)
+        except (QueryError, KeyError, TypeError, ValueError) as error:
+            self._send_json(400, {'error': str(error)})
+            return
+        except Exception as error:
+            self._send_json(500, {'error': f'Prediction failed: {error}'})
+            return
+        self._send_json(200, {'model': model_name, 'predictions': predictions})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            self._send_json(200, {'status': 'ok', 'models': list(self.batchers)})
+        elif url.path == '/predict':
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            self._handle(params.pop('model', 'lstm'), [params])
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/predict':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError:
+            self._send_json(400, {'error': 'Request body is not valid JSON'})
+            return
+        if not isinstance(body, dict) or not isinstance(body.get('queries', []), list):
+            self._send_json(400, {'error': 'Request body must be an object with a list of queries'})
+            return
+        self._handle(body.get('model', 'lstm'), body.get('queries', []))
+
+    # Keeps the console quiet under many small dashboard queries
+    def log_message(self, format, *args):
+        pass
+
+
+# Loading every requested model and scaler once and serving them until interrupted
+def serve(models=('ann', 'lstm'), host='127.0.0.1', port=8000, max_batch=256, max_wait=0.005, engine='auto'):
+    predictors = {'ann': AnnPredictor, 'lstm': LstmPredictor}
+    cube = load_cube()
+    PredictionHandler.batchers = {name: MicroBatcher(predictors[name](name, cube, engine), max_batch, max_wait)
+                                  for name in models}
+    server = ThreadingHTTPServer((host, port), PredictionHandler)
+    print(f'Serving {", ".join(models)} predictions on http://{host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Persistent batched prediction service for the ANN and LSTM models')
+    parser.add_argument('--models', nargs='+', choices=sorted(MODEL_FILES), default=['ann', 'lstm'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch', type=int, default=256, help='Largest number of queries per model.predict call')
+    parser.add_argument('--max-wait-ms', type=float, default=5, help='How long to wait for more queries before predicting')
+    parser.add_argument('--engine', choices=['auto', 'numpy', 'keras'], default='auto', help='NumPy exports (numpy_inference.py) or TensorFlow')
+    args = parser.parse_args()
+    serve(args.models, args.host, args.port, args.max_batch, args.max_wait_ms / 1000, args.engine)
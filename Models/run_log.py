@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import platform
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime
+from crime_data import BASE_DIR, CACHE_DIR
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# One JSON file per run, named <script>_<start time>_<pid>.json; CRIME_RUN_LOG=0 turns logging off
+RUN_LOG_DIR = os.environ.get('CRIME_RUN_LOG_DIR', os.path.join(CACHE_DIR, 'runs'))
+
+# Environment variables that cap the thread pools of NumPy/sklearn (OpenMP, BLAS) and TensorFlow
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                    'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS']
+
+# Capping the thread pools of worker processes spawned inside the block (caps already set are kept)
+# The caps go into the parent's environment, which the workers inherit: OpenMP and BLAS read them when NumPy is first
+# imported, which happens while a spawned worker unpickles its task, before any code of the task runs
+@contextmanager
+def single_threaded_workers():
+    saved = {variable: os.environ.get(variable) for variable in THREAD_VARIABLES}
+    for variable in THREAD_VARIABLES:
+        os.environ.setdefault(variable, '1')
+    try:
+        yield
+    finally:
+        for variable, value in saved.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+
+
+# Stage measurements compared by the run diff report
+COMPARED = ['wall_seconds', 'cpu_seconds', 'peak_rss_mb']
+
+
+# A field of /proc/self/status in MB (VmRSS: current, VmHWM: peak resident memory), None off Linux
+def _status_mb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+# Resetting the peak resident memory (VmHWM) so it covers the next stage only; False where that is not possible
+def _reset_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+# Peak resident memory in MB since the last reset, or over the whole process where it cannot be reset
+def _peak_rss_mb():
+    peak = _status_mb('VmHWM')
+    if peak is None and resource is not None:
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+    return peak
+
+
+# Seconds since the process started (interpreter start-up and imports before the run log was created)
+def _process_age():
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+# CPU time of finished worker processes (process pools), which process_time does not include
+def _children_cpu():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+# Thread pools in use: the environment caps, the native OpenMP/BLAS pools sklearn and NumPy run on,
+# and TensorFlow's pools once the script has imported it (0 means TensorFlow picks the number of cores)
+def thread_counts():
+    counts = {'cpu_count': os.cpu_count(),
+              'environment': {variable: os.environ[variable] for variable in THREAD_VARIABLES if variable in os.environ}}
+    try:
+        from threadpoolctl import threadpool_info
+        # Keyed by library, since the order the pools are found in changes from run to run
+        counts['native_pools'] = {f"{pool['internal_api']} {os.path.basename(pool['filepath'])}": pool['num_threads']
+                                  for pool in threadpool_info()}
+    except ImportError:
+        pass
+    if 'tensorflow' in sys.modules:
+        threading = sys.modules['tensorflow'].config.threading
+        counts['tensorflow'] = {'intra_op': threading.get_intra_op_parallelism_threads(),
+                                'inter_op': threading.get_inter_op_parallelism_threads()}
+    return counts
+
+
+# Short hash of the checked-out commit, None outside a git checkout
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True, timeout=5)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# Wall time, CPU time and peak resident memory of every stage of a script run, written as JSON at exit
+# Stages are either marked with begin(name), which ends the previous stage, or wrapped in `with run.stage(name)`
+class RunLog:
+    def __init__(self, name, directory=RUN_LOG_DIR):
+        self.name = name
+        self.directory = directory
+        self.started = datetime.now()
+        self.stages = []
+        self.current = None
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+        # Everything before the run log was created: interpreter start-up and imports (TensorFlow alone takes seconds)
+        age = _process_age()
+        if age is not None:
+            self.stages.append({'name': 'startup', 'wall_seconds': age, 'cpu_seconds': self.start_cpu,
+                                'child_cpu_seconds': 0.0, 'rss_start_mb': None, 'rss_end_mb': _status_mb('VmRSS'),
+                                'peak_rss_mb': _peak_rss_mb()})
+        self.peak_per_stage = _reset_peak()
+
+    def begin(self, name):
+        self.end()
+        if self.peak_per_stage:
+            _reset_peak()
+        self.current = {'name': name, 'wall': time.perf_counter(), 'cpu': time.process_time(),
+                        'child_cpu': _children_cpu(), 'rss_start_mb': _status_mb('VmRSS')}
+
+    def end(self):
+        if self.current is None:
+            return
+        stage, self.current = self.current, None
+        self.stages.append({
+            'name': stage['name'],
+            'wall_seconds': time.perf_counter() - stage['wall'],
+            'cpu_seconds': time.process_time() - stage['cpu'],
+            'child_cpu_seconds': _children_cpu() - stage['child_cpu'],
+            'rss_start_mb': stage['rss_start_mb'],
+            'rss_end_mb': _status_mb('VmRSS'),
+            'peak_rss_mb': _peak_rss_mb()
+        })
+
+    @contextmanager
+    def stage(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def summary(self):
+        return {
+            'script': self.name,
+            'argv': sys.argv[1:],
+            'started': self.started.isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'threads': thread_counts(),
+            'peak_rss_scope': 'stage' if self.peak_per_stage else 'process',
+            'wall_seconds': time.perf_counter() - self.start_wall,
+            'cpu_seconds': time.process_time() - self.start_cpu,
+            'stages': self.stages
+        }
+
+    def save(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{self.name}_{self.started:%Y%m%d-%H%M%S}_{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(f'{path}.tmp', path)
+        return path
+
+    def finish(self):
+        self.end()
+        path = self.save()
+        print(f'Run log written to {path}')
+        return path
+
+
+# Run log of the calling script, ended and saved when the script exits
+def start_run(name=None, directory=RUN_LOG_DIR):
+    name = name or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    run = RunLog(name, directory)
+    if os.environ.get('CRIME_RUN_LOG', '1') != '0':
+        atexit.register(run.finish)
+    return run
+
+
+# Run logs in a folder, oldest first, optionally of one script only
+def list_runs(script=None, directory=RUN_LOG_DIR):
+    if not os.path.exists(directory):
+        return []
+    names = [name for name in os.listdir(directory) if name.endswith('.json')]
+    if script:
+        names = [name for name in names if name.rsplit('_', 2)[0] == script]
+    paths = [os.path.join(directory, name) for name in names]
+    return sorted(paths, key=os.path.getmtime)
+
+
+def load_run(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Stage by stage differences between two runs (stages matched by name, repeated names numbered in order)
+def compare_runs(before, after):
+    import pandas as pd
+
+    def by_stage(run):
+        seen = {}
+        rows = {}
+        for stage in run['stages']:
+            seen[stage['name']] = seen.get(stage['name'], 0) + 1
+            label = stage['name'] if seen[stage['name']] == 1 else f'{stage["name"]} #{seen[stage["name"]]}'
+            rows[label] = {measure: stage.get(measure) for measure in COMPARED}
+        rows['total'] = {'wall_seconds': run['wall_seconds'], 'cpu_seconds': run['cpu_seconds'],
+                         'peak_rss_mb': max((stage['peak_rss_mb'] or 0) for stage in run['stages']) if run['stages'] else None}
+        return pd.DataFrame.from_dict(rows, orient='index', dtype=float)
+
+    first, second = by_stage(before), by_stage(after)
+    stages = list(dict.fromkeys(list(first.index) + list(second.index)))
+    first, second = first.reindex(stages), second.reindex(stages)
+    report = pd.DataFrame(index=stages)
+    for measure in COMPARED:
+        report[f'{measure} before'] = first[measure]
+        report[f'{measure} after'] = second[measure]
+        report[f'{measure} change %'] = (second[measure] - first[measure]) / first[measure] * 100
+    return report
+
+
+# Thread settings that differ between two runs, as (setting, before, after)
+def thread_differences(before, after):
+    def flatten(value, prefix=''):
+        if isinstance(value, dict):
+            return {key: item for name, child in value.items() for key, item in flatten(child, f'{prefix}{name}.').items()}
+        return {prefix[:-1]: value}
+    first, second = flatten(before.get('threads', {})), flatten(after.get('threads', {}))
+    return [(key, first.get(key), second.get(key)) for key in sorted(set(first) | set(second)) if first.get(key) != second.get(key)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='List the run logs of the model scripts or compare two of them stage by stage')
+    commands = parser.add_subparsers(dest='command', required=True)
+    list_parser = commands.add_parser('list', help='List the run logs, oldest first')
+    list_parser.add_argument('--script', help='Only the runs of this script (e.g. RFRST)')
+    compare_parser = commands.add_parser('compare', help='Diff two runs (default: the two latest runs of --script)')
+    compare_parser.add_argument('runs', nargs='*', help='Two run log files, before and after')
+    compare_parser.add_argument('--script', help='Compare the two latest runs of this script')
+    for command_parser in (list_parser, compare_parser):
+        command_parser.add_argument('--directory', default=RUN_LOG_DIR, help='Folder of the run logs')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for path in list_runs(args.script, args.directory):
+            run = load_run(path)
+            print(f'{os.path.basename(path)}: {run["wall_seconds"]:.1f}s wall, {run["cpu_seconds"]:.1f}s CPU, commit {run["commit"]}')
+    else:
+        paths = args.runs or list_runs(args.script, args.directory)[-2:]
+        if len(paths) != 2:
+            parser.error('compare needs two run logs, or a --script with at least two runs')
+        before, after = load_run(paths[0]), load_run(paths[1])
+        print(f'Before: {paths[0]} (commit {before["commit"]})\nAfter:  {paths[1]} (commit {after["commit"]})\n')
+        print(compare_runs(before, after).round(2).to_string())
+        differences = thread_differences(before, after)
+        if differences:
+            print('\nThread settings that changed:')
+            for setting, first, second in differences:
+                print(f'  {setting}: {first} -> {second}')
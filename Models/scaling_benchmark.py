@@ -0,0 +1,264 @@
+import os
+import json
+import importlib
+import argparse
+import multiprocessing
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from crime_data import EVALUATION_DIR, load_cube
+from evaluation import regression_metrics
+from backtest import BACKTEST_MODELS, FIT_PREDICT, PeriodRows, model_params, period_rows_arrays
+from run_log import RunLog, git_commit, start_run, thread_counts
+
+# One JSON file per benchmark run, named scaling_<start time>_<commit>.json, kept with the other evaluation results
+# so runs on different commits can be compared
+BENCHMARK_DIR = os.path.join(EVALUATION_DIR, 'Scaling Benchmarks')
+
+# Multiples of the 21 areas x 10 crime categories of the crime cube
+SCALES = [1, 10, 100]
+
+SEED = 11
+
+# Seconds one model may take at one scale (generating the grid, fitting and predicting) before it is stopped
+TIMEOUT = 1800
+
+# Modules each model's fit imports; they are imported before the fit is timed, since TensorFlow alone takes seconds
+MODEL_IMPORTS = {
+    'lr': ['trend_forecast'],
+    'rf': ['sklearn.ensemble'],
+    'knn': ['knn_index'],
+    'svr': ['svr_engines'],
+    'ann': ['tensorflow', 'ann_training'],
+    'lstm': ['tensorflow', 'windowing']
+}
+
+# Measurements compared between two benchmark runs (all worse when higher), each with the smallest growth counted
+# as a regression, since timings of a few milliseconds vary by more than any tolerance from run to run
+COMPARED = {'Fit Seconds': 1.0, 'Predict Seconds': 1.0, 'Fit Peak MB': 20.0, 'Predict Peak MB': 20.0}
+
+
+# Area and crime category multipliers of a scale: the extra series are all new areas (reporting districts,
+# city blocks), all new crime categories, or both, split as evenly as the scale's divisors allow
+def grid_factors(scale, grow='areas'):
+    if grow == 'areas':
+        return scale, 1
+    if grow == 'categories':
+        return 1, scale
+    agg_factor = max(d for d in range(1, int(np.sqrt(scale)) + 1) if scale % d == 0)
+    return scale // agg_factor, agg_factor
+
+
+# Synthetic [area, year, month, agg_id] counts with area_factor times the areas and agg_factor times the crime
+# categories of the cube, over the same years and months
+# The first copy of every area and category is the cube itself, so scale 1 is the real train/test split; every
+# other series follows a randomly drawn real area and category (its trend and seasonality), at a level scaled by a
+# lognormal factor as spread as the levels of the real areas are, with Poisson noise on every month
+def synthetic_counts(cube, area_factor, agg_factor, seed=SEED):
+    rng = np.random.default_rng(seed)
+    counts = np.asarray(cube.counts, dtype=np.float64)
+    n_areas, n_years, n_months, n_aggs = counts.shape
+
+    levels = np.log(np.maximum(counts.mean(axis=(1, 2)), 1))
+    sigma = float(levels.std(axis=0).mean())
+    template_areas = np.concatenate([np.arange(n_areas), rng.integers(n_areas, size=n_areas * (area_factor - 1))])
+    template_aggs = np.concatenate([np.arange(n_aggs), rng.integers(n_aggs, size=n_aggs * (agg_factor - 1))])
+    level = rng.lognormal(-sigma ** 2 / 2, sigma, size=(len(template_areas), 1, 1, len(template_aggs)))
+    synthetic = rng.poisson(counts[template_areas][:, :, :, template_aggs] * level)
+    synthetic[:n_areas, :, :, :n_aggs] = counts
+
+    # New areas and categories are numbered on from the largest real ones
+    areas = np.concatenate([cube.areas, cube.areas.max() + np.arange(1, len(template_areas) - n_areas + 1)])
+    agg_step = int(np.diff(cube.agg_ids).min())
+    agg_ids = np.concatenate([cube.agg_ids, cube.agg_ids.max() + agg_step * np.arange(1, len(template_aggs) - n_aggs + 1)])
+    return synthetic, areas, agg_ids
+
+
+# Row table of a synthetic grid and its single fold: the training years of the cube, then the test year
+def synthetic_rows(cube, area_factor, agg_factor, seed=SEED):
+    counts, areas, agg_ids = synthetic_counts(cube, area_factor, agg_factor, seed)
+    rows, stats = period_rows_arrays(counts, areas, cube.years, cube.months, agg_ids)
+    data = PeriodRows(rows, cube.years, cube.months, len(areas), len(agg_ids), stats)
+    n_train_periods = cube.split_view('train').shape[1] * len(cube.months)
+    return data, (0, n_train_periods, data.n_periods)
+
+
+# One worker process per model and scale, so every measurement starts from a fresh interpreter and the peak
+# memory of one model never carries over into the next
+def _benchmark_worker(connection, model, params, scale, grow, seed):
+    try:
+        run = RunLog(f'{model}_x{scale}')
+        run.begin('import')
+        for module in MODEL_IMPORTS[model]:
+            importlib.import_module(module)
+        run.begin('generate')
+        data, fold = synthetic_rows(load_cube(), *grid_factors(scale, grow), seed)
+        # The backtest's KNN fits never use the KD-tree cache, so every run builds its own tree
+        run.begin('fit')
+        predictions = FIT_PREDICT[model](data, fold, params, run)
+        run.end()
+        start, cut, stop = fold
+        actual = data.slice(cut, stop, ['total_crimes'])[:, 0]
+        connection.send({'stages': run.stages, 'train_rows': (cut - start) * data.period_size, 'test_rows': len(actual),
+                         'metrics': regression_metrics(actual, np.asarray(predictions, dtype=np.float64).reshape(-1))})
+    except Exception as error:
+        connection.send({'error': f'{type(error).__name__}: {error}'})
+
+
+# Running one model at one scale in its own process, stopping it after `timeout` seconds
+def _run_isolated(context, model, params, scale, grow, seed, timeout):
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_benchmark_worker, args=(sender, model, params, scale, grow, seed))
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            return {'error': 'timeout'}
+        return receiver.recv()
+    except EOFError:
+        # Killed without a word, most often by the out-of-memory killer
+        process.join()
+        return {'error': f'worker exited with code {process.exitcode}'}
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        receiver.close()
+
+
+# Fit and predict time and memory of every model at every scale, one measurement at a time so they never compete
+# for cores; a model that times out or fails is not run at the larger scales
+def run_benchmark(models, scales=SCALES, grow='areas', params=None, timeout=TIMEOUT, seed=SEED):
+    cube = load_cube()
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for model in models:
+        overrides = (params or {}).get(model)
+        stopped = None
+        for scale in sorted(scales):
+            area_factor, agg_factor = grid_factors(scale, grow)
+            row = {'Model': model, 'Scale': scale, 'Areas': len(cube.areas) * area_factor,
+                   'Categories': len(cube.agg_ids) * agg_factor}
+            if stopped:
+                results.append({**row, 'Status': f'skipped ({stopped})'})
+                continue
+
+            print(f'{model} at {scale}x ({row["Areas"]} areas, {row["Categories"]} categories)...', flush=True)
+            outcome = _run_isolated(context, model, model_params(model, overrides), scale, grow, seed, timeout)
+            if 'error' in outcome:
+                stopped = f'{outcome["error"]} at {scale}x'
+                results.append({**row, 'Status': outcome['error']})
+                continue
+
+            stages = {stage['name']: stage for stage in outcome['stages']}
+            row.update({'Status': 'ok', 'Train Rows': outcome['train_rows'], 'Test Rows': outcome['test_rows'],
+                        'Generate Seconds': stages['generate']['wall_seconds']})
+            for stage in ['fit', 'predict']:
+                name = stage.capitalize()
+                row[f'{name} Seconds'] = stages[stage]['wall_seconds']
+                row[f'{name} CPU Seconds'] = stages[stage]['cpu_seconds']
+                row[f'{name} Peak MB'] = stages[stage]['peak_rss_mb']
+                # Memory the stage itself added on top of the data already loaded
+                if stages[stage]['peak_rss_mb'] is not None and stages[stage]['rss_start_mb'] is not None:
+                    row[f'{name} Added MB'] = stages[stage]['peak_rss_mb'] - stages[stage]['rss_start_mb']
+            results.append({**row, **{name: outcome['metrics'][name] for name in ['MSE', 'MAE', 'R']}})
+    return pd.DataFrame(results)
+
+
+# Writing a benchmark run with the commit, machine and settings it was measured on
+def save_results(results, settings, directory=BENCHMARK_DIR):
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    started = datetime.now()
+    commit = git_commit()
+    path = os.path.join(directory, f'scaling_{started:%Y%m%d-%H%M%S}_{commit or "nocommit"}.json')
+    summary = {'commit': commit, 'started': started.isoformat(timespec='seconds'), 'threads': thread_counts(),
+               'settings': settings, 'results': json.loads(results.to_json(orient='records'))}
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(f'{path}.tmp', path)
+    return path
+
+
+# Benchmark runs in a folder, oldest first
+def list_results(directory=BENCHMARK_DIR):
+    if not os.path.exists(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith('scaling_') and name.endswith('.json'))
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Time and memory of two benchmark runs side by side for every model and scale both measured, with the measurements
+# that grew by more than `tolerance` percent (and by more than their noise floor) marked as regressions
+def compare_results(before, after, tolerance=10):
+    def measured(run):
+        frame = pd.DataFrame(run['results'])
+        return frame[frame['Status'] == 'ok'].set_index(['Model', 'Scale'])
+
+    first, second = measured(before), measured(after)
+    report = pd.DataFrame(index=first.index.intersection(second.index, sort=False))
+    regressions = pd.Series(False, index=report.index)
+    for measure, floor in COMPARED.items():
+        if measure not in first or measure not in second:
+            continue
+        report[f'{measure} before'] = first[measure].reindex(report.index)
+        report[f'{measure} after'] = second[measure].reindex(report.index)
+        growth = report[f'{measure} after'] - report[f'{measure} before']
+        report[f'{measure} change %'] = growth / report[f'{measure} before'] * 100
+        regressions |= (report[f'{measure} change %'] > tolerance) & (growth > floor)
+    report['Regression'] = regressions
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit and predict time and memory of the models on synthetic grids '
+                                                 'with more areas and crime categories than the crime cube')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='Benchmark the models and store the results')
+    run_parser.add_argument('--models', nargs='+', choices=BACKTEST_MODELS, default=BACKTEST_MODELS)
+    run_parser.add_argument('--scales', nargs='+', type=int, default=SCALES, help='Multiples of the areas x categories grid')
+    run_parser.add_argument('--grow', choices=['areas', 'categories', 'both'], default='areas',
+                            help='Which axis the larger grids add series along')
+    run_parser.add_argument('--timeout', type=float, default=TIMEOUT, help='Seconds per model and scale')
+    run_parser.add_argument('--seed', type=int, default=SEED)
+    run_parser.add_argument('--params', type=json.loads, default={}, help='Parameter overrides per model, e.g. \'{"rf": {"n_estimators": 200}}\'')
+    list_parser = commands.add_parser('list', help='List the stored benchmark runs, oldest first')
+    compare_parser = commands.add_parser('compare', help='Compare two benchmark runs (default: the two latest)')
+    compare_parser.add_argument('runs', nargs='*', help='Two benchmark files, before and after')
+    compare_parser.add_argument('--tolerance', type=float, default=10, help='Percent growth reported as a regression')
+    for command_parser in (run_parser, list_parser, compare_parser):
+        command_parser.add_argument('--directory', default=BENCHMARK_DIR, help='Folder of the benchmark results')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run = start_run()
+        run.begin('benchmark')
+        results = run_benchmark(args.models, args.scales, args.grow, args.params, args.timeout, args.seed)
+        run.begin('write')
+        settings = {'models': args.models, 'scales': args.scales, 'grow': args.grow, 'timeout': args.timeout,
+                    'seed': args.seed, 'params': args.params}
+        path = save_results(results, settings, args.directory)
+        print(results.round(3).to_string(index=False))
+        print(f'Benchmark written to {path}')
+    elif args.command == 'list':
+        for path in list_results(args.directory):
+            benchmark = load_results(path)
+            print(f'{os.path.basename(path)}: commit {benchmark["commit"]}, {len(benchmark["results"])} measurements, '
+                  f'scales {benchmark["settings"]["scales"]}, grown along {benchmark["settings"]["grow"]}')
+    else:
+        paths = args.runs or list_results(args.directory)[-2:]
+        if len(paths) != 2:
+            parser.error('compare needs two benchmark files, or at least two stored runs')
+        before, after = load_results(paths[0]), load_results(paths[1])
+        if before['settings']['grow'] != after['settings']['grow']:
+            parser.error('the two runs grew their grids along different axes, so their scales are not the same grids')
+        print(f'Before: {paths[0]} (commit {before["commit"]})\nAfter:  {paths[1]} (commit {after["commit"]})\n')
+        report = compare_results(before, after, args.tolerance)
+        print(report.round(2).to_string())
+        if report['Regression'].any():
+            raise SystemExit(f'{int(report["Regression"].sum())} measurement(s) grew by more than {args.tolerance}%')
@@ -0,0 +1,97 @@
+import os
+import numpy as np
+
+# Shape types of the .shp format handled here (the files in Data/Shapefiles are polygons and polylines)
+NULL_SHAPE = 0
+POLYLINE = 3
+POLYGON = 5
+FILE_CODE = 9994
+HEADER_SIZE = 100
+
+
+# One record of a polyline/polygon shapefile: parts[i]:parts[i + 1] are the rows of points making up part i
+# points is a read-only [n, 2] (x, y) view straight into the memory-mapped file, nothing is copied
+class Shape:
+    def __init__(self, record, shape_type, bbox, parts, points):
+        self.record = record
+        self.shape_type = shape_type
+        self.bbox = bbox
+        self.parts = parts
+        self.points = points
+
+    # Coordinates of every part (ring or line) in turn
+    def rings(self):
+        return [self.points[start:stop] for start, stop in zip(self.parts[:-1], self.parts[1:])]
+
+
+# Shape type and bounding box (xmin, ymin, xmax, ymax) from the file header
+def read_header(path):
+    data = np.memmap(path, dtype=np.uint8, mode='r', shape=(HEADER_SIZE,))
+    if int(data[:4].view('>i4')[0]) != FILE_CODE:
+        raise ValueError(f'{path} is not a shapefile')
+    shape_type = int(data[32:36].view('<i4')[0])
+    return shape_type, tuple(float(value) for value in data[36:68].view('<f8'))
+
+
+# Reading the polyline or polygon records of a .shp file without a GIS library
+# The file is memory-mapped and only the small record headers are parsed in Python
+def read_shapes(path):
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    file_length = int(data[24:28].view('>i4')[0]) * 2
+    shapes = []
+    offset = HEADER_SIZE
+    while offset < min(file_length, len(data)):
+        record, content_length = (int(value) for value in data[offset:offset + 8].view('>i4'))
+        content = offset + 8
+        shape_type = int(data[content:content + 4].view('<i4')[0])
+        offset = content + content_length * 2
+        if shape_type == NULL_SHAPE:
+            continue
+        if shape_type not in (POLYLINE, POLYGON):
+            raise ValueError(f'Record {record} of {path} has unsupported shape type {shape_type}')
+
+        bbox = tuple(float(value) for value in data[content + 4:content + 36].view('<f8'))
+        n_parts, n_points = (int(value) for value in data[content + 36:content + 44].view('<i4'))
+        parts_start = content + 44
+        points_start = parts_start + 4 * n_parts
+        parts = np.append(data[parts_start:points_start].view('<i4'), n_points)
+        points = data[points_start:points_start + 16 * n_points].view('<f8').reshape(n_points, 2)
+        shapes.append(Shape(record, shape_type, bbox, parts, points))
+    return shapes
+
+
+# Columns of a dBase (.dbf) attribute table as lists, numbers parsed and text stripped
+def read_dbf(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    n_records = int(np.frombuffer(data, '<u4', 1, 4)[0])
+    header_size, record_size = (int(value) for value in np.frombuffer(data, '<u2', 2, 8))
+
+    fields = []
+    position = 32
+    while data[position] != 0x0D:
+        name = data[position:position + 11].split(b'\x00')[0].decode('ascii')
+        fields.append((name, chr(data[position + 11]), data[position + 16]))
+        position += 32
+
+    columns = {name: [] for name, _, _ in fields}
+    for i in range(n_records):
+        record = data[header_size + i * record_size:header_size + (i + 1) * record_size]
+        # The first byte of a record is '*' when it was deleted
+        if record[:1] == b'*':
+            continue
+        position = 1
+        for name, field_type, size in fields:
+            value = record[position:position + size].decode('latin-1').strip()
+            position += size
+            if field_type in 'NF':
+                value = float(value) if value else None
+                value = int(value) if value is not None and value.is_integer() else value
+            columns[name].append(value)
+    return columns
+
+
+# Attribute table next to a .shp file, or None when there is no .dbf
+def read_attributes(path):
+    dbf_path = os.path.splitext(path)[0] + '.dbf'
+    return read_dbf(dbf_path) if os.path.exists(dbf_path) else None
@@ -0,0 +1,34 @@
+from sklearn.svm import SVR, LinearSVR
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.pipeline import make_pipeline
+
+# Hyperparameters of the best SVR model, shared by every engine
+C = 28657
+EPSILON = 1
+
+# 'exact' is libsvm's RBF SVR; 'nystroem' and 'fourier' approximate the RBF kernel with an explicit
+# feature map and fit a linear epsilon-insensitive model on it, which scales linearly with the rows
+SVR_ENGINES = ['exact', 'nystroem', 'fourier']
+
+
+# Building the SVR for an engine; inputs are expected to be StandardScaler-scaled as in SVR.py
+# C, epsilon and gamma default to the best model's values (gamma=None is 'auto'), tuning.py overrides them
+def make_svr(engine='exact', n_features=3, n_components=300, random_state=0, C=C, epsilon=EPSILON, gamma=None):
+    if engine == 'exact':
+        return SVR(kernel='rbf', C=C, epsilon=epsilon, gamma='auto' if gamma is None else gamma)
+
+    # gamma='auto' in the exact SVR means 1 / n_features
+    if gamma is None:
+        gamma = 1.0 / n_features
+    if engine == 'nystroem':
+        feature_map = Nystroem(kernel='rbf', gamma=gamma, n_components=n_components, random_state=random_state)
+    elif engine == 'fourier':
+        feature_map = RBFSampler(gamma=gamma, n_components=n_components, random_state=random_state)
+    else:
+        raise ValueError(f'Unknown SVR engine: {engine} (choose from {", ".join(SVR_ENGINES)})')
+
+    # The squared epsilon-insensitive loss can be solved in the primal, which stays fast at this large C
+    # where the dual coordinate descent of the plain epsilon-insensitive loss barely converges
+    linear_svr = LinearSVR(C=C, epsilon=epsilon, loss='squared_epsilon_insensitive', dual=False,
+                           intercept_scaling=100, max_iter=5000, random_state=random_state)
+    return make_pipeline(feature_map, linear_svr)
@@ -0,0 +1,98 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from crime_data import AGG_DESCRIPTIONS, PREDICTIONS_DIR, load_cube
+from run_log import start_run
+
+# Years the trend lines are fitted on and how many months they are extended by
+FIRST_YEAR = 2015
+LAST_YEAR = 2018
+HORIZON = 12
+
+
+# Least-squares trend line of every series at once, in closed form
+# series: [..., steps]; observed: same shape, False for months with no record
+# Months without a record were missing from the database, so the Optimal_Models notebook fitted each
+# series on its observed months numbered 0..n-1; the same numbering is used here to keep its predictions
+def fit_trends(series, observed=None):
+    series = np.asarray(series, dtype=np.float64)
+    if observed is None:
+        observed = np.ones(series.shape, dtype=bool)
+    weights = observed.astype(np.float64)
+    x = np.cumsum(weights, axis=-1) - 1
+
+    n = weights.sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = (weights * x).sum(axis=-1) / n
+        y_mean = (weights * series).sum(axis=-1) / n
+        dx = (x - x_mean[..., None]) * weights
+        sxx = (dx * dx).sum(axis=-1)
+        sxy = (dx * (series - y_mean[..., None])).sum(axis=-1)
+        # A single observation gives a flat line, as LinearRegression does
+        slope = np.where(sxx > 0, sxy / np.where(sxx > 0, sxx, 1), 0.0)
+    intercept = y_mean - slope * x_mean
+    return slope, intercept, n
+
+
+# Values of the trend lines for the horizon months after each series' last observation
+def extend_trends(slope, intercept, n, horizon=HORIZON):
+    steps = n[..., None] + np.arange(horizon)
+    return intercept[..., None] + slope[..., None] * steps
+
+
+# Forecasting every (area, crime category) series of the cube and laying it out as linear_regression_predictions.csv
+def trend_predictions(cube=None, first_year=FIRST_YEAR, last_year=LAST_YEAR, horizon=HORIZON):
+    cube = cube if cube is not None else load_cube()
+    counts = np.asarray(cube.view(first_year, last_year), dtype=np.float64)
+
+    # [area, year, month, agg_id] -> [area, agg_id, year * month]
+    series = counts.transpose(0, 3, 1, 2).reshape(len(cube.areas), len(cube.agg_ids), -1)
+    slope, intercept, n = fit_trends(series, series > 0)
+    predictions = extend_trends(slope, intercept, n, horizon)
+
+    # Only series with at least one record were fitted by the notebook
+    area_idx, agg_idx = np.nonzero(n > 0)
+    months = np.arange(1, horizon + 1)
+    df = pd.DataFrame({
+        'Area': np.repeat(cube.areas[area_idx], horizon).astype(np.int64),
+        'Year': last_year + 1,
+        'Month': np.tile(months, len(area_idx)),
+        'Agg_id': np.repeat(cube.agg_ids[agg_idx], horizon).astype(np.int64),
+        'Lr_prediction': predictions[area_idx, agg_idx].reshape(-1)
+    })
+    df.insert(4, 'Agg_des', df['Agg_id'].map(AGG_DESCRIPTIONS))
+
+    # Recorded counts of the forecast year, where the cube has them
+    if last_year + 1 in cube.years:
+        year_idx = int(np.searchsorted(cube.years, last_year + 1))
+        month_idx = np.searchsorted(cube.months, df['Month'].values)
+        actual = cube.counts[np.repeat(area_idx, horizon), year_idx, month_idx, np.repeat(agg_idx, horizon)]
+        df['Total_crimes'] = actual.astype(np.int64)
+
+    # Same row order as the notebook: area, then agg_id as text (it was a text column), then month
+    order = np.lexsort((df['Month'].values, df['Agg_id'].astype(str).values, df['Area'].values))
+    return df.iloc[order].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Linear trend forecasts of every area and crime category in one pass')
+    parser.add_argument('--first-year', type=int, default=FIRST_YEAR)
+    parser.add_argument('--last-year', type=int, default=LAST_YEAR)
+    parser.add_argument('--horizon', type=int, default=HORIZON, help='Months forecast after the last year')
+    parser.add_argument('--output', default=os.path.join(PREDICTIONS_DIR, 'linear_regression_predictions.csv'))
+    parser.add_argument('--plots', action='store_true', help='Also render the per-series trend plots')
+    args = parser.parse_args()
+    run = start_run()
+
+    run.begin('fit')
+    predictions_df = trend_predictions(first_year=args.first_year, last_year=args.last_year, horizon=args.horizon)
+    run.begin('write')
+    predictions_df.to_csv(args.output, index=False)
+    print(f'{len(predictions_df)} predictions written to {args.output}')
+
+    run.begin('plot')
+    if args.plots:
+        from plot_renderer import TREND_PLOTS_DIR, render_figures, trend_figures
+        rendered = render_figures(trend_figures(predictions_df, load_cube(), args.first_year, args.last_year))
+        print(f'{len(rendered)} plots written to {TREND_PLOTS_DIR}')
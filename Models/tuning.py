@@ -0,0 +1,259 @@
+import os
+import json
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from crime_data import CACHE_DIR, DATA_DIR, SCRIPTS_DIR, SPLIT_FILES, file_signature, load_split
+from run_log import single_threaded_workers, start_run
+
+try:
+    import optuna
+    from optuna.trial import TrialState
+except ImportError:
+    optuna = None
+
+# Study journals and cached fold splits; the best parameters are written next to the model artefacts
+# (Scripts/Tuning is gitignored, like the other regenerated outputs under Scripts)
+TUNING_CACHE_DIR = os.path.join(CACHE_DIR, 'tuning')
+BEST_PARAMS_DIR = os.path.join(SCRIPTS_DIR, 'Tuning')
+
+TUNABLE_MODELS = ['rf', 'svr', 'ann']
+
+# Feature columns of the training split used by each model script
+FEATURES = {
+    'rf': ['area', 'year', 'month', 'agg_id'],
+    'svr': ['month', 'area', 'agg_id'],
+    'ann': ['month', 'area', 'agg_id']
+}
+
+# Cross-validation settings; every trial of a study is scored on the same folds
+N_FOLDS = 5
+FOLD_SEED = 0
+
+# ANN trials train for at most this many epochs and stop early once the fold's validation loss stalls
+ANN_MAX_EPOCHS = 300
+ANN_PATIENCE = 20
+
+
+# Raising a clear error when the optional optuna dependency is missing
+def _require_optuna():
+    if optuna is None:
+        raise ImportError('Hyperparameter search needs optuna (pip install optuna)')
+
+
+# Fold number of every training row, cached on disk so every worker and every resumed run uses the same splits
+def fold_assignments(n_folds=N_FOLDS, seed=FOLD_SEED, cache_dir=TUNING_CACHE_DIR):
+    train_path = os.path.join(DATA_DIR, SPLIT_FILES['train'])
+    key = hashlib.sha1(json.dumps([file_signature({'train': train_path}), n_folds, seed]).encode()).hexdigest()
+    path = os.path.join(cache_dir, f'folds_{key}.npy')
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+
+    n_rows = len(load_split('train'))
+    folds = np.random.RandomState(seed).permutation(n_rows) % n_folds
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    np.save(f'{path}.{os.getpid()}.npy', folds.astype(np.int8))
+    os.replace(f'{path}.{os.getpid()}.npy', path)
+    return np.load(path, mmap_mode='r')
+
+
+# (train indices, validation indices) for each fold
+def fold_splits(folds):
+    return [(np.flatnonzero(folds != k), np.flatnonzero(folds == k)) for k in range(int(folds.max()) + 1)]
+
+
+# Search spaces around the hand-tuned values in RFRST.py, SVR.py and ANN.py
+def suggest_params(trial, model):
+    if model == 'rf':
+        return {
+            'n_estimators': trial.suggest_int('n_estimators', 100, 2000, log=True),
+            'max_depth': trial.suggest_int('max_depth', 10, 100),
+            'min_samples_split': trial.suggest_int('min_samples_split', 2, 10),
+            'min_samples_leaf': trial.suggest_int('min_samples_leaf', 1, 4),
+            'max_features': trial.suggest_categorical('max_features', [None, 'sqrt', 'log2'])
+        }
+    if model == 'svr':
+        return {
+            'C': trial.suggest_float('C', 1.0, 1e5, log=True),
+            'epsilon': trial.suggest_float('epsilon', 0.01, 5.0, log=True),
+            'gamma': trial.suggest_float('gamma', 1e-3, 10.0, log=True)
+        }
+    if model == 'ann':
+        params = {}
+        for layer in range(1, 4):
+            params[f'units_{layer}'] = trial.suggest_int(f'units_{layer}', 16, 128)
+            params[f'dropout_{layer}'] = trial.suggest_float(f'dropout_{layer}', 0.0, 0.5)
+        params['learning_rate'] = trial.suggest_float('learning_rate', 1e-4, 1e-2, log=True)
+        params['batch_size'] = trial.suggest_int('batch_size', 16, 128, log=True)
+        return params
+    raise ValueError(f'Unknown model: {model} (choose from {", ".join(TUNABLE_MODELS)})')
+
+
+# Fitting one fold of the random forest; n_jobs=1 since the trials themselves run in parallel
+def _fit_predict_rf(params, X_train, y_train, X_val):
+    from sklearn.ensemble import RandomForestRegressor
+    forest = RandomForestRegressor(bootstrap=True, random_state=0, n_jobs=1, **params)
+    return forest.fit(X_train, y_train).predict(X_val)
+
+
+# Fitting one fold of the SVR with the same scaling as SVR.py
+def _fit_predict_svr(params, X_train, y_train, X_val, engine='exact'):
+    from sklearn.preprocessing import StandardScaler
+    from svr_engines import make_svr
+    scaler = StandardScaler()
+    svr = make_svr(engine, n_features=X_train.shape[1], **params)
+    svr.fit(scaler.fit_transform(X_train), y_train)
+    return svr.predict(scaler.transform(X_val))
+
+
+# Fitting one fold of the ANN built by ann_training.build_ann, as ANN.py trains it, scaling features and target as it does
+def _fit_predict_ann(params, X_train, y_train, X_val):
+    import tensorflow as tf
+    from sklearn.preprocessing import MinMaxScaler
+    from ann_training import build_ann
+    from numpy_inference import inverse_scale_counts
+
+    tf.random.set_seed(74)
+    scaler = MinMaxScaler(feature_range=(0, 1))
+    train_scaled = scaler.fit_transform(np.column_stack([X_train, y_train]))
+    val_scaled = scaler.transform(np.column_stack([X_val, np.zeros(len(X_val))]))[:, :-1]
+
+    model = build_ann(ann_params(params), X_train.shape[1])
+
+    # The last 20% of the fold's training rows decide when to stop, as in ANN.py's validation split
+    early_stopping = tf.keras.callbacks.EarlyStopping(patience=ANN_PATIENCE, restore_best_weights=True)
+    model.fit(train_scaled[:, :-1], train_scaled[:, -1], epochs=ANN_MAX_EPOCHS, batch_size=params['batch_size'],
+              validation_split=0.2, callbacks=[early_stopping], verbose=0)
+    return inverse_scale_counts(scaler, model.predict(val_scaled, verbose=0))
+
+
+# The flat parameters of a trial in the layout of ann_training.ANN_PARAMS
+def ann_params(params):
+    return {'units': [params[f'units_{layer}'] for layer in range(1, 4)],
+            'dropout': [params[f'dropout_{layer}'] for layer in range(1, 4)],
+            'learning_rate': params['learning_rate'], 'batch_size': params['batch_size']}
+
+
+FIT_PREDICT = {'rf': _fit_predict_rf, 'svr': _fit_predict_svr, 'ann': _fit_predict_ann}
+
+
+# Cross-validated MSE of one trial, reported after every fold so the pruner can stop bad trials early
+def objective(trial, model, X, y, splits, svr_engine='exact'):
+    params = suggest_params(trial, model)
+    fit_predict = FIT_PREDICT[model]
+    extra = {'engine': svr_engine} if model == 'svr' else {}
+
+    fold_errors = []
+    for step, (train_idx, val_idx) in enumerate(splits):
+        predictions = fit_predict(params, X[train_idx], y[train_idx], X[val_idx], **extra)
+        fold_errors.append(float(np.mean((y[val_idx] - predictions) ** 2)))
+        trial.report(float(np.mean(fold_errors)), step)
+        if trial.should_prune():
+            raise optuna.TrialPruned()
+    return float(np.mean(fold_errors))
+
+
+# Journal file storage by default (safe for several processes on one machine), or any optuna storage URL
+def make_storage(storage):
+    if '://' in storage:
+        return optuna.storages.RDBStorage(storage)
+    try:
+        from optuna.storages.journal import JournalFileBackend
+    except ImportError:  # optuna < 4.0
+        from optuna.storages import JournalFileStorage as JournalFileBackend
+    return optuna.storages.JournalStorage(JournalFileBackend(storage))
+
+
+# Trials are only compared once a few have finished and after at least one full fold
+def _pruner():
+    return optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=1)
+
+
+# One worker process: running trials of the shared study until it holds n_trials finished ones
+def run_worker(model, study_name, storage, n_trials, worker_id, timeout=None, svr_engine='exact',
+               cache_dir=TUNING_CACHE_DIR):
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    train_df = load_split('train')
+    X = train_df[FEATURES[model]].to_numpy(dtype=np.float64)
+    y = train_df['total_crimes'].to_numpy(dtype=np.float64)
+    splits = fold_splits(fold_assignments(cache_dir=cache_dir))
+
+    # Each worker samples with its own seed so parallel workers do not propose the same parameters
+    study = optuna.load_study(study_name=study_name, storage=make_storage(storage),
+                              sampler=optuna.samplers.TPESampler(seed=worker_id), pruner=_pruner())
+    finished = optuna.study.MaxTrialsCallback(n_trials, states=(TrialState.COMPLETE, TrialState.PRUNED))
+    study.optimize(lambda trial: objective(trial, model, X, y, splits, svr_engine),
+                   timeout=timeout, callbacks=[finished])
+    return worker_id
+
+
+# Creating or resuming the study and running its remaining trials across a process pool
+def tune(model, n_trials=100, workers=None, storage=None, study_name=None, timeout=None, svr_engine='exact',
+         cache_dir=TUNING_CACHE_DIR, output_dir=BEST_PARAMS_DIR):
+    _require_optuna()
+    if model not in TUNABLE_MODELS:
+        raise ValueError(f'Unknown model: {model} (choose from {", ".join(TUNABLE_MODELS)})')
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    if study_name is None:
+        study_name = model if model != 'svr' or svr_engine == 'exact' else f'svr_{svr_engine}'
+    if storage is None:
+        storage = os.path.join(cache_dir, f'{study_name}.journal')
+    workers = workers or os.cpu_count()
+
+    study = optuna.create_study(study_name=study_name, storage=make_storage(storage), direction='minimize',
+                                pruner=_pruner(), load_if_exists=True)
+
+    # Trials left running by an interrupted run are failed and queued again with the same parameters
+    # (this assumes no other run is using the study at the same time)
+    for trial in study.get_trials(deepcopy=False, states=(TrialState.RUNNING,)):
+        study.tell(trial.number, state=TrialState.FAIL)
+        study.enqueue_trial(trial.params)
+
+    done = len(study.get_trials(deepcopy=False, states=(TrialState.COMPLETE, TrialState.PRUNED)))
+    print(f'Study {study_name}: {done} of {n_trials} trials already finished, {workers} workers')
+
+    if done < n_trials:
+        # The fold splits are cached before the workers start so they all read the same file
+        fold_assignments(cache_dir=cache_dir)
+        context = multiprocessing.get_context('spawn')
+        # Parallelism comes from the worker processes, so each one keeps its libraries single-threaded
+        with single_threaded_workers(), ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [executor.submit(run_worker, model, study_name, storage, n_trials, worker_id, timeout,
+                                       svr_engine, cache_dir) for worker_id in range(workers)]
+            for future in futures:
+                future.result()
+
+    # A timeout, or trials that were all pruned or failed, can leave the study without a best trial
+    if not study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,)):
+        states = [trial.state.name.lower() for trial in study.get_trials(deepcopy=False)]
+        counts = ', '.join(f'{states.count(state)} {state}' for state in sorted(set(states))) or 'no trials'
+        raise SystemExit(f'Study {study_name}: no completed trials ({counts}), no best parameters written')
+
+    best = {'model': model, 'study': study_name, 'mse': study.best_value, 'params': study.best_params}
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with open(os.path.join(output_dir, f'{study_name}_best_params.json'), 'w') as f:
+        json.dump(best, f, indent=2)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parallel, resumable hyperparameter search for the RF, SVR and ANN models')
+    parser.add_argument('model', choices=TUNABLE_MODELS)
+    parser.add_argument('--trials', type=int, default=100, help='Finished (complete or pruned) trials the study should reach')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: all cores)')
+    parser.add_argument('--storage', help='Journal file path or optuna storage URL such as sqlite:///tuning.db')
+    parser.add_argument('--study-name', help='Study name (default: the model name)')
+    parser.add_argument('--timeout', type=float, help='Seconds after which each worker stops starting new trials')
+    parser.add_argument('--svr-engine', default='exact', help='SVR engine to tune (see svr_engines.py)')
+    args = parser.parse_args()
+    run = start_run()
+
+    run.begin('tune')
+    best = tune(args.model, args.trials, args.workers, args.storage, args.study_name, args.timeout, args.svr_engine)
+    print(json.dumps(best, indent=2))
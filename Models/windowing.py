@@ -0,0 +1,77 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Feature order used by the LSTM scaler (Total_Crimes last, as the target)
+SERIES_FEATURES = ['Month', 'Area', 'Crime_Category', 'Total_Crimes']
+
+
+# Stacking a cube (area x year x month x agg_id) into one monthly sequence per (area, agg_id)
+# Returns an array of shape [series, months, features] with series ordered area-major
+def series_from_cube(counts, areas, months, agg_ids, dtype=np.float32):
+    n_areas, n_years, n_months, n_aggs = counts.shape
+    n_series = n_areas * n_aggs
+    n_steps = n_years * n_months
+
+    series = np.empty((n_series, n_steps, len(SERIES_FEATURES)), dtype=dtype)
+    series[:, :, 0] = np.tile(months, n_years)[None, :]
+    series[:, :, 1] = np.repeat(areas, n_aggs)[:, None]
+    series[:, :, 2] = np.tile(agg_ids, n_areas)[:, None]
+    series[:, :, 3] = np.transpose(counts, (0, 3, 1, 2)).reshape(n_series, n_steps)
+    return series
+
+
+# Applying a fitted MinMaxScaler to the series in place (same result as scaler.transform)
+def scale_series(series, scaler):
+    series *= scaler.scale_
+    series += scaler.min_
+    return series
+
+
+# Series and time index of cube positions, matching the layout of series_from_cube
+def series_positions(area_idx, year_idx, month_idx, agg_idx, n_months, n_aggs):
+    return area_idx * n_aggs + agg_idx, year_idx * n_months + month_idx
+
+
+# Supervised windows over a [series, time, features] array, built as strided views
+# Windows never cross from one (area, agg_id) series into the next
+class SeriesWindows:
+    def __init__(self, series, n_in=1, n_out=1, target=-1):
+        if series.shape[1] < n_in + n_out:
+            raise ValueError(f'Series of {series.shape[1]} steps are too short for n_in={n_in}, n_out={n_out}')
+        self.series = series
+        self.n_in = n_in
+        self.n_out = n_out
+
+        # [series, windows, features, n_in + n_out] view, no data is copied
+        windows = sliding_window_view(series, n_in + n_out, axis=1)
+        self.n_series, self.n_windows = windows.shape[:2]
+
+        # Inputs (t-n_in ... t-1) as [series, windows, timesteps, features]
+        self.inputs = windows[:, :, :, :n_in].transpose(0, 1, 3, 2)
+        # Targets (t ... t+n_out-1) of the target feature as [series, windows, n_out]
+        self.targets = windows[:, :, target, n_in:]
+
+    def __len__(self):
+        return self.n_series * self.n_windows
+
+    # Flat sample index of the window whose first target falls on time_idx of a series
+    def sample_index(self, series_idx, time_idx):
+        window_idx = np.asarray(time_idx) - self.n_in
+        if np.any(window_idx < 0) or np.any(window_idx >= self.n_windows):
+            raise IndexError(f'Not enough history before the requested steps for n_in={self.n_in}')
+        return np.asarray(series_idx) * self.n_windows + window_idx
+
+    # Gathering samples into contiguous [samples, timesteps, features] and [samples, n_out] arrays
+    # Only the requested samples are copied
+    def take(self, sample_idx):
+        series_idx, window_idx = np.divmod(np.asarray(sample_idx), self.n_windows)
+        return self.inputs[series_idx, window_idx], self.targets[series_idx, window_idx]
+
+    # Generating the samples batch by batch, gathered from the strided views only when each batch is needed
+    # Memory stays at one batch whatever n_in, n_out or the number of windows; shuffled anew on every pass
+    def batches(self, sample_idx, batch_size, shuffle=False, rng=None):
+        sample_idx = np.asarray(sample_idx)
+        if shuffle:
+            sample_idx = (rng or np.random.default_rng()).permutation(sample_idx)
+        for start in range(0, len(sample_idx), batch_size):
+            yield self.take(sample_idx[start:start + batch_size])
@@ -120,27 +120,22 @@ class LayerControl {
         // Find the area layer in the map's layer array
         const areasLayer = this.map.getLayers().getArray().find(l => l.get('title') === 'Areas');
         if (areasLayer) {
-            // Set the CQL filter parameter for the layer's source based on selected areas
-            if (selectedAreaFilters.length) {
-                const CQL_FILTER = `(${selectedAreaFilters.map(filter => `prec = '${filter}'`).join(' OR ')})`;
-                areasLayer.getSource().updateParams({ 'CQL_FILTER': CQL_FILTER });
-            } else {
-                areasLayer.getSource().updateParams({ 'CQL_FILTER': null });
-            }
-            areasLayer.getSource().refresh(); // Refresh the layer to apply the new filter
+            // The areas are static geometry, so the selection is applied by the layer's style instead of a CQL filter
+            areasLayer.set('selectedAreas', selectedAreaFilters);
+            areasLayer.getLayers().forEach(layer => layer.changed()); // Redraw every detail level
         }
     }
 
-    // Fetch area names from the GeoServer
+    // Fetch area names from the static area geometry (the coarsest level is enough)
     async fetchAreaNames() {
-        const url = 'http://localhost:8080/geoserver/CrimePrediction/ows?service=WFS&version=1.0.0&request=GetFeature&typeName=CrimePrediction:Areas&outputFormat=application/json';
+        const url = './data/areas_z10.topojson';
         try {
-            const response = await fetch(url); // Fetch the area data from the GeoServer
+            const response = await fetch(url); // Fetch the area geometry written by geometry_export.py
             const data = await response.json(); // Parse the response as JSON
-            // Map the fetched features to area objects with id and name properties
-            return data.features.map(feature => ({
-                id: feature.properties.prec,
-                name: feature.properties.Area
+            // Map the features to area objects with id and name properties
+            return new ol.format.TopoJSON().readFeatures(data).map(feature => ({
+                id: feature.get('prec'),
+                name: feature.get('Area')
             }));
         } catch (error) {
             console.error('Error fetching area names:', error); // Log any errors
@@ -19,6 +19,15 @@ const crimeNames = {
     '1700': 'Violation of Court Order'
 };
 
+// Detail levels of the pre-simplified geometry in ./data, written by Models/geometry_export.py (same list as ZOOM_LEVELS there)
+const geometryZoomLevels = [10, 12, 14, 16];
+
+// Historical crime counts per area, served by Models/history_service.py
+const historyServiceUrl = 'http://localhost:8001/history';
+
+// Per-area totals of the model predictions, served by the same service from Models/prediction_rollup.py
+const predictionServiceUrl = 'http://localhost:8001/predictions';
+
 class GISMap {
     constructor() {
         this.map = this.initMap();
@@ -52,11 +61,13 @@ class GISMap {
         // Configuration for different map layers
         const layersConfig = [
             { title: "Open Street Map", type: "base", url: "https://{a-c}.tile.openstreetmap.org/{z}/{x}/{y}.png" },
-            { title: "Areas", type: "wms", url: "http://localhost:8080/geoserver/CrimePrediction/wms", params: { 'LAYERS': 'CrimePrediction:Areas', 'TILED': true } },
+            { title: "Areas", type: "geometry", name: "areas", style: (feature, group) => this.areaOutlineStyle(feature, group) },
             { title: "Crime", type: "wms", url: "http://localhost:8080/geoserver/CrimePrediction/wms", params: { 'LAYERS': 'CrimePrediction:Crimes', 'TILED': true } },
-            { title: "Local CBD Lines", type: "wms", url: "http://localhost:8080/geoserver/CrimePrediction/wms", params: { 'LAYERS': 'CrimePrediction:Local CBD Lines', 'TILED': true }, visible: false }
+            { title: "Local CBD Lines", type: "geometry", name: "cbd_lines", style: () => this.cbdLineStyle, visible: false }
         ];
 
+        this.cbdLineStyle = new ol.style.Style({ stroke: new ol.style.Stroke({ color: '#3366cc', width: 1 }) });
+
         //Adding each configured layer to the map
         layersConfig.forEach(config => {
             let layer;
@@ -72,6 +83,10 @@ class GISMap {
                     }),
                     visible: config.visible !== undefined ? config.visible : true // Setting visibility based on config, default to true
                 });
+            } else if (config.type === "geometry") {
+                // Static geometry loaded once from ./data instead of being rendered by GeoServer on every pan and zoom
+                layer = this.createGeometryLayer(config.name, config.title, config.style);
+                layer.setVisible(config.visible !== undefined ? config.visible : true);
             }
             this.map.addLayer(layer);
         });
@@ -83,6 +98,33 @@ class GISMap {
         }
     }
 
+    // One vector layer per detail level of a geometry exported by geometry_export.py, grouped under one title
+    // Each level is only drawn, and its file only downloaded, within its own zoom range
+    createGeometryLayer(name, title, style) {
+        const group = new ol.layer.Group({ title: title });
+        const layers = geometryZoomLevels.map((zoom, i) => new ol.layer.Vector({
+            source: new ol.source.Vector({ url: `./data/${name}_z${zoom}.topojson`, format: new ol.format.TopoJSON() }),
+            style: feature => style(feature, group),
+            minZoom: i > 0 ? geometryZoomLevels[i - 1] : undefined, // Exclusive
+            maxZoom: i < geometryZoomLevels.length - 1 ? zoom : undefined, // Inclusive
+            displayInLayerSwitcher: false
+        }));
+        group.setLayers(new ol.Collection(layers));
+        return group;
+    }
+
+    // Outline of an area, hidden when the area filter leaves it out
+    areaOutlineStyle(feature, group) {
+        const selectedAreas = group.get('selectedAreas') || [];
+        if (selectedAreas.length && !selectedAreas.includes(String(feature.get('prec')))) {
+            return null;
+        }
+        return new ol.style.Style({
+            fill: new ol.style.Fill({ color: 'rgba(255, 255, 255, 0.1)' }),
+            stroke: new ol.style.Stroke({ color: '#333', width: 1.5 })
+        });
+    }
+
     // Initialising map controls
     initControls() {
         // Layer switcher control to toggle layers
@@ -250,20 +292,14 @@ class GISMap {
     
         this.generateLegend(quantiles, colorRamp, layerTitle, legendId, filterDetails);
     
-        const source = new ol.source.Vector({
-            url: 'http://localhost:8080/geoserver/CrimePrediction/wfs?service=WFS&version=1.1.0&request=GetFeature&typeName=CrimePrediction:Areas&outputFormat=application/json',
-            format: new ol.format.GeoJSON()
-        });
-    
         // Remove existing heatmap layer if it exists
         const existingLayer = this.map.getLayers().getArray().find(l => l.get('title') === layerTitle);
         if (existingLayer) {
             this.map.removeLayer(existingLayer);
         }
     
-        const newLayer = new ol.layer.Vector({
-            source: source,
-            style: feature => {
+        // The area boundaries come from the static multi-resolution geometry, not a full-resolution WFS request
+        const newLayer = this.createGeometryLayer('areas', layerTitle, feature => {
                 const area = feature.get('prec');
                 const count = crimeCounts[area] || 0;
                 const areaName = feature.get('Area');
@@ -286,10 +322,8 @@ class GISMap {
                     fill: new ol.style.Fill({ color: color }), // Fill color based on crime count
                     stroke: new ol.style.Stroke({ color: '#333', width: 1 }) // Stroke style
                 });
-            }
         });
     
-        newLayer.set('title', layerTitle); // Set layer title
         this.map.addLayer(newLayer); // Add new layer to the map
     }    
 
@@ -363,7 +397,8 @@ class GISMap {
         document.getElementById('predicted-legend').style.display = 'none';
     }
 
-    // Fetch and aggregate prediction data for the predictions heatmap
+    // Fetch the predicted crime counts per area for the predictions heatmap from the history service, which answers
+    // from the prediction rollup (Models/prediction_rollup.py) instead of sending every LSTM_Predictions feature
     async fetchAndAggregatePredictionData() {
         const monthFilter = document.getElementById('month-filter').value; // Get selected month filter
         const crimeTypeFilters = [];
@@ -371,126 +406,69 @@ class GISMap {
             crimeTypeFilters.push(checkbox.value); // Get selected crime type filters
         });
 
-        const cqlFilter = [];
+        const params = new URLSearchParams({ model: 'lstm' });
         if (monthFilter) {
-            cqlFilter.push(`month=${monthFilter}`); // Add month filter to CQL filter
+            params.set('month', monthFilter);
         }
         if (crimeTypeFilters.length > 0) {
-            cqlFilter.push(`(${crimeTypeFilters.map(id => `agg_id='${id}'`).join(' OR ')})`);  // Add crime type filters to CQL filter
+            params.set('agg_id', crimeTypeFilters.join(','));
         }
-
-        const cqlFilterString = cqlFilter.length > 0 ? `&CQL_FILTER=${encodeURIComponent(cqlFilter.join(' AND '))}` : '';
-        const url = `http://localhost:8080/geoserver/CrimePrediction/wfs?service=WFS&version=1.1.0&request=GetFeature&typeName=CrimePrediction:LSTM_Predictions&outputFormat=application/json${cqlFilterString}`;
+        const url = `${predictionServiceUrl}?${params}`;
 
         try {
-            const response = await fetch(url);
-            const text = await response.text();
-
-            // Check if the response is JSON or XML
-            if (text.startsWith('<')) {
-                console.error('Server returned an error:', text);
+            const response = await fetch(url, { cache: 'no-cache' });
+            const data = await response.json();
+            if (!response.ok) {
+                console.error('Server returned an error:', data.error);
                 alert('Error fetching prediction data. Please check the server response.');
                 return;
             }
 
-            const data = JSON.parse(text);
-            const features = new ol.format.GeoJSON().readFeatures(data);
-            const crimeCounts = {};
-
-            features.forEach(feature => {
-                const area = feature.get('area');
-                const totalCrimes = Math.round(feature.get('total_crimes'));
-                const aggId = feature.get('agg_id');
-                const month = feature.get('month');
-
-                // Log and aggregate the total crimes for all or selected crime categories
-                if (crimeTypeFilters.length === 0 || crimeTypeFilters.includes(aggId.toString())) {
-                    console.log(`Area ID: ${area}, Total Crimes: ${totalCrimes}, Crime Category: ${aggId}, Month: ${month}`);
-
-                    if (!crimeCounts[area]) {
-                        crimeCounts[area] = 0;
-                    }
-                    crimeCounts[area] += totalCrimes;
-                }
-            });
-
-            return crimeCounts;
+            console.log('Predicted crime counts:', data.counts);
+            return data.counts;
         } catch (error) {
-            console.error('Error fetching and aggregating prediction data:', error);
+            console.error('Error fetching prediction data:', error);
             alert('Error fetching prediction data. Please check the console for more details.');
         }
     }
 
-    // Fetch and aggregate prediction data for the historical data heatmap
+    // Fetch the historical crime counts per area for the heatmap from the history service (Models/history_service.py)
+    // The service answers from a precomputed count index, so only the 21 area totals are transferred; it sends an ETag,
+    // and the browser revalidates repeated filters with If-None-Match instead of downloading them again
     async fetchAndAggregateCrimeData() {
-        console.log('Fetching and aggregating crime data...');
-        const crimeLayer = this.map.getLayers().getArray().find(l => l.get('title') === 'Crime');
-        if (!crimeLayer) {
-            console.error('Crime layer not found');
-            return;
-        }
-    
+        console.log('Fetching historical crime counts...');
         const yearFilter = document.getElementById('year-filter').value; // Get selected year filter
         const monthFilter = document.getElementById('month-filter').value; // Get selected month filter
         const crimeTypeFilters = [];
         document.querySelectorAll('#filter-options input[type="checkbox"]:checked').forEach(checkbox => {
-            crimeTypeFilters.push(`agg_id='${checkbox.value}'`); // Get selected crime type filters
+            crimeTypeFilters.push(checkbox.value); // Get selected crime type filters
         });
     
-        const cqlFilter = [];
+        const params = new URLSearchParams();
         if (yearFilter) {
-            cqlFilter.push(`year=${yearFilter}`);  // Add year filter to CQL filter
+            params.set('year', yearFilter);
         }
         if (monthFilter) {
-            cqlFilter.push(`month=${monthFilter}`); // Add month filter to CQL filter
+            params.set('month', monthFilter);
         }
         if (crimeTypeFilters.length > 0) {
-            cqlFilter.push(`(${crimeTypeFilters.join(' OR ')})`); // Add crime type filters to CQL filter
+            params.set('agg_id', crimeTypeFilters.join(','));
         }
-    
-        const cqlFilterString = cqlFilter.length > 0 ? `&CQL_FILTER=${encodeURIComponent(cqlFilter.join(' AND '))}` : '';
-        const url = `http://localhost:8080/geoserver/CrimePrediction/wfs?service=WFS&version=1.1.0&request=GetFeature&typeName=CrimePrediction:Crimes&outputFormat=application/json${cqlFilterString}`;
-    
-        console.log('CQL Filter:', cqlFilterString);
+        const url = `${historyServiceUrl}?${params}`;
         console.log('Fetch URL:', url);
     
         try {
-            const response = await fetch(url);
-            const text = await response.text();
-    
-            // Check if the response is JSON or XML
-            if (text.startsWith('<')) {
-                console.error('Server returned an error:', text);
+            const response = await fetch(url, { cache: 'no-cache' });
+            const data = await response.json();
+            if (!response.ok) {
+                console.error('Server returned an error:', data.error);
                 return;
             }
     
-            const data = JSON.parse(text);
-            console.log('Data fetched:', data);
-    
-            const features = new ol.format.GeoJSON().readFeatures(data);
-            const crimeCounts = {};
-    
-            features.forEach(feature => {
-                const area = feature.get('area');
-                const totalCrimes = 1;
-                const aggId = feature.get('agg_id');
-                const month = feature.get('month');
-    
-                // Log and aggregate the total crimes for all or selected crime categories
-                if (crimeTypeFilters.length === 0 || crimeTypeFilters.includes(`agg_id='${aggId}'`)) {
-                    console.log(`Area ID: ${area}, Total Crimes: ${totalCrimes}, Crime Category: ${aggId}, Month: ${month}`);
-    
-                    if (!crimeCounts[area]) {
-                        crimeCounts[area] = 0;
-                    }
-                    crimeCounts[area] += totalCrimes;
-                }
-            });
-    
-            console.log('Crime counts:', crimeCounts);
-            return crimeCounts;
+            console.log('Crime counts:', data.counts);
+            return data.counts;
         } catch (error) {
-            console.error('Error fetching and aggregating crime data:', error);
+            console.error('Error fetching historical crime counts:', error);
         }
     }    
 